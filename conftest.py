@@ -0,0 +1,55 @@
+"""
+Regression tolerance and setup of the performance benchmarks (src/test_benchmarks.py).
+
+Comparing a benchmark run against the latest baseline saved under `.benchmarks/`
+
+    pytest src/test_benchmarks.py -m benchmark --benchmark-compare
+
+fails when a benchmark regresses beyond the `benchmark_compare_fail` tolerance of
+`[tool.pytest.ini_options]` in pyproject.toml. An explicit `--benchmark-compare-fail`
+on the command line takes precedence. Runs without `--benchmark-compare` (and runs
+without pytest-benchmark installed) are not affected.
+
+Tests marked `benchmark` run with the stage instrumentation and profiling turned off
+(PIPELINE_INSTRUMENT=False, no PIPELINE_PROFILE stages), so the baselines time the hot
+paths and not psutil or tracemalloc around the `@instrumented` functions.
+
+This lives in the project root so it is loaded before pytest-benchmark reads its
+options.
+"""
+
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addini(
+        "benchmark_compare_fail",
+        type="args",
+        default=[],
+        help="Regression checks applied with --benchmark-compare, e.g. mean:15%",
+    )
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    option = config.option
+    if not getattr(option, "benchmark_compare", None):
+        return
+    if getattr(option, "benchmark_compare_fail", None):
+        return
+    from pytest_benchmark.utils import parse_compare_fail
+
+    option.benchmark_compare_fail = [
+        parse_compare_fail(check) for check in config.getini("benchmark_compare_fail")
+    ]
+
+
+@pytest.fixture(autouse=True)
+def uninstrumented_benchmarks(request, monkeypatch):
+    if request.node.get_closest_marker("benchmark") is None:
+        return
+    import instrumentation
+    import profiling
+
+    monkeypatch.setattr(instrumentation, "PIPELINE_INSTRUMENT", False)
+    monkeypatch.setattr(profiling, "PROFILED_STAGES", frozenset())
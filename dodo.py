@@ -147,15 +147,24 @@ def task_SF_proxy_analysis():
         "./src/pull_optionm_api_data.py",
         "./src/clean_bloomberg.py",
         "./src/equity_spot_futures_arb_analysis.py",
-        "./src/compute_calendar_spread_OIS3M.py"
+        "./src/compute_calendar_spread_OIS3M.py",
+        "./src/summary_tables.py",
+        "./src/results_store.py",
+        "./src/arrow_cache.py",
     ]
     targets = [
         str(OUTPUT_DIR / "equity_index_spread_plot_full_replication.pdf"),
         str(OUTPUT_DIR / "equity_index_spread_plot_proxy_replication.pdf"),
         str(OUTPUT_DIR / "equity_index_spread_plot_full_update.pdf"),
-        str(OUTPUT_DIR / "table_full_replication.pdf"),
-        str(OUTPUT_DIR / "table_proxy_replication.pdf"),
+        str(OUTPUT_DIR / "equity_index_spread_plot_proxy_update.pdf"),
+        str(OUTPUT_DIR / "table_full_update.tex"),
+        str(OUTPUT_DIR / "table_full_replication.tex"),
+        str(OUTPUT_DIR / "table_proxy_update.tex"),
+        str(OUTPUT_DIR / "table_proxy_replication.tex"),
         str(OUTPUT_DIR / "yearly_comparison.pdf"),
+        str(OUTPUT_DIR / "results.sqlite"),
+        str(OUTPUT_DIR / "calendar_spread_df.arrow"),
+        str(OUTPUT_DIR / "total_df.arrow"),
     ]
 
     return {
@@ -170,38 +179,101 @@ def task_SF_proxy_analysis():
     }
 
 
+def task_rate_variants():
+    """Calendar spreads of every rate variant (3M OIS, interpolated OIS) in one pass"""
+    file_dep = [
+        "./src/settings.py",
+        "./src/calendar_spread.py",
+        "./src/normalize_bloomberg.py",
+        "./src/spread_kernels.py",
+        "./src/compute_calendar_spread_variants.py",
+        "./src/summary_tables.py",
+        "./src/arrow_cache.py",
+    ]
+    targets = [
+        str(OUTPUT_DIR / "calendar_spread_variants.parquet"),
+        str(OUTPUT_DIR / "calendar_spread_variants.arrow"),
+        str(OUTPUT_DIR / "table_rate_variants_update.tex"),
+        str(OUTPUT_DIR / "table_rate_variants_replication.tex"),
+    ]
+
+    return {
+        "actions": ["ipython ./src/compute_calendar_spread_variants.py"],
+        "targets": targets,
+        "file_dep": file_dep,
+        "clean": [f"del {target}" for target in targets],
+    }
+
+
+def task_bootstrap_spreads():
+    """Block-bootstrap confidence intervals for the mean/median arbitrage spreads"""
+    file_dep = [
+        "./src/settings.py",
+        "./src/spread_bootstrap.py",
+        "./src/arrow_cache.py",
+        str(OUTPUT_DIR / "calendar_spread_df.parquet"),
+        str(OUTPUT_DIR / "total_df.parquet"),
+    ]
+    targets = [str(OUTPUT_DIR / "bootstrap_ci.csv")]
+
+    return {
+        "actions": ["ipython ./src/spread_bootstrap.py"],
+        "targets": targets,
+        "file_dep": file_dep,
+        "clean": [f"del {target}" for target in targets],
+    }
+
+
 # Define paths
 TEX_FILE = OUTPUT_DIR / "graph_document.tex"
 PDF_FILE = OUTPUT_DIR / "graph_document.pdf"
 TXT_FILE = OUTPUT_DIR / "graph_document.txt"
 
 def task_latex_documents():
-    """Creates the LaTeX documents for the SF project and converts to PDF & TXT."""
-    
+    """Creates the LaTeX document for the SF project from the pipeline outputs.
+
+    pandas_to_latex.py only rewrites the .tex file when its content changes, so
+    the compile task below is skipped when nothing in the report changed.
+    """
+    from pandas_to_latex import report_dependencies
+
     file_dep = [
         "./src/settings.py",
-        "./src/pull_optionm_api_data.py",
-        "./src/clean_bloomberg.py",
-        "./src/equity_spot_futures_arb_analysis.py",
-        "./src/compute_calendar_spread_OIS3M.py",
-        "./src/pandas_to_latex.py"
+        "./src/pandas_to_latex.py",
+        *[str(path) for path in report_dependencies()],
     ]
-    
+
+    return {
+        "actions": [
+            "ipython ./src/pandas_to_latex.py",  # Generate LaTeX file
+        ],
+        "targets": [str(TEX_FILE)],
+        "file_dep": file_dep,
+        "clean": [f"del {TEX_FILE}"],
+    }
+
+
+def task_latex_pdf():
+    """Converts the LaTeX document to PDF & TXT. Only reruns pdflatex when the
+    .tex file or one of the included figures/tables changed."""
+    from pandas_to_latex import report_dependencies
+
+    file_dep = [str(TEX_FILE), *[str(path) for path in report_dependencies()]]
+
     # Determine the TXT conversion command based on OS type
-    if "OS_TYPE" == "windows":
+    if OS_TYPE == "windows":
         txt_conversion_cmd = f"type {TEX_FILE} > {TXT_FILE}"
     else:
         txt_conversion_cmd = f"cat {TEX_FILE} > {TXT_FILE}"
-    
+
     return {
         "actions": [
-            "ipython ./src/pandas_to_latex.py",  # Generate LaTeX file
             f"pdflatex -interaction=nonstopmode -shell-escape -output-directory={OUTPUT_DIR} {TEX_FILE}",  # Compile to PDF
             txt_conversion_cmd  # Convert to TXT using OS-specific command
         ],
-        "targets": [str(TEX_FILE), str(PDF_FILE), str(TXT_FILE)],
+        "targets": [str(PDF_FILE), str(TXT_FILE)],
         "file_dep": file_dep,
-        "clean": [f"del {TEX_FILE}", f"del {PDF_FILE}", f"del {TXT_FILE}"],
+        "clean": [f"del {PDF_FILE}", f"del {TXT_FILE}"],
     }
 
 
@@ -0,0 +1,109 @@
+"""
+Memory-mapped Arrow IPC copies of the pipeline outputs.
+
+Next to each output parquet file (`calendar_spread_df.parquet`, `total_df.parquet`)
+the pipeline publishes an uncompressed Arrow IPC file (`calendar_spread_df.arrow`).
+Opened with a memory map, its columns point straight into the page cache: there is
+nothing to decompress or decode, and concurrent processes share the same pages.
+
+    table = load_table("calendar_spread_df")  # zero-copy pyarrow Table
+    df = load_frame("calendar_spread_df", columns=["SPX_arb_spread"])
+
+The Arrow file records the size and modification time of the parquet file it was
+published from. The loaders fall back to the parquet file when the Arrow file is
+missing or the parquet file has changed since (e.g. written by an older version of
+the pipeline).
+"""
+
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from settings import config
+
+OUTPUT_DIR = config("OUTPUT_DIR")
+
+_SOURCE_KEY = b"arrow_cache.source"
+
+
+def _source_stamp(parquet_path):
+    stat = os.stat(parquet_path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}".encode()
+
+
+def _paths(name):
+    """Parquet and Arrow paths of an output name or parquet path."""
+    parquet_path = OUTPUT_DIR / f"{name}.parquet" if isinstance(name, str) else name
+    return parquet_path, parquet_path.with_suffix(".arrow")
+
+
+def publish(df, name):
+    """
+    Writes the Arrow copy of an output after its parquet file has been written.
+
+    Parameters:
+    - df (DataFrame): The frame written to the parquet file
+    - name (str or Path): Output name in OUTPUT_DIR (e.g. "calendar_spread_df") or
+      path of the parquet file
+
+    Returns:
+    - Path of the Arrow file.
+    """
+    parquet_path, arrow_path = _paths(name)
+    table = pa.Table.from_pandas(df)
+    metadata = {
+        **(table.schema.metadata or {}),
+        _SOURCE_KEY: _source_stamp(parquet_path),
+    }
+    table = table.replace_schema_metadata(metadata)
+    # Write to a temporary file so readers never map a partial file
+    tmp_path = arrow_path.with_suffix(".arrow.tmp")
+    with pa.OSFile(str(tmp_path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, arrow_path)
+    return arrow_path
+
+
+def _mapped_table(parquet_path, arrow_path):
+    """Memory-mapped Arrow table, or None when missing or stale."""
+    if not arrow_path.exists():
+        return None
+    table = pa.ipc.open_file(pa.memory_map(str(arrow_path))).read_all()
+    metadata = table.schema.metadata or {}
+    if parquet_path.exists() and metadata.get(_SOURCE_KEY) != _source_stamp(
+        parquet_path
+    ):
+        return None
+    return table
+
+
+def load_table(name, columns=None):
+    """
+    Reads an output as a pyarrow Table, memory-mapped when its Arrow copy is current.
+
+    Parameters:
+    - name (str or Path): Output name in OUTPUT_DIR or path of the parquet file
+    - columns (list): Columns to read. Defaults to all; the index is always read.
+
+    Returns:
+    - pyarrow Table
+    """
+    parquet_path, arrow_path = _paths(name)
+    table = _mapped_table(parquet_path, arrow_path)
+    if table is None:
+        return pq.read_table(parquet_path, columns=columns, use_pandas_metadata=True)
+    if columns is not None:
+        index_columns = [
+            col
+            for col in table.schema.pandas_metadata.get("index_columns", [])
+            if isinstance(col, str)
+        ]
+        table = table.select([*columns, *index_columns])
+    return table
+
+
+def load_frame(name, columns=None):
+    """Reads an output as a DataFrame, see `load_table`."""
+    return load_table(name, columns).to_pandas()
@@ -0,0 +1,440 @@
+"""
+Calendar-spread pipeline for the equity spot-futures arbitrage spread (Bloomberg data).
+
+The stages are the ones of `compute_calendar_spread_OIS3M.py`: load the raw Bloomberg
+pull, rename the spot/futures/OIS fields, compute time to maturity from the contract
+strings, the perfect foresight dividends by contract group, the implied forward rate
+against the OIS rate and finally the rolling outlier filter.
+
+The rate used for compounding and as the benchmark is a rate variant (RATE_VARIANTS):
+the flat 3M OIS of `compute_calendar_spread_OIS3M.py` or the OIS curve interpolated at
+each leg's maturity of `compute_calendar_spread_OIS_INTERP.py`. Only the forward and
+outlier stages depend on it, so `compute_rate_variants` runs the load, TTM and dividend
+stages once and evaluates every variant against them.
+
+`compute_calendar_spread` runs either this pandas implementation or the polars
+`LazyFrame` implementation in `calendar_spread_polars.py`, selected with `backend`
+(defaults to the `SPREAD_BACKEND` setting).
+"""
+
+import calendar
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import instrumented
+from normalize_bloomberg import load_normalized, normalize_raw
+from settings import config
+from spread_kernels import KERNEL_OUTPUTS, forward_spread
+
+SPREAD_BACKEND = config("SPREAD_BACKEND")
+
+# Bloomberg tickers used for each index: spot, nearby future and first deferred future
+INDEX_TICKERS = {
+    "SPX": {"spot": "SPX Index", "near": "ES1 Index", "deferred": "ES2 Index"},
+    "NDX": {"spot": "NDX Index", "near": "NQ1 Index", "deferred": "NQ2 Index"},
+    "DJI": {"spot": "INDU Index", "near": "DM1 Index", "deferred": "DM2 Index"},
+}
+OIS_3M_TICKER = "USSOC CMPN Curncy"
+# OIS tenors used for the interpolated rate curve: column -> (Bloomberg ticker, days)
+OIS_TENORS = {
+    "OIS_1W": ("USSO1Z CMPN Curncy", 7),
+    "OIS_1M": ("USSOA CMPN Curncy", 30),
+    "OIS_3M": (OIS_3M_TICKER, 90),
+    "OIS_6M": ("USSOF CMPN Curncy", 180),
+    "OIS_1Y": ("USSO1 CMPN Curncy", 360),
+}
+# Rates used for compounding and as the benchmark: the flat 3M OIS for both legs or the
+# OIS curve interpolated at the maturity of each leg
+RATE_VARIANTS = ("OIS_3M", "OIS_INTERP")
+
+# Rolling outlier rule: drop observations whose deviation from the centered rolling
+# median is at least OUTLIER_THRESHOLD times the rolling mean absolute deviation
+OUTLIER_WINDOW = "45D"
+OUTLIER_THRESHOLD = 5
+
+
+# =============================================================================
+# 1. Load and Prepare Data
+# =============================================================================
+@instrumented("load")
+def load_bloomberg_data(file_path):
+    """
+    Loads the raw Bloomberg pull normalised by `normalize_bloomberg`: fields named
+    "ticker field" strings, e.g. "SPX Index PX_LAST", with the declared dtypes.
+    """
+    return load_normalized(file_path)
+
+
+@instrumented("prepare")
+def prepare_merged_df(df, indices=INDEX_TICKERS, ois_columns=("OIS_3M",)):
+    """
+    Extracts and renames the spot, dividend, futures, contract and OIS fields
+    (e.g. "ES1 Index PX_LAST" -> "SPX_F1") and drops rows missing essential data.
+    `df` is the normalised raw data (see `normalize_bloomberg`), so the fields are
+    already numeric, ".NA." contracts missing and missing dividends 0 (as in Stata).
+    `ois_columns` lists the OIS tenors to keep (see OIS_TENORS), in decimals.
+    """
+    # --- Extract Spot Data ---
+    spot_cols = {}
+    for idx, tickers in indices.items():
+        spot_cols[f"{tickers['spot']} PX_LAST"] = f"{idx}_Spot"
+        spot_cols[f"{tickers['spot']} INDX_GROSS_DAILY_DIV"] = f"{idx}_Div"
+    spot_df = df[list(spot_cols)].rename(columns=spot_cols)
+
+    # --- Extract Futures Data ---
+    futures_cols = {}
+    for idx, tickers in indices.items():
+        futures_cols[f"{tickers['near']} PX_LAST"] = f"{idx}_F1"
+        futures_cols[f"{tickers['deferred']} PX_LAST"] = f"{idx}_F2"
+        futures_cols[f"{tickers['near']} CURRENT_CONTRACT_MONTH_YR"] = f"{idx}_Contract"
+        futures_cols[f"{tickers['deferred']} CURRENT_CONTRACT_MONTH_YR"] = (
+            f"{idx}_Contract2"
+        )
+    futures_df = df[list(futures_cols)].rename(columns=futures_cols)
+
+    # --- Extract OIS Data ---
+    ois_series = []
+    for col in ois_columns:
+        ticker, _ = OIS_TENORS[col]
+        ois_series.append((df[f"{ticker} PX_LAST"] / 100).rename(col))
+
+    merged_df = pd.concat([spot_df, futures_df, *ois_series], axis=1)
+    # Drop rows missing essential data
+    first_idx = next(iter(indices))
+    essential = [f"{first_idx}_Spot"]
+    essential += [f"{idx}_{f}" for idx in indices for f in ["F1", "F2"]]
+    essential += [f"{idx}_{c}" for idx in indices for c in ["Contract", "Contract2"]]
+    return merged_df.dropna(subset=essential)
+
+
+# =============================================================================
+# 2. Define Perfect Foresight Dividend Function
+# =============================================================================
+def compute_expected_dividend(df, div_col, contract_col):
+    """
+    For a given index, computes the perfect foresight dividend series.
+
+    Even though we use the same dividend field (gross daily dividend in dollars),
+    grouping by the contract indicator resets the cumulative dividend at each rollover.
+
+    - daily_div: Uses the gross dividend field directly.
+    - cum_div: Cumulative sum of daily dividends within each contract period.
+    - total_div: Total dividend expected over the contract period.
+    - exp_tau1: Expected dividend remaining in the current contract = total_div - cum_div.
+    - exp_tau2: Expected dividend until the next contract = exp_tau1 plus the full dividend of the next contract.
+
+    Returns:
+      (exp_tau1, exp_tau2, daily_div) as Series.
+    """
+    daily_div = df[div_col]
+    cum_div = daily_div.groupby(df[contract_col]).cumsum()
+    total_div = daily_div.groupby(df[contract_col]).transform("sum")
+    exp_tau1 = total_div - cum_div
+    unique_contracts = df[contract_col].unique()
+    sorted_contracts = sorted(unique_contracts)
+    contract_total_map = df.groupby(contract_col)[div_col].apply(lambda x: x.sum())
+    next_div = df[contract_col].map(
+        {
+            c: (
+                contract_total_map[sorted_contracts[i + 1]]
+                if i < len(sorted_contracts) - 1
+                else 0
+            )
+            for i, c in enumerate(sorted_contracts)
+        }
+    )
+    exp_tau2 = exp_tau1 + next_div
+    return exp_tau1, exp_tau2, daily_div, total_div
+
+
+# =============================================================================
+# 3. Define Helper Function: Convert Contract String to Maturity Date
+# =============================================================================
+def contract_to_maturity(contract_str):
+    """
+    Converts a contract string (e.g., "DEC2023", "DEC23", or "DEC 10") to a maturity date.
+    Assumes the maturity is the third Friday of the specified month.
+    """
+    month_map = {
+        "JAN": 1,
+        "FEB": 2,
+        "MAR": 3,
+        "APR": 4,
+        "MAY": 5,
+        "JUN": 6,
+        "JUL": 7,
+        "AUG": 8,
+        "SEP": 9,
+        "OCT": 10,
+        "NOV": 11,
+        "DEC": 12,
+    }
+    contract_str = str(contract_str).strip().upper()
+    if len(contract_str) < 5:
+        return pd.NaT
+    month_str = contract_str[:3]
+    year_str = contract_str[3:].replace(" ", "")
+    month = month_map.get(month_str, None)
+    if month is None:
+        return pd.NaT
+    try:
+        year = int(year_str) if len(year_str) == 4 else int("20" + year_str)
+    except ValueError:
+        return pd.NaT
+    cal = calendar.Calendar(firstweekday=calendar.MONDAY)
+    fridays = [
+        day
+        for day in cal.itermonthdates(year, month)
+        if day.month == month and day.weekday() == 4
+    ]
+    if len(fridays) >= 3:
+        return pd.Timestamp(fridays[2])
+    else:
+        return pd.Timestamp(fridays[-1])
+
+
+# =============================================================================
+# 4. Compute Time-to-Maturity (TTM) Using Separate Contract Fields for Each Index
+# =============================================================================
+@instrumented("time_to_maturity")
+def add_time_to_maturity(merged_df, indices=INDEX_TICKERS):
+    """
+    Adds the days to maturity of the nearby (`{idx}_TTM1`) and deferred (`{idx}_TTM2`)
+    contracts and drops rows where TTM cannot be computed.
+    """
+    merged_df = merged_df.copy()
+    for idx in indices:
+        merged_df[f"{idx}_TTM1"] = merged_df.apply(
+            lambda row: (contract_to_maturity(row[f"{idx}_Contract"]) - row.name).days,
+            axis=1,
+        )
+        merged_df[f"{idx}_TTM2"] = merged_df.apply(
+            lambda row: (contract_to_maturity(row[f"{idx}_Contract2"]) - row.name).days,
+            axis=1,
+        )
+
+    # Drop rows where TTM cannot be computed (i.e., no next contract available)
+    for idx in indices:
+        merged_df = merged_df.dropna(subset=[f"{idx}_TTM2", f"{idx}_TTM1"])
+    return merged_df
+
+
+# =============================================================================
+# 5. Compute Perfect Foresight Dividends for All Indexes Using Separate Contract Fields
+# =============================================================================
+@instrumented("dividends")
+def add_expected_dividends(merged_df, indices=INDEX_TICKERS):
+    """Adds the perfect foresight dividends `{idx}_exp_tau1` and `{idx}_exp_tau2`."""
+    merged_df = merged_df.copy()
+    for idx in indices:
+        # Compute τ₁ using the primary contract field
+        exp_tau1, _, daily_div, _ = compute_expected_dividend(
+            merged_df, div_col=f"{idx}_Div", contract_col=f"{idx}_Contract"
+        )
+        # Compute τ₂ using the deferred contract field (i.e. the next contract)
+        # We ignore the τ₁ output from this call because we want τ₂ to come entirely from the deferred contract grouping.
+        _, exp_tau2, _, total_div = compute_expected_dividend(
+            merged_df, div_col=f"{idx}_Div", contract_col=f"{idx}_Contract2"
+        )
+        merged_df[f"{idx}_exp_tau1"] = exp_tau1
+        merged_df[f"{idx}_exp_tau2"] = exp_tau1 + total_div
+        merged_df[f"{idx}_daily_div"] = daily_div
+    return merged_df
+
+
+@instrumented("rate_interpolation")
+def interpolate_ois_rates(ttm, ois_df):
+    """
+    Vectorized linear interpolation of the OIS curve at `ttm` days, as in
+    `interpolate_ois` of `compute_calendar_spread_OIS_INTERP.py`: flat at the 1W rate
+    up to 7 days, linear between the 1W, 1M, 3M, 6M and 1Y tenors and NaN beyond 360
+    days.
+
+    Parameters:
+    - ttm (array-like): Days to maturity, one per row of `ois_df`
+    - ois_df (DataFrame): The OIS_1W, OIS_1M, OIS_3M, OIS_6M and OIS_1Y columns
+
+    Returns:
+    - ndarray of interpolated rates.
+    """
+    ttm = np.asarray(ttm, dtype=np.float64)
+    knots = np.array([days for _, days in OIS_TENORS.values()], dtype=np.float64)
+    rates = ois_df[list(OIS_TENORS)].to_numpy(dtype=np.float64)
+    rows = np.arange(len(ttm))
+    # Segment j covers (knots[j - 1], knots[j]]
+    upper = np.clip(np.searchsorted(knots, ttm, side="left"), 1, len(knots) - 1)
+    lower = upper - 1
+    width = knots[upper] - knots[lower]
+    result = ((knots[upper] - ttm) / width) * rates[rows, lower] + (
+        (ttm - knots[lower]) / width
+    ) * rates[rows, upper]
+    result = np.where(ttm <= knots[0], rates[:, 0], result)
+    return np.where(ttm > knots[-1], np.nan, result)
+
+
+def leg_rates(merged_df, idx, rate="OIS_3M"):
+    """
+    Rates of the nearby and deferred leg of index `idx` for a rate variant: the
+    `rate` column for both legs, or for "OIS_INTERP" the OIS curve interpolated at
+    TTM1 and TTM2 (needs all the OIS_TENORS columns).
+
+    Returns:
+    - (rate1, rate2) ndarrays, in decimals.
+    """
+    if rate == "OIS_INTERP":
+        return (
+            interpolate_ois_rates(merged_df[f"{idx}_TTM1"], merged_df),
+            interpolate_ois_rates(merged_df[f"{idx}_TTM2"], merged_df),
+        )
+    flat = merged_df[rate].to_numpy(dtype=np.float64)
+    return flat, flat
+
+
+# =============================================================================
+# 6. Compute Compounded Dividends, Implied Forward Rates, and Annualize
+# =============================================================================
+@instrumented("forwards")
+def add_forward_spreads(merged_df, indices=INDEX_TICKERS, rate_col="OIS_3M"):
+    """
+    Compounds the expected dividends at `rate_col`, computes the implied forward rate
+    between the nearby and deferred contract, annualizes it (in bps) and subtracts the
+    nearby rate to get `{idx}_arb_spread`. `rate_col` is an OIS column or "OIS_INTERP",
+    which also adds the interpolated rates `{idx}_OIS1` and `{idx}_OIS2` (see
+    `leg_rates`). The math runs in the fused `spread_kernels.forward_spread` kernel,
+    reusing one output buffer for all indices.
+    """
+    merged_df = merged_df.copy()
+    buffer = np.empty((len(KERNEL_OUTPUTS), len(merged_df)), dtype=np.float64)
+    for idx in indices:
+        rate1, rate2 = leg_rates(merged_df, idx, rate_col)
+        if rate_col == "OIS_INTERP":
+            merged_df[f"{idx}_OIS1"] = rate1
+            merged_df[f"{idx}_OIS2"] = rate2
+        comp1, comp2, forward, annualized, spread = forward_spread(
+            merged_df[f"{idx}_F1"],
+            merged_df[f"{idx}_F2"],
+            merged_df[f"{idx}_exp_tau1"],
+            merged_df[f"{idx}_exp_tau2"],
+            merged_df[f"{idx}_TTM1"],
+            merged_df[f"{idx}_TTM2"],
+            rate1,
+            rate2,
+            out=buffer,
+        )
+        merged_df[f"{idx}_exp_tau1_comp"] = comp1
+        merged_df[f"{idx}_exp_tau2_comp"] = comp2
+        merged_df[f"{idx}_implied_forward_raw"] = forward
+        merged_df[f"{idx}_annualized_forward_bps"] = annualized
+        merged_df[f"{idx}_OIS_bps"] = rate1 * 10000
+        merged_df[f"{idx}_arb_spread"] = spread
+    return merged_df
+
+
+# =============================================================================
+# 7. Outlier Cleanup: Remove Observations with Extreme Arbitrage Spreads
+# =============================================================================
+@instrumented("outliers")
+def remove_spread_outliers(
+    merged_df,
+    indices=INDEX_TICKERS,
+    window=OUTLIER_WINDOW,
+    threshold=OUTLIER_THRESHOLD,
+):
+    """
+    Uses a centered rolling window to compute the rolling median and MAD of the
+    arbitrage spread and sets the forward rate of outliers to NaN.
+    """
+    merged_df = merged_df.copy()
+    for idx in indices:
+        arb_series = merged_df[f"{idx}_arb_spread"]
+        rolling_median = arb_series.rolling(window=window, center=True).median()
+        abs_dev = (arb_series - rolling_median).abs()
+        rolling_mad = abs_dev.rolling(window=window, center=True).mean()
+        outliers = (abs_dev / rolling_mad) >= threshold
+        merged_df.loc[outliers, f"{idx}_annualized_forward_bps"] = np.nan
+        merged_df[f"{idx}_arb_spread"] = (
+            merged_df[f"{idx}_annualized_forward_bps"] - merged_df[f"{idx}_OIS_bps"]
+        )
+    return merged_df
+
+
+def prepare_base_inputs(df, indices=INDEX_TICKERS, ois_columns=("OIS_3M",)):
+    """
+    Runs the stages shared by every rate variant on the normalised raw data: rename,
+    TTM and perfect foresight dividends. Keep all OIS_TENORS in `ois_columns` to
+    evaluate "OIS_INTERP".
+    """
+    merged_df = prepare_merged_df(df, indices, ois_columns=ois_columns)
+    merged_df = add_time_to_maturity(merged_df, indices)
+    return add_expected_dividends(merged_df, indices)
+
+
+def finish_rate_variant(base_df, rate="OIS_3M", indices=INDEX_TICKERS):
+    """Runs the forward and outlier stages of one rate variant on `prepare_base_inputs`."""
+    merged_df = add_forward_spreads(base_df, indices, rate)
+    merged_df = remove_spread_outliers(merged_df, indices)
+    # =============================================================================
+    # 8. Remove All Missing Values to Avoid Discontinuities in the Plot
+    # =============================================================================
+    return merged_df.dropna(subset=[f"{idx}_arb_spread" for idx in indices])
+
+
+def compute_calendar_spread_pandas(df, indices=INDEX_TICKERS):
+    """Runs all stages with pandas on the flattened raw Bloomberg data."""
+    return finish_rate_variant(prepare_base_inputs(df, indices), "OIS_3M", indices)
+
+
+def _normalized_source(source):
+    if isinstance(source, (str, Path)):
+        return load_bloomberg_data(source)
+    return normalize_raw(source)
+
+
+def compute_rate_variants(source, rates=RATE_VARIANTS, indices=INDEX_TICKERS):
+    """
+    Computes the calendar spread for several rate variants in one pass: the data is
+    loaded and the TTM and dividends computed once, then each variant runs the forward
+    and outlier stages on them.
+
+    Parameters:
+    - source (Path or DataFrame): Path to the raw Bloomberg parquet file, or the raw
+      DataFrame itself (MultiIndex or flattened columns)
+    - rates (list): Rate variants, see RATE_VARIANTS
+    - indices (dict): Index name -> Bloomberg tickers, see `INDEX_TICKERS`
+
+    Returns:
+    - dict of rate variant -> DataFrame indexed by date, the "OIS_3M" frame equal to
+      `compute_calendar_spread(source, backend="pandas")` plus the other OIS tenors.
+    """
+    unknown = [rate for rate in rates if rate not in RATE_VARIANTS]
+    if unknown:
+        raise ValueError(f"Unknown rate variants: {unknown}")
+    ois_columns = tuple(OIS_TENORS) if "OIS_INTERP" in rates else ("OIS_3M",)
+    base_df = prepare_base_inputs(_normalized_source(source), indices, ois_columns)
+    return {rate: finish_rate_variant(base_df, rate, indices) for rate in rates}
+
+
+def compute_calendar_spread(source, indices=INDEX_TICKERS, backend=None):
+    """
+    Computes the calendar-spread arbitrage series for every index.
+
+    Parameters:
+    - source (Path or DataFrame): Path to the raw Bloomberg parquet file, or the raw
+      DataFrame itself (MultiIndex or flattened columns)
+    - indices (dict): Index name -> Bloomberg tickers, see `INDEX_TICKERS`
+    - backend (str): "pandas" or "polars". Defaults to the SPREAD_BACKEND setting.
+
+    Returns:
+    - pandas DataFrame indexed by date with the same columns for either backend.
+    """
+    backend = SPREAD_BACKEND if backend is None else backend
+    if backend == "pandas":
+        return compute_calendar_spread_pandas(_normalized_source(source), indices)
+    elif backend == "polars":
+        import calendar_spread_polars
+
+        return calendar_spread_polars.compute_calendar_spread_polars(source, indices)
+    else:
+        raise ValueError(f"Unknown spread backend: {backend}")
@@ -0,0 +1,277 @@
+"""
+Polars `LazyFrame` implementation of the calendar-spread pipeline in `calendar_spread.py`.
+
+The whole pipeline (load, rename, time to maturity, perfect foresight dividends by
+contract group, implied forward rates and the centered rolling outlier filter) is built
+as one lazy query, so polars only reads the Bloomberg columns that are used, pushes the
+row filters down and runs the per-index expressions in parallel. The result is collected
+once and returned as a pandas DataFrame laid out exactly like the pandas backend.
+"""
+
+from pathlib import Path
+
+import pandas as pd
+import polars as pl
+
+from calendar_spread import (
+    INDEX_TICKERS,
+    OIS_3M_TICKER,
+    OUTLIER_THRESHOLD,
+    OUTLIER_WINDOW,
+)
+from instrumentation import instrumented
+
+DATE_COL = "Date"
+
+MONTH_NUMBERS = {
+    "JAN": 1,
+    "FEB": 2,
+    "MAR": 3,
+    "APR": 4,
+    "MAY": 5,
+    "JUN": 6,
+    "JUL": 7,
+    "AUG": 8,
+    "SEP": 9,
+    "OCT": 10,
+    "NOV": 11,
+    "DEC": 12,
+}
+
+
+def scan_bloomberg_data(source) -> pl.LazyFrame:
+    """
+    Returns a `LazyFrame` over the raw Bloomberg data with a "Date" column and the
+    fields named "ticker field", e.g. "SPX Index PX_LAST".
+
+    `source` is the path to the raw parquet file or the raw pandas DataFrame.
+    """
+    if isinstance(source, (str, Path)):
+        lf = pl.scan_parquet(source)
+        # pandas stores the (ticker, field) MultiIndex columns as their tuple repr
+        renames = {}
+        for name in lf.collect_schema().names():
+            if name == "__index_level_0__":
+                renames[name] = DATE_COL
+            elif name.startswith("("):
+                ticker, field = name.strip("()").split(", ")
+                renames[name] = f"{ticker.strip(chr(39))} {field.strip(chr(39))}"
+        lf = lf.rename(renames)
+    else:
+        df = source.copy()
+        if isinstance(df.columns, pd.MultiIndex):
+            df.columns = [" ".join(col).strip() for col in df.columns]
+        df.index = pd.to_datetime(df.index)
+        df.index.name = DATE_COL
+        lf = pl.from_pandas(df.reset_index()).lazy()
+    return lf.with_columns(pl.col(DATE_COL).cast(pl.Datetime("ns")))
+
+
+def contract_to_maturity_expr(contract: pl.Expr) -> pl.Expr:
+    """
+    Vectorized `calendar_spread.contract_to_maturity`: the third Friday of the contract
+    month, null when the contract string cannot be parsed.
+    """
+    contract = contract.str.strip_chars().str.to_uppercase()
+    month = contract.str.slice(0, 3).replace_strict(
+        MONTH_NUMBERS, default=None, return_dtype=pl.Int32
+    )
+    year_str = contract.str.slice(3).str.replace_all(" ", "")
+    year = (
+        pl.when(year_str.str.len_chars() == 4)
+        .then(year_str)
+        .otherwise(pl.lit("20") + year_str)
+        .cast(pl.Int32, strict=False)
+    )
+    first_day = pl.date(year, month, 1)
+    # ISO weekday: Monday = 1, Friday = 5
+    first_friday_offset = (5 - first_day.dt.weekday()) % 7
+    maturity = first_day + pl.duration(days=first_friday_offset + 14)
+    return pl.when(contract.str.len_chars() >= 5).then(maturity)
+
+
+def _centered_rolling(expr: pl.Expr, window: str) -> pl.Expr:
+    """Centered time-based rolling window, matching pandas `rolling(window, center=True)`."""
+    period = pd.Timedelta(window)
+    return expr.rolling(
+        index_column=DATE_COL,
+        period=f"{int(period.total_seconds() * 1e6)}us",
+        offset=f"-{int(period.total_seconds() * 1e6) // 2}us",
+        closed="right",
+    )
+
+
+def calendar_spread_query(
+    lf: pl.LazyFrame,
+    indices=INDEX_TICKERS,
+    window=OUTLIER_WINDOW,
+    threshold=OUTLIER_THRESHOLD,
+) -> pl.LazyFrame:
+    """Builds the lazy calendar-spread query on the raw Bloomberg `LazyFrame`."""
+    # 1. Rename the fields and clean missing values
+    columns = []
+    for idx, tickers in indices.items():
+        columns += [
+            pl.col(f"{tickers['spot']} PX_LAST")
+            .cast(pl.Float64, strict=False)
+            .alias(f"{idx}_Spot"),
+            pl.col(f"{tickers['spot']} INDX_GROSS_DAILY_DIV")
+            .cast(pl.Float64, strict=False)
+            .fill_nan(None)
+            .fill_null(0)
+            .alias(f"{idx}_Div"),
+        ]
+    for idx, tickers in indices.items():
+        columns += [
+            pl.col(f"{tickers['near']} PX_LAST")
+            .cast(pl.Float64, strict=False)
+            .alias(f"{idx}_F1"),
+            pl.col(f"{tickers['deferred']} PX_LAST")
+            .cast(pl.Float64, strict=False)
+            .alias(f"{idx}_F2"),
+        ]
+        for leg, suffix in [("near", "Contract"), ("deferred", "Contract2")]:
+            contract = pl.col(f"{tickers[leg]} CURRENT_CONTRACT_MONTH_YR")
+            columns.append(
+                pl.when(contract != ".NA.")
+                .then(contract)
+                .otherwise(None)
+                .alias(f"{idx}_{suffix}")
+            )
+    columns.append((pl.col(f"{OIS_3M_TICKER} PX_LAST") / 100).alias("OIS_3M"))
+
+    first_idx = next(iter(indices))
+    essential = [f"{first_idx}_Spot"]
+    essential += [f"{idx}_{f}" for idx in indices for f in ["F1", "F2"]]
+    essential += [f"{idx}_{c}" for idx in indices for c in ["Contract", "Contract2"]]
+    lf = (
+        lf.select(pl.col(DATE_COL), *columns)
+        .with_columns(pl.col(pl.Float64).fill_nan(None))
+        .drop_nulls(subset=essential)
+        .sort(DATE_COL)
+    )
+
+    # 4. Time to maturity of the nearby and deferred contract
+    lf = lf.with_columns(
+        (contract_to_maturity_expr(pl.col(f"{idx}_{c}")) - pl.col(DATE_COL))
+        .dt.total_days()
+        .alias(f"{idx}_TTM{n}")
+        for idx in indices
+        for c, n in [("Contract", 1), ("Contract2", 2)]
+    ).drop_nulls(subset=[f"{idx}_TTM{n}" for idx in indices for n in [1, 2]])
+
+    # 5. Perfect foresight dividends by contract group
+    dividends = []
+    for idx in indices:
+        div = pl.col(f"{idx}_Div")
+        exp_tau1 = div.sum().over(f"{idx}_Contract") - div.cum_sum().over(
+            f"{idx}_Contract"
+        )
+        dividends += [
+            exp_tau1.alias(f"{idx}_exp_tau1"),
+            (exp_tau1 + div.sum().over(f"{idx}_Contract2")).alias(f"{idx}_exp_tau2"),
+            div.alias(f"{idx}_daily_div"),
+        ]
+    lf = lf.with_columns(dividends)
+
+    # 6. Compounded dividends, implied forward rates and spreads
+    rate = pl.col("OIS_3M")
+    lf = lf.with_columns(
+        expr
+        for idx in indices
+        for expr in [
+            (
+                pl.col(f"{idx}_exp_tau1")
+                * ((pl.col(f"{idx}_TTM1") / 2) / 360 * rate + 1)
+            ).alias(f"{idx}_exp_tau1_comp"),
+            (
+                pl.col(f"{idx}_exp_tau2")
+                * ((pl.col(f"{idx}_TTM2") / 2) / 360 * rate + 1)
+            ).alias(f"{idx}_exp_tau2_comp"),
+        ]
+    )
+    lf = lf.with_columns(
+        (
+            (pl.col(f"{idx}_F2") + pl.col(f"{idx}_exp_tau2_comp"))
+            / (pl.col(f"{idx}_F1") + pl.col(f"{idx}_exp_tau1_comp"))
+            - 1
+        ).alias(f"{idx}_implied_forward_raw")
+        for idx in indices
+    )
+    lf = lf.with_columns(
+        expr
+        for idx in indices
+        for expr in [
+            (
+                pl.col(f"{idx}_implied_forward_raw")
+                * (360 / (pl.col(f"{idx}_TTM2") - pl.col(f"{idx}_TTM1")))
+                * 10000
+            )
+            .fill_nan(None)
+            .alias(f"{idx}_annualized_forward_bps"),
+            (rate * 10000).alias(f"{idx}_OIS_bps"),
+        ]
+    )
+    lf = lf.with_columns(
+        (pl.col(f"{idx}_annualized_forward_bps") - pl.col(f"{idx}_OIS_bps")).alias(
+            f"{idx}_arb_spread"
+        )
+        for idx in indices
+    )
+
+    # 7. Outlier cleanup with the centered rolling median and MAD
+    lf = lf.with_columns(
+        (
+            pl.col(f"{idx}_arb_spread")
+            - _centered_rolling(pl.col(f"{idx}_arb_spread").median(), window)
+        )
+        .abs()
+        .alias(f"_{idx}_abs_dev")
+        for idx in indices
+    )
+    lf = lf.with_columns(
+        pl.when(
+            pl.col(f"_{idx}_abs_dev")
+            / _centered_rolling(pl.col(f"_{idx}_abs_dev").mean(), window)
+            >= threshold
+        )
+        .then(None)
+        .otherwise(pl.col(f"{idx}_annualized_forward_bps"))
+        .alias(f"{idx}_annualized_forward_bps")
+        for idx in indices
+    ).drop([f"_{idx}_abs_dev" for idx in indices])
+    lf = lf.with_columns(
+        (pl.col(f"{idx}_annualized_forward_bps") - pl.col(f"{idx}_OIS_bps")).alias(
+            f"{idx}_arb_spread"
+        )
+        for idx in indices
+    )
+
+    # 8. Remove all missing spreads, keeping the column order of the pandas backend
+    spread_columns = [
+        f"{idx}_{col}"
+        for idx in indices
+        for col in [
+            "exp_tau1_comp",
+            "exp_tau2_comp",
+            "implied_forward_raw",
+            "annualized_forward_bps",
+            "OIS_bps",
+            "arb_spread",
+        ]
+    ]
+    return lf.drop_nulls(subset=[f"{idx}_arb_spread" for idx in indices]).select(
+        pl.exclude(spread_columns), *spread_columns
+    )
+
+
+@instrumented("polars_query")
+def compute_calendar_spread_polars(source, indices=INDEX_TICKERS) -> pd.DataFrame:
+    """
+    Runs the lazy calendar-spread query and returns the same pandas DataFrame
+    (columns, order and DatetimeIndex) as `calendar_spread.compute_calendar_spread_pandas`.
+    """
+    result = calendar_spread_query(scan_bloomberg_data(source), indices).collect()
+    df = result.to_pandas().set_index(DATE_COL)
+    df.index.name = None
+    return df
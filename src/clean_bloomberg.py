@@ -8,6 +8,8 @@ from datetime import datetime
 import pandas as pd
 from dateutil.relativedelta import relativedelta
 
+from instrumentation import instrumented
+
 
 def get_adjacent_dates(target_date: datetime.date, date_ranges: list):
     """
@@ -41,15 +43,29 @@ def roll_over(
         return date_range
 
 
+def px_last(df_raw: pd.DataFrame, ticker: str):
+    """
+    This returns the PX_LAST series of a ticker, with either the (ticker, field) MultiIndex
+    columns of the raw pull or the flattened "ticker field" columns of normalize_bloomberg
+    """
+    if isinstance(df_raw.columns, pd.MultiIndex):
+        return df_raw[ticker]["PX_LAST"]
+    return df_raw[f"{ticker} PX_LAST"]
+
+
+@instrumented("get_clean_df")
 def get_clean_df(df_raw: pd.DataFrame, date_ranges: list, index_pairs: list):
     """
     This takes the bloomberg raw date pulled out and saved a parquet file and returns a clean dataframe
     For each target date it will return the near month PX_LAST and the deferred month PX_LAST
     but on the rollover date it will return the PX_LAST of the deferred month
+    df_raw can have the raw MultiIndex columns or the flattened columns of normalize_bloomberg
 
     """
 
     df = pd.DataFrame(columns=["Near Month PX_LAST", "Deferred Month PX_LAST"])
+    near_pair = [px_last(df_raw, ticker) for ticker in index_pairs[0]]
+    rolled_pair = [px_last(df_raw, ticker) for ticker in index_pairs[1]]
 
     for i in range(len(df_raw.index)):
         target_date = df_raw.index[i]
@@ -58,14 +74,14 @@ def get_clean_df(df_raw: pd.DataFrame, date_ranges: list, index_pairs: list):
 
         if range_ == (near_month, deferred_month):
             df.loc[target_date] = [
-                df_raw[index_pairs[0][0]]["PX_LAST"].loc[target_date],
-                df_raw[index_pairs[0][1]]["PX_LAST"].loc[target_date],
+                near_pair[0].loc[target_date],
+                near_pair[1].loc[target_date],
             ]
 
         else:
             df.loc[target_date] = [
-                df_raw[index_pairs[1][0]]["PX_LAST"].loc[target_date],
-                df_raw[index_pairs[1][1]]["PX_LAST"].loc[target_date],
+                rolled_pair[0].loc[target_date],
+                rolled_pair[1].loc[target_date],
             ]
             # print("rolled over")
             # print(target_date,range_,( near_month, deferred_month))
@@ -0,0 +1,122 @@
+"""
+Runs the calendar spread for several rate-curve variants in one pass.
+
+`compute_calendar_spread_OIS3M.py` and `compute_calendar_spread_OIS_INTERP.py` only
+differ in the rate used for compounding the dividends and as the benchmark. This script
+loads the Bloomberg data and computes TTM and dividends once, evaluates every rate
+variant against them (see `calendar_spread.compute_rate_variants`) and writes the
+results side by side:
+
+- `calendar_spread_variants.parquet`: the OIS rate (bps) and arbitrage spread of every
+  index and variant, e.g. `SPX_arb_spread_OIS_3M` and `SPX_arb_spread_OIS_INTERP`,
+  outer-joined on the dates (a date dropped by one variant is NaN in its columns),
+- `table_rate_variants_update.tex` / `table_rate_variants_replication.tex`: the summary
+  statistics of every spread column,
+- `stage_report_calendar_spread_variants.*`: wall time and memory of every stage.
+
+    python compute_calendar_spread_variants.py
+    python compute_calendar_spread_variants.py --rates OIS_3M OIS_INTERP
+"""
+
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+import arrow_cache
+from calendar_spread import (
+    INDEX_TICKERS,
+    OIS_TENORS,
+    RATE_VARIANTS,
+    finish_rate_variant,
+    load_bloomberg_data,
+    prepare_base_inputs,
+)
+from instrumentation import (
+    check_stage_budgets,
+    stage,
+    stage_records,
+    start_stage_report,
+    write_stage_report,
+)
+from settings import config
+from summary_tables import write_summary_tables
+
+OUTPUT_DIR = config("OUTPUT_DIR")
+repl_end = datetime(2021, 2, 28).date()
+
+file_path = (
+    Path(__file__).resolve().parent.parent
+    / "data_manual/bloomberg_historical_data.parquet"
+)
+
+# Columns of each variant written side by side, suffixed with the variant name
+VARIANT_COLUMNS = ["OIS_bps", "arb_spread"]
+
+
+def side_by_side(variants, indices=INDEX_TICKERS, columns=VARIANT_COLUMNS):
+    """
+    Joins the VARIANT_COLUMNS of every variant on the dates, e.g. `SPX_arb_spread`
+    of "OIS_INTERP" as `SPX_arb_spread_OIS_INTERP`.
+    """
+    frames = [
+        df[[f"{idx}_{col}" for idx in indices for col in columns]].add_suffix(
+            f"_{rate}"
+        )
+        for rate, df in variants.items()
+    ]
+    return pd.concat(frames, axis=1, join="outer").sort_index()
+
+
+def main(rates=RATE_VARIANTS):
+    ois_columns = tuple(OIS_TENORS) if "OIS_INTERP" in rates else ("OIS_3M",)
+    start_stage_report()
+    # Shared stages: load, rename, TTM and perfect foresight dividends
+    with stage("shared_inputs"):
+        base_df = prepare_base_inputs(
+            load_bloomberg_data(file_path), ois_columns=ois_columns
+        )
+
+    variants = {}
+    for rate in rates:
+        with stage(f"variant_{rate}", rows=len(base_df)):
+            variants[rate] = finish_rate_variant(base_df, rate)
+    variants_df = side_by_side(variants)
+
+    with stage("summary_tables"):
+        write_summary_tables(
+            variants_df,
+            [col for col in variants_df.columns if "_arb_spread_" in col],
+            {
+                "rate_variants_update": (None, None),
+                "rate_variants_replication": (None, repl_end),
+            },
+            OUTPUT_DIR,
+        )
+
+    with stage("write_parquet", rows=len(variants_df)):
+        variants_df.to_parquet(
+            OUTPUT_DIR / "calendar_spread_variants.parquet", engine="pyarrow"
+        )
+        arrow_cache.publish(variants_df, "calendar_spread_variants")
+
+    # Wall time, CPU time, memory and rows of every stage of this run, then the stage
+    # budgets of PIPELINE_STAGE_BUDGETS
+    records = stage_records()
+    write_stage_report(OUTPUT_DIR / "stage_report_calendar_spread_variants")
+    check_stage_budgets(records=records)
+    return variants_df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--rates",
+        nargs="+",
+        choices=RATE_VARIANTS,
+        default=list(RATE_VARIANTS),
+        help="Rate variants to evaluate",
+    )
+    args = parser.parse_args()
+    main(args.rates)
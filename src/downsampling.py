@@ -0,0 +1,123 @@
+"""
+Downsampling of long time series before they are drawn.
+
+A figure cannot show more points than it has pixels across, but vector PDFs store
+every point of every line: with long or intraday histories the files and their
+render times grow with the data. The figure builders pass each plotted series through
+`downsample`, which keeps at most PLOT_MAX_POINTS points chosen so that the line
+looks the same:
+
+- "lttb": largest-triangle-three-buckets (Steinarsson, 2013). Splits the series into
+  buckets and keeps, per bucket, the point forming the largest triangle with the
+  point kept in the previous bucket and the mean of the next bucket.
+- "minmax": keeps the minimum and the maximum of each bucket (one bucket per pair of
+  points), so every spike survives.
+
+Only the plotted copies are reduced; the parquet outputs keep the full resolution.
+Series no longer than the budget are returned unchanged, so daily charts are exactly
+as before. Set PLOT_MAX_POINTS=0 to turn downsampling off.
+"""
+
+import numpy as np
+import pandas as pd
+
+from settings import config
+
+PLOT_MAX_POINTS = config("PLOT_MAX_POINTS")
+PLOT_DOWNSAMPLING = config("PLOT_DOWNSAMPLING")
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Positions of the points kept by largest-triangle-three-buckets.
+
+    >>> x = np.arange(10.0)
+    >>> y = np.array([0, 1, 0, 5, 0, 1, 0, -4, 0, 1.0])
+    >>> lttb_indices(x, y, 5)
+    array([0, 2, 3, 7, 9])
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # n_out - 2 buckets between the first and the last point, which are always kept
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if i == n_out - 3:
+            next_x, next_y = x[n - 1], y[n - 1]
+        else:
+            next_x = x[end : edges[i + 2]].mean()
+            next_y = y[end : edges[i + 2]].mean()
+        area = np.abs(
+            (x[a] - next_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (next_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y, n_out):
+    """
+    Positions of the minimum and maximum of each of (n_out - 2) // 2 equal buckets,
+    plus the first and last points.
+
+    >>> minmax_indices(np.array([3, 1, 2, 9, 4, 5, 0, 6.0]), 6)
+    array([0, 1, 3, 6, 7])
+    """
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    # Buckets are contiguous slices, so their extremes come from reduceat
+    starts = np.arange((n_out - 2) // 2) * n // ((n_out - 2) // 2)
+    sizes = np.diff(np.r_[starts, n])
+    buckets = np.repeat(np.arange(len(starts)), sizes)
+    positions = [np.array([0, n - 1])]
+    for reduce in [np.minimum, np.maximum]:
+        extreme = np.repeat(reduce.reduceat(y, starts), sizes)
+        hits = np.flatnonzero(y == extreme)
+        _, first = np.unique(buckets[hits], return_index=True)
+        positions.append(hits[first])
+    return np.unique(np.concatenate(positions))
+
+
+def _x_values(index):
+    """Numeric x coordinates of an index (nanoseconds for dates)."""
+    if pd.api.types.is_numeric_dtype(index):
+        return np.asarray(index, dtype=np.float64)
+    dates = pd.DatetimeIndex(pd.to_datetime(index))
+    return (dates.asi8 - dates.asi8[0]).astype(np.float64)
+
+
+def downsample(series, max_points=None, method=None):
+    """
+    Reduces a series to at most `max_points` points for plotting.
+
+    Parameters:
+    - series (Series): Values indexed by date (or any numeric x)
+    - max_points (int): Point budget. Defaults to PLOT_MAX_POINTS; 0 keeps everything.
+    - method (str): "lttb" or "minmax". Defaults to PLOT_DOWNSAMPLING.
+
+    Returns:
+    - The series itself if it fits the budget, otherwise a subset of its rows.
+      Missing values are dropped before reducing.
+    """
+    max_points = PLOT_MAX_POINTS if max_points is None else max_points
+    method = method or PLOT_DOWNSAMPLING
+    if not max_points or len(series) <= max_points:
+        return series
+    series = series.dropna()
+    if len(series) <= max_points:
+        return series
+    if method == "lttb":
+        positions = lttb_indices(_x_values(series.index), series.to_numpy(), max_points)
+    elif method == "minmax":
+        positions = minmax_indices(series.to_numpy(dtype=np.float64), max_points)
+    else:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    return series.iloc[positions]
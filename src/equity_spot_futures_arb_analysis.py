@@ -15,16 +15,35 @@ import numpy as np
 import pandas as pd
 from dateutil.relativedelta import relativedelta
 
+import arrow_cache
 import clean_bloomberg as clean_bbg
 import pull_optionm_api_data as pull_optionm
+from downsampling import downsample
+from instrumentation import (
+    begin_stage,
+    check_stage_budgets,
+    end_stage,
+    stage_records,
+    start_stage_report,
+    write_stage_report,
+)
+from normalize_bloomberg import load_normalized, ticker_fields
+from results_store import register_run
 from settings import config
+from summary_tables import write_summary_tables
 
 MANUAL_DATA_DIR = config("MANUAL_DATA_DIR")
 # Set the path to the Bloomberg historical data file
 root_path = os.getcwd()
 # data_path = os.path.join(root_path, 'data_manual', 'bloomberg_historical_data.parquet')
 data_path = MANUAL_DATA_DIR / "bloomberg_historical_data.parquet"
-df_raw = pd.read_parquet(data_path)
+start_stage_report()
+load_stage = begin_stage("load")
+# Raw pull normalised once and cached (see normalize_bloomberg.py), indexed by calendar
+# date like the OptionMetrics data. No fill values: rows with missing fields are
+# dropped below.
+df_raw = load_normalized(data_path, dates="date", fill=False)
+end_stage(load_stage, rows=len(df_raw))
 
 # Retrieve configuration parameters: start date, end date, and output directory
 START_DATE = config("START_DATE")
@@ -66,8 +85,7 @@ djx = ["DM1 Index", "DM2 Index", "DM3 Index"]
 djx_pairs = list(zip(djx, djx[1:]))
 
 # Extract the OIS (Overnight Index Swap) rate from the raw data and drop missing values
-ois_df = df_raw["USSOC CMPN Curncy"]["PX_LAST"]
-ois_df.dropna(inplace=True)
+ois_df = df_raw["USSOC CMPN Curncy PX_LAST"].dropna()
 
 # Create a mapping of index names to their corresponding pairs for later processing
 index_pairs_map = {"SPX": spx_pairs, "NDX": ndx_pairs, "INDU": djx_pairs}
@@ -82,6 +100,7 @@ index_future_df = dict()
 index_df = dict()
 
 # Loop over each index to pull and process the implied dividend yield data
+clean_stage = begin_stage("pull_and_clean")
 for index_name in index_pairs_map.keys():
     # For the DJX (INDU) index, adjust the name to "DJX" as required by the API; otherwise, use the index name directly.
     optionm_index_name = "DJX" if index_name == "INDU" else index_name
@@ -124,13 +143,15 @@ for index_name in index_pairs_map.keys():
     )
 
     # Extract index price data and remove any missing values
-    index_df[index_name] = df_raw[index_name + " Index"]
+    index_df[index_name] = ticker_fields(df_raw, index_name + " Index")
     index_df[index_name].dropna(inplace=True)
+end_stage(clean_stage)
 
 # ------------------------------------------------------------------------------
 # 4. Calculate Days to Expiration and Dividend Amounts
 # ------------------------------------------------------------------------------
 
+dividend_stage = begin_stage("dividends")
 for keys, val in index_optionm_df.items():
     # Calculate the difference between expiration dates and the current date for near and far contracts
     index_optionm_df[keys][["days_to_near_expiry", "days_to_far_expiry"]] = (
@@ -158,9 +179,12 @@ for keys, val in index_optionm_df.items():
         * index_optionm_df[keys][["days_to_near_expiry", "days_to_far_expiry"]].values
     )
 
+end_stage(dividend_stage)
+
 # ------------------------------------------------------------------------------
 # 5. Compute Implied Forward Rate and Annualised Rate
 # ------------------------------------------------------------------------------
+forward_stage = begin_stage("forwards")
 
 # Initialize a dictionary to store the implied forward rate calculations for each index
 implied_forward_df = dict()
@@ -237,6 +261,7 @@ total_df.dropna(inplace=True)
 total_df["SPX_Spread"] = total_df["SPX"] - total_df["OIS"]
 total_df["NDX_Spread"] = total_df["NDX"] - total_df["OIS"]
 total_df["INDU_Spread"] = total_df["INDU"] - total_df["OIS"]
+end_stage(forward_stage, rows=len(total_df))
 
 # ------------------------------------------------------------------------------
 # 7. Remove Outliers and Convert Units
@@ -271,6 +296,7 @@ def remove_outliers(df, column, window=45, threshold=10):
 
 
 # Apply the outlier removal function to the spread columns
+outlier_stage = begin_stage("outliers")
 for col in ["SPX_Spread", "NDX_Spread", "INDU_Spread"]:
     total_df = remove_outliers(total_df, col)
 
@@ -278,68 +304,51 @@ for col in ["SPX_Spread", "NDX_Spread", "INDU_Spread"]:
 total_df["SPX_Spread"] *= 100
 total_df["NDX_Spread"] *= 100
 total_df["INDU_Spread"] *= 100
+end_stage(outlier_stage, rows=len(total_df))
 
 # Save the final DataFrame to a Parquet file for later use
+write_stage = begin_stage("write")
 total_df.to_parquet(f"{OUTPUT_DIR}/total_df.parquet")
-
-desc = total_df.filter(items=["SPX_Spread", "NDX_Spread", "INDU_Spread"]).describe()
-data = desc.values.tolist()
-col_labels = list(desc.columns)
-row_labels = list(desc.index)
-
-
-fig, ax = plt.subplots()
-ax.axis("tight")
-ax.axis("off")
-
-table = ax.table(
-    cellText=data, colLabels=col_labels, rowLabels=row_labels, loc="center"
+arrow_cache.publish(total_df, "total_df")
+register_run(total_df, "proxy", OUTPUT_DIR / "total_df.parquet")
+
+# Write the summary statistics for the full sample and the replication window
+write_summary_tables(
+    total_df,
+    ["SPX_Spread", "NDX_Spread", "INDU_Spread"],
+    {"proxy_update": (None, None), "proxy_replication": (START_DATE.date(), repl_end)},
+    OUTPUT_DIR,
 )
-
-plt.savefig(f"{OUTPUT_DIR}/table_proxy_update.pdf")
-
-total_df_repl = total_df.loc[START_DATE.date() : repl_end]
-
-desc = total_df_repl.filter(
-    items=["SPX_Spread", "NDX_Spread", "INDU_Spread"]
-).describe()
-data = desc.values.tolist()
-col_labels = list(desc.columns)
-row_labels = list(desc.index)
-
-
-fig, ax = plt.subplots()
-ax.axis("tight")
-ax.axis("off")
-
-table = ax.table(
-    cellText=data, colLabels=col_labels, rowLabels=row_labels, loc="center"
-)
-
-plt.savefig(f"{OUTPUT_DIR}/table_proxy_replication.pdf")
+end_stage(write_stage)
 # ------------------------------------------------------------------------------
 # 8. Plotting the Equity Index Spread
 # ------------------------------------------------------------------------------
 
 # Plot the spread for SPX, NDX, and INDU over time
+plot_stage = begin_stage("plotting")
+spread_cols = ["SPX_Spread", "NDX_Spread", "INDU_Spread"]
+# Plotted copies cut to the window of the figure, then thinned to PLOT_MAX_POINTS;
+# total_df.parquet keeps every row
+replication_rows = total_df.loc[pd.Timestamp(START_DATE) : pd.Timestamp(repl_end)]
+plot_series = {col: downsample(replication_rows[col]) for col in spread_cols}
 plt.figure(figsize=(12, 6))
 plt.plot(
-    total_df.index,
-    total_df["SPX_Spread"],
+    plot_series["SPX_Spread"].index,
+    plot_series["SPX_Spread"],
     label="SPX Spread",
     linestyle="--",
     markersize=0.5,
 )
 plt.plot(
-    total_df.index,
-    total_df["NDX_Spread"],
+    plot_series["NDX_Spread"].index,
+    plot_series["NDX_Spread"],
     label="NDX Spread",
     linestyle="--",
     markersize=0.5,
 )
 plt.plot(
-    total_df.index,
-    total_df["INDU_Spread"],
+    plot_series["INDU_Spread"].index,
+    plot_series["INDU_Spread"],
     label="INDU Spread",
     linestyle="--",
     markersize=0.5,
@@ -357,24 +366,25 @@ plt.ylim(-50, 150)
 # Save the plot to a PDF file
 plt.savefig(f"{OUTPUT_DIR}/equity_index_spread_plot_proxy_replication.pdf")
 
+plot_series = {col: downsample(total_df[col]) for col in spread_cols}
 plt.figure(figsize=(12, 6))
 plt.plot(
-    total_df.index,
-    total_df["SPX_Spread"],
+    plot_series["SPX_Spread"].index,
+    plot_series["SPX_Spread"],
     label="SPX Spread",
     linestyle="--",
     markersize=0.5,
 )
 plt.plot(
-    total_df.index,
-    total_df["NDX_Spread"],
+    plot_series["NDX_Spread"].index,
+    plot_series["NDX_Spread"],
     label="NDX Spread",
     linestyle="--",
     markersize=0.5,
 )
 plt.plot(
-    total_df.index,
-    total_df["INDU_Spread"],
+    plot_series["INDU_Spread"].index,
+    plot_series["INDU_Spread"],
     label="INDU Spread",
     linestyle="--",
     markersize=0.5,
@@ -408,9 +418,9 @@ years = series.index.year.unique()
 # Generate a distinct color for each year using the Viridis colormap
 colors = plt.cm.viridis_r(np.linspace(0, 1, len(years)))
 
-# Plot the data for each year, using the day of the year on the x-axis
-for i, (year, color) in enumerate(zip(years, colors)):
-    yearly_data = series[series.index.year == year]
+# Plot the data for each year, using the day of the year on the x-axis. One groupby
+# splits the series by year instead of rescanning it for every year.
+for (year, yearly_data), color in zip(series.groupby(series.index.year), colors):
     day_of_year = yearly_data.index.dayofyear
     ax.plot(day_of_year, yearly_data.values, label=str(year), color=color, alpha=0.8)
 
@@ -427,3 +437,10 @@ ax.set_ylim(-1, 1)
 plt.grid(True, linestyle="--", alpha=0.5)
 # Save the yearly comparison plot as a PDF file
 plt.savefig(f"{OUTPUT_DIR}/yearly_comparison.pdf")
+end_stage(plot_stage)
+
+# Wall time, CPU time, memory and rows of every stage of this run, then the stage
+# budgets of PIPELINE_STAGE_BUDGETS
+records = stage_records()
+write_stage_report(OUTPUT_DIR / "stage_report_equity_spot_futures_arb")
+check_stage_budgets(records=records)
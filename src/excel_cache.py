@@ -0,0 +1,207 @@
+"""
+Parquet sidecars of the manual Excel inputs.
+
+Parsing `data_manual/*.xlsx` with openpyxl takes from 0.2 s (`spread.xlsx`) to
+several seconds (`equity_spot_futures.xlsx`) on every read. `read_excel_cached` parses
+a sheet once, stores the frame as a parquet sidecar in DATA_DIR/excel_cache and serves
+later reads from it:
+
+    expected = read_excel_cached(MANUAL_DATA_DIR / "spread.xlsx")
+
+The sidecar name holds a hash of the workbook's content and a hash of the
+`pd.read_excel` arguments, so editing the workbook or changing the arguments parses it
+again, while a fresh clone or a touched file with the same content still hits the
+cache. Sidecars of other versions of the workbook are removed.
+
+The sidecars are typed: numeric and date columns keep their dtype. Object columns (the
+raw Bloomberg sheets mix numbers, dates and text in a column) are stored as one typed
+column per kind of value plus a kind code, and the headers (some are dates or serial
+numbers) as tagged JSON in the file metadata, so the frame read back equals the parsed
+one, down to the type of each cell.
+"""
+
+import hashlib
+import json
+import warnings
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from settings import config
+
+DATA_DIR = config("DATA_DIR")
+EXCEL_CACHE_DIR = DATA_DIR / "excel_cache"
+
+_METADATA_KEY = b"excel_cache"
+# Kinds of values of object columns, by kind code, and their parquet types
+_KINDS = {
+    "float": pa.float64(),
+    "int": pa.int64(),
+    "str": pa.string(),
+    "datetime": pa.timestamp("us"),
+    "bool": pa.bool_(),
+}
+
+
+@lru_cache(maxsize=None)
+def _file_digest(path, size, mtime_ns):
+    """Hash of the file content, computed once per version (size, mtime) of the file."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def content_digest(path):
+    """Hash of the content of `path`, e.g. to key a cache derived from the file."""
+    stat = path.stat()
+    return _file_digest(str(path), stat.st_size, stat.st_mtime_ns)
+
+
+def _cache_path(path, sheet_name, kwargs):
+    key = json.dumps([sheet_name, sorted(kwargs.items())], default=str)
+    args_digest = hashlib.sha1(key.encode()).hexdigest()[:8]
+    return (
+        EXCEL_CACHE_DIR
+        / f"{path.stem}.{sheet_name}.{content_digest(path)}.{args_digest}.parquet"
+    )
+
+
+def _encode_header(header):
+    if isinstance(header, str):
+        return ["str", header]
+    if isinstance(header, datetime):
+        return ["datetime", pd.Timestamp(header).isoformat()]
+    if isinstance(header, (bool, np.bool_)):
+        return ["bool", bool(header)]
+    if isinstance(header, (int, np.integer)):
+        return ["int", int(header)]
+    if isinstance(header, (float, np.floating)):
+        return ["float", float(header)]
+    raise TypeError(f"Cannot store column header {header!r}")
+
+
+def _decode_header(tagged):
+    kind, value = tagged
+    return pd.Timestamp(value).to_pydatetime() if kind == "datetime" else value
+
+
+def _value_kind(value):
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, datetime):
+        return 3
+    if isinstance(value, (bool, np.bool_)):
+        return 4
+    if isinstance(value, (int, np.integer)):
+        return 1
+    if isinstance(value, (float, np.floating)):
+        return 0
+    raise TypeError(f"Cannot store cell value {value!r}")
+
+
+def _split_object(values):
+    """Kind codes and one typed column per kind of value of an object column."""
+    codes = np.array([_value_kind(value) for value in values], dtype=np.int8)
+    columns = {}
+    for code, (kind, kind_type) in enumerate(_KINDS.items()):
+        mask = codes == code
+        if mask.any():
+            columns[kind] = pa.array(np.where(mask, values, None), type=kind_type)
+    return codes, columns
+
+
+def _to_table(df):
+    """Sidecar table of a parsed sheet, see the module docstring."""
+    index_levels = 0
+    if not isinstance(df.index, pd.RangeIndex):
+        index_levels = df.index.nlevels
+        df = df.reset_index()
+    if isinstance(df.columns, pd.MultiIndex):
+        raise TypeError("Cannot store multi-row headers")
+
+    arrays, names, layout = [], [], []
+    for position, (header, values) in enumerate(df.items()):
+        if values.dtype != object:
+            arrays.append(pa.array(values, from_pandas=True))
+            names.append(str(position))
+            layout.append([_encode_header(header), None])
+        else:
+            codes, columns = _split_object(values.to_numpy())
+            arrays.append(pa.array(codes))
+            names.append(f"{position}.kind")
+            for kind, array in columns.items():
+                arrays.append(array)
+                names.append(f"{position}.{kind}")
+            layout.append([_encode_header(header), list(columns)])
+
+    metadata = {"columns": layout, "index_levels": index_levels}
+    return pa.table(arrays, names=names).replace_schema_metadata(
+        {_METADATA_KEY: json.dumps(metadata)}
+    )
+
+
+def _from_table(table):
+    metadata = json.loads(table.schema.metadata[_METADATA_KEY])
+    columns = {}
+    for position, (header, kinds) in enumerate(metadata["columns"]):
+        if kinds is None:
+            values = table.column(str(position)).to_pandas()
+        else:
+            codes = table.column(f"{position}.kind").to_numpy()
+            values = np.empty(len(codes), dtype=object)
+            for kind in kinds:
+                mask = codes == list(_KINDS).index(kind)
+                kind_values = table.column(f"{position}.{kind}").to_pylist()
+                values[mask] = np.array(kind_values, dtype=object)[mask]
+            values = pd.Series(values, dtype=object)
+        columns[position] = (_decode_header(header), values)
+
+    if not columns:
+        return pd.DataFrame()
+    df = pd.DataFrame({position: values for position, (_, values) in columns.items()})
+    df.columns = [header for header, _ in columns.values()]
+    if metadata["index_levels"]:
+        df = df.set_index(list(df.columns[: metadata["index_levels"]]))
+    return df
+
+
+def read_excel_cached(path, sheet_name=0, **kwargs):
+    """
+    `pd.read_excel` of one sheet, served from a parquet sidecar after the first read.
+
+    Parameters:
+    - path (Path): Excel workbook
+    - sheet_name (str or int): Sheet name or position
+    - kwargs: Other arguments of `pd.read_excel`
+
+    Returns:
+    - DataFrame equal to `pd.read_excel(path, sheet_name, **kwargs)`.
+    """
+    if not isinstance(sheet_name, (str, int)):
+        raise ValueError("read_excel_cached reads one sheet at a time")
+    cache_path = _cache_path(path, sheet_name, kwargs)
+    if cache_path.exists():
+        return _from_table(pq.read_table(cache_path))
+
+    df = pd.read_excel(path, sheet_name=sheet_name, **kwargs)
+    try:
+        table = _to_table(df)
+    except TypeError as error:
+        warnings.warn(f"Not caching {path.name} [{sheet_name}]: {error}")
+        return df
+    EXCEL_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    # Sidecars of other versions of the workbook
+    current = f"{path.stem}.{sheet_name}.{content_digest(path)}."
+    for old in EXCEL_CACHE_DIR.glob(f"{path.stem}.{sheet_name}.*.parquet"):
+        if not old.name.startswith(current):
+            old.unlink()
+    tmp_path = cache_path.with_suffix(".tmp")
+    pq.write_table(table, tmp_path)
+    tmp_path.replace(cache_path)
+    return df
@@ -0,0 +1,270 @@
+"""
+Compare two versions of a data frame, e.g. a pipeline output between two runs or two
+data vintages.
+
+Rows are matched on key columns (the index by default) and compared through 64-bit
+row hashes (`misc_tools.hash_rows`), so neither side is merged on all its columns.
+A column stored as integers in one version and as floats in the other is hashed as
+float64 in both, so equal values still match:
+
+- removed: keys only in the old version,
+- added: keys only in the new version,
+- changed: keys in both versions whose other columns differ.
+
+`diff_frames` compares two in-memory frames. `diff_parquet` compares two parquet
+files in record batches: it keeps one key hash and one row hash per row (16 bytes)
+plus the rows it reports, so the files can be larger than memory.
+
+Run as a script to compare two parquet files:
+
+    python frame_diff.py old/calendar_spread_df.parquet _output/calendar_spread_df.parquet
+"""
+
+import argparse
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from misc_tools import hash_alignment, hash_rows
+
+DIFF_BATCH_SIZE = 1_000_000
+DIFF_MAX_ROWS = 10_000
+
+
+def _key_columns(df, on):
+    """Key columns of `df` and the frame with an index key moved to the columns."""
+    if on is None:
+        on = [name or "index" for name in df.index.names]
+        df = df.reset_index(names=on)
+    elif isinstance(on, str):
+        on = [on]
+    return df, list(on)
+
+
+def _hashes(df, on, columns, as_float):
+    return hash_rows(df, on, as_float), hash_rows(df, columns, as_float)
+
+
+def _compare_hashes(old_keys, old_rows, new_keys, new_rows):
+    """
+    Classifies the keys of two versions from their hashes.
+
+    Returns:
+    - removed, added, changed: sorted unique key hashes.
+    """
+    for name, keys in [("old", old_keys), ("new", new_keys)]:
+        if len(np.unique(keys)) < len(keys):
+            raise ValueError(f"The key columns are not unique in the {name} frame")
+    old_order = np.argsort(old_keys)
+    new_order = np.argsort(new_keys)
+    old_keys, old_rows = old_keys[old_order], old_rows[old_order]
+    new_keys, new_rows = new_keys[new_order], new_rows[new_order]
+
+    common, old_pos, new_pos = np.intersect1d(
+        old_keys, new_keys, assume_unique=True, return_indices=True
+    )
+    removed = np.setdiff1d(old_keys, common, assume_unique=True)
+    added = np.setdiff1d(new_keys, common, assume_unique=True)
+    changed = common[old_rows[old_pos] != new_rows[new_pos]]
+    return removed, added, changed
+
+
+def _diff_stats(n_old, n_new, removed, added, changed):
+    """Match statistics in the layout of `misc_tools.merge_stats`."""
+    unchanged = n_old - len(removed) - len(changed)
+    return pd.Series(
+        {
+            "old": n_old,
+            "new": n_new,
+            "removed": len(removed),
+            "added": len(added),
+            "changed": len(changed),
+            "unchanged": unchanged,
+            "unchanged/old": unchanged / n_old if n_old else np.nan,
+        }
+    )
+
+
+def _changed_report(old_rows, new_rows, on):
+    """Old and new values of the changed rows, only in the columns that differ."""
+    old_rows = old_rows.set_index(on).sort_index()
+    new_rows = new_rows.set_index(on).reindex(old_rows.index)
+    return old_rows.compare(new_rows, result_names=("old", "new"))
+
+
+def diff_frames(old, new, on=None, columns=None, max_rows=DIFF_MAX_ROWS):
+    """
+    Compares two versions of a data frame.
+
+    Parameters:
+    - old, new (DataFrame): The two versions
+    - on (str or list): Key columns. Defaults to the index.
+    - columns (list): Compared columns. Defaults to the columns of `old` that are
+      not keys; both frames must have them.
+    - max_rows (int): Maximum number of rows in each report
+
+    Returns:
+    - dict with "stats" (Series of counts), "removed" and "added" (the rows only in
+      one version) and "changed" (old and new values of the changed cells, see
+      DataFrame.compare).
+    """
+    old, key_columns = _key_columns(old, on)
+    new, _ = _key_columns(new, on)
+    if columns is None:
+        columns = [col for col in old.columns if col not in key_columns]
+    selected = [*key_columns, *columns]
+    as_float, _ = hash_alignment(old[selected].dtypes, new[selected].dtypes)
+    old_keys, old_rows = _hashes(old, key_columns, columns, as_float)
+    new_keys, new_rows = _hashes(new, key_columns, columns, as_float)
+    removed, added, changed = _compare_hashes(old_keys, old_rows, new_keys, new_rows)
+
+    changed_sample = changed[:max_rows]
+    return {
+        "stats": _diff_stats(len(old), len(new), removed, added, changed),
+        "removed": old[np.isin(old_keys, removed[:max_rows])][selected],
+        "added": new[np.isin(new_keys, added[:max_rows])][selected],
+        "changed": _changed_report(
+            old[np.isin(old_keys, changed_sample)][selected],
+            new[np.isin(new_keys, changed_sample)][selected],
+            key_columns,
+        ),
+    }
+
+
+def _range_index(metadata):
+    """The RangeIndex stored in the pandas metadata of a parquet file, if any."""
+    if not metadata or b"pandas" not in metadata:
+        return None
+    index_columns = json.loads(metadata[b"pandas"])["index_columns"]
+    if len(index_columns) == 1 and isinstance(index_columns[0], dict):
+        if index_columns[0]["kind"] == "range":
+            return index_columns[0]
+    return None
+
+
+def _parquet_batches(path, batch_size):
+    """
+    Record batches of a parquet file as data frames (with their pandas index). A
+    RangeIndex, which is stored as metadata and not as a column, continues across the
+    batches instead of restarting in each one.
+    """
+    parquet = pq.ParquetFile(path)
+    metadata = parquet.schema_arrow.metadata
+    range_index = _range_index(metadata)
+    offset = 0
+    for batch in parquet.iter_batches(batch_size=batch_size):
+        table = pa.Table.from_batches([batch]).replace_schema_metadata(metadata)
+        df = table.to_pandas()
+        if range_index is not None:
+            step = range_index["step"]
+            start = range_index["start"] + offset * step
+            df.index = pd.RangeIndex(
+                start, start + len(df) * step, step, name=range_index["name"]
+            )
+        offset += batch.num_rows
+        yield df
+
+
+def _parquet_dtypes(path, on):
+    """Dtypes of the columns of a parquet file (an index key included) and the keys."""
+    empty = pq.read_schema(path).empty_table().to_pandas()
+    df, key_columns = _key_columns(empty, on)
+    return df.dtypes, key_columns
+
+
+def _parquet_hashes(path, on, columns, as_float, batch_size):
+    """Key and row hashes of a parquet file."""
+    keys, rows = [], []
+    for df in _parquet_batches(path, batch_size):
+        df, key_columns = _key_columns(df, on)
+        batch_keys, batch_rows = _hashes(df, key_columns, columns, as_float)
+        keys.append(batch_keys)
+        rows.append(batch_rows)
+    return np.concatenate(keys), np.concatenate(rows)
+
+
+def _select_rows(path, on, columns, as_float, key_hashes, batch_size):
+    """Rows of a parquet file whose key hash is in `key_hashes`."""
+    selected = []
+    for df in _parquet_batches(path, batch_size):
+        df, key_columns = _key_columns(df, on)
+        rows = df[np.isin(hash_rows(df, key_columns, as_float), key_hashes)]
+        selected.append(rows[[*key_columns, *columns]])
+    return pd.concat(selected, ignore_index=True)
+
+
+def diff_parquet(
+    old_path,
+    new_path,
+    on=None,
+    columns=None,
+    batch_size=DIFF_BATCH_SIZE,
+    max_rows=DIFF_MAX_ROWS,
+):
+    """
+    Compares two parquet files batch by batch, see `diff_frames`.
+
+    The first pass hashes both files; a second pass reads back only the rows to report
+    (at most `max_rows` of each kind).
+    """
+    old_dtypes, key_columns = _parquet_dtypes(old_path, on)
+    new_dtypes, _ = _parquet_dtypes(new_path, on)
+    if columns is None:
+        columns = [col for col in old_dtypes.index if col not in key_columns]
+    selected = [*key_columns, *columns]
+    as_float, _ = hash_alignment(old_dtypes[selected], new_dtypes[selected])
+    old_keys, old_rows = _parquet_hashes(old_path, on, columns, as_float, batch_size)
+    new_keys, new_rows = _parquet_hashes(new_path, on, columns, as_float, batch_size)
+    removed, added, changed = _compare_hashes(old_keys, old_rows, new_keys, new_rows)
+
+    changed_sample = changed[:max_rows]
+    old_selected = _select_rows(
+        old_path,
+        on,
+        columns,
+        as_float,
+        np.union1d(removed[:max_rows], changed_sample),
+        batch_size,
+    )
+    new_selected = _select_rows(
+        new_path,
+        on,
+        columns,
+        as_float,
+        np.union1d(added[:max_rows], changed_sample),
+        batch_size,
+    )
+    old_changed = np.isin(
+        hash_rows(old_selected, key_columns, as_float), changed_sample
+    )
+    new_changed = np.isin(
+        hash_rows(new_selected, key_columns, as_float), changed_sample
+    )
+    return {
+        "stats": _diff_stats(len(old_keys), len(new_keys), removed, added, changed),
+        "removed": old_selected[~old_changed].reset_index(drop=True),
+        "added": new_selected[~new_changed].reset_index(drop=True),
+        "changed": _changed_report(
+            old_selected[old_changed], new_selected[new_changed], key_columns
+        ),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two parquet files.")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--on", nargs="*", default=None, help="Key columns")
+    parser.add_argument("--batch-size", type=int, default=DIFF_BATCH_SIZE)
+    args = parser.parse_args()
+
+    diff = diff_parquet(args.old, args.new, on=args.on, batch_size=args.batch_size)
+    print(diff["stats"].to_string())
+    for name in ["removed", "added", "changed"]:
+        if len(diff[name]):
+            print(f"\n{name}:\n{diff[name].head(20).to_string()}")
+    sys.exit(1 if diff["stats"][["removed", "added", "changed"]].any() else 0)
@@ -0,0 +1,267 @@
+"""
+Per-stage timing and memory instrumentation for the spread pipeline.
+
+Wrap a pipeline stage in `stage(name)` (or decorate a function with
+`instrumented(name)`) to record, for each run of the stage:
+
+- wall time and CPU time (process time, all threads),
+- resident memory (RSS) at the end of the stage, its change over the stage and the
+  process peak RSS,
+- the tracemalloc peak of Python allocations made inside the stage, when
+  PIPELINE_TRACEMALLOC is set (tracemalloc slows pandas down noticeably),
+- the number of rows produced, if given.
+
+Module-level scripts can use `begin_stage`/`end_stage` around a section instead of
+indenting it. Stages are only recorded between `start_stage_report()` and
+`write_stage_report(path_stem)`, which exports the records as `<stem>.json` and as a
+Chrome trace `<stem>.trace.json` (open in chrome://tracing or https://ui.perfetto.dev)
+and clears them. Outside a report, e.g. when the instrumented library functions are
+called from a notebook or a sweep, nothing is measured or kept.
+`check_stage_budgets` raises when a stage exceeds its wall-time budget, to enforce
+SLOs on the nightly job. The pipeline scripts check their stages after writing the
+report against PIPELINE_STAGE_BUDGETS, comma separated `stage=seconds` pairs, e.g. in
+`.env`:
+
+    PIPELINE_STAGE_BUDGETS=forwards=30,summary_tables=5
+
+Set PIPELINE_INSTRUMENT=False to turn the recording off. Stages listed in
+PIPELINE_PROFILE are also profiled (see `profiling.py`).
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+import psutil
+
+import profiling
+from settings import config
+
+PIPELINE_INSTRUMENT = config("PIPELINE_INSTRUMENT")
+PIPELINE_TRACEMALLOC = config("PIPELINE_TRACEMALLOC")
+STAGE_BUDGETS = {
+    name.strip(): float(seconds)
+    for name, _, seconds in (
+        item.partition("=") for item in config("PIPELINE_STAGE_BUDGETS").split(",")
+    )
+    if name.strip()
+}
+
+_MB = 1024 * 1024
+_PROCESS = psutil.Process()
+_RUN_START = time.perf_counter()
+_RECORDS = []
+_ACTIVE = []
+_RECORDING = False
+
+
+def _peak_rss_mb():
+    """Process high-water mark of the resident set size."""
+    if sys.platform == "win32":
+        return _PROCESS.memory_info().peak_wset / _MB
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / _MB if sys.platform == "darwin" else peak / 1024
+
+
+def begin_stage(name):
+    """Starts timing a stage. Returns a token to pass to `end_stage`."""
+    profile = profiling.start_profile(name)
+    if not (PIPELINE_INSTRUMENT and _RECORDING):
+        return {"profile": profile} if profile is not None else None
+    if PIPELINE_TRACEMALLOC:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+    token = {
+        "stage": name,
+        "parent": _ACTIVE[-1]["stage"] if _ACTIVE else None,
+        "start": time.perf_counter(),
+        "cpu_start": time.process_time(),
+        "rss_start": _PROCESS.memory_info().rss,
+        "traced_start": tracemalloc.get_traced_memory()[0]
+        if PIPELINE_TRACEMALLOC
+        else None,
+        "profile": profile,
+    }
+    _ACTIVE.append(token)
+    return token
+
+
+def end_stage(token, rows=None):
+    """Stops timing the stage started with `begin_stage` and stores its record."""
+    if token is None:
+        return None
+    profiling.stop_profile(token["profile"])
+    if "start" not in token:
+        return None
+    end = time.perf_counter()
+    rss = _PROCESS.memory_info().rss
+    record = {
+        "stage": token["stage"],
+        "parent": token["parent"],
+        "start_s": token["start"] - _RUN_START,
+        "wall_s": end - token["start"],
+        "cpu_s": time.process_time() - token["cpu_start"],
+        "rss_mb": rss / _MB,
+        "rss_delta_mb": (rss - token["rss_start"]) / _MB,
+        "peak_rss_mb": _peak_rss_mb(),
+        "tracemalloc_peak_mb": None,
+        "rows": rows,
+        "thread": threading.get_ident(),
+    }
+    if token["traced_start"] is not None:
+        _, peak = tracemalloc.get_traced_memory()
+        record["tracemalloc_peak_mb"] = (peak - token["traced_start"]) / _MB
+    if token in _ACTIVE:
+        _ACTIVE.remove(token)
+    _RECORDS.append(record)
+    return record
+
+
+@contextmanager
+def stage(name, rows=None):
+    """
+    Context manager recording one stage. Set `rows` on the yielded dict to record the
+    number of rows produced:
+
+    ```
+    with stage("load") as info:
+        df = pd.read_parquet(path)
+        info["rows"] = len(df)
+    ```
+    """
+    token = begin_stage(name)
+    info = {"rows": rows}
+    try:
+        yield info
+    finally:
+        end_stage(token, rows=info["rows"])
+
+
+def instrumented(name=None):
+    """
+    Decorator recording every call of a function as a stage. The number of rows is
+    taken from the length of the returned object when it has one.
+    """
+
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            token = begin_stage(stage_name)
+            rows = None
+            try:
+                result = func(*args, **kwargs)
+                rows = len(result) if hasattr(result, "__len__") else None
+                return result
+            finally:
+                end_stage(token, rows=rows)
+
+        return wrapper
+
+    return decorator
+
+
+def stage_records():
+    """Copy of the stage records of the current run."""
+    return [dict(record) for record in _RECORDS]
+
+
+def start_stage_report():
+    """Clears the stage records and records the stages run from now on."""
+    global _RECORDING
+    reset_stages()
+    _RECORDING = True
+
+
+def reset_stages():
+    """Clears the stage records and stops recording."""
+    global _RUN_START, _RECORDING
+    _RECORDS.clear()
+    _ACTIVE.clear()
+    _RUN_START = time.perf_counter()
+    _RECORDING = False
+
+
+def chrome_trace(records=None):
+    """Converts stage records to the Chrome trace event format (complete events)."""
+    records = stage_records() if records is None else records
+    pid = os.getpid()
+    events = []
+    for record in records:
+        args = {
+            k: v
+            for k, v in record.items()
+            if k not in ("stage", "start_s", "wall_s", "thread") and v is not None
+        }
+        events.append(
+            {
+                "name": record["stage"],
+                "cat": "pipeline",
+                "ph": "X",
+                "ts": record["start_s"] * 1e6,
+                "dur": record["wall_s"] * 1e6,
+                "pid": pid,
+                "tid": record["thread"],
+                "args": args,
+            }
+        )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def write_stage_report(path_stem, records=None):
+    """
+    Writes the stage records to `<path_stem>.json` and `<path_stem>.trace.json`.
+    Without `records`, writes the records of the current report and ends it.
+
+    Returns:
+    - list of the written paths.
+    """
+    if records is None:
+        records = stage_records()
+        reset_stages()
+    path_stem = Path(path_stem)
+    path_stem.parent.mkdir(parents=True, exist_ok=True)
+    report = {
+        "script": Path(sys.argv[0]).name,
+        "pid": os.getpid(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "stages": records,
+    }
+    json_path = path_stem.with_name(path_stem.name + ".json")
+    trace_path = path_stem.with_name(path_stem.name + ".trace.json")
+    json_path.write_text(json.dumps(report, indent=2))
+    trace_path.write_text(json.dumps(chrome_trace(records)))
+    return [json_path, trace_path]
+
+
+def check_stage_budgets(budgets=None, records=None):
+    """
+    Checks the total wall time of each stage against `budgets` (stage -> seconds),
+    by default STAGE_BUDGETS from PIPELINE_STAGE_BUDGETS.
+
+    Raises:
+    - RuntimeError listing every stage over budget.
+    """
+    budgets = STAGE_BUDGETS if budgets is None else budgets
+    records = stage_records() if records is None else records
+    totals = {}
+    for record in records:
+        totals[record["stage"]] = totals.get(record["stage"], 0.0) + record["wall_s"]
+    over = [
+        f"{name}: {totals[name]:.3f}s > {budget:.3f}s"
+        for name, budget in budgets.items()
+        if totals.get(name, 0.0) > budget
+    ]
+    if over:
+        raise RuntimeError("Stages over their time budget: " + "; ".join(over))
@@ -8,9 +8,6 @@ import polars as pl
 from matplotlib import pyplot as plt
 import matplotlib.dates as mdates
 
-from dateutil.relativedelta import relativedelta
-import datetime
-
 
 ########################################################################################
 ## Pandas Helpers
@@ -83,6 +80,82 @@ def df_to_literal(df, missing_value="None"):
     return output
 
 
+def hash_rows(df, columns=None, as_float=()):
+    """64-bit hash of each row of `df` (of `columns` only, if given), ignoring the index.
+
+    Equal rows get equal hashes (missing values in the same places and 0.0 / -0.0
+    count as equal, as in a merge), so comparing hashes replaces merging on all the
+    columns. Integer and boolean columns are hashed by value (int32, int64, Int64 and
+    bool hash alike) and float columns as float64. The integer columns listed in
+    `as_float` are hashed as float64 too, so they match a float column of the other
+    frame (see `hash_alignment`); other values are hashed with their dtype. Different
+    rows collide with probability about n**2 / 2**65, negligible for comparing data
+    frames.
+
+    Examples
+    --------
+    ```
+    >>> df = pd.DataFrame({'a': [1, 2, 1], 'b': ['x', 'y', 'x']})
+    >>> h = hash_rows(df)
+    >>> bool(h[0] == h[2]), bool(h[0] == h[1])
+    (True, False)
+    >>> floats = df.astype({'a': float})
+    >>> bool(hash_rows(df, as_float=['a'])[0] == hash_rows(floats, as_float=['a'])[0])
+    True
+
+    ```
+    """
+    if isinstance(columns, str):
+        columns = [columns]
+    data = df if columns is None else df[columns]
+    casts = {}
+    for col, dtype in data.dtypes.items():
+        kind = _hash_kind(dtype)
+        if kind == "float" or (kind == "int" and col in as_float):
+            casts[col] = np.float64
+        elif pd.api.types.is_bool_dtype(dtype):
+            casts[col] = "Int64"
+    if casts:
+        data = data.astype(casts)
+        floats = [col for col, dtype in casts.items() if dtype is np.float64]
+        # -0.0 == 0.0 but they hash differently; adding 0.0 turns -0.0 into 0.0
+        data[floats] = data[floats] + 0.0
+    return pd.util.hash_pandas_object(data, index=False).to_numpy()
+
+
+def _hash_kind(dtype):
+    """How `hash_rows` hashes a column of `dtype`: "int", "float" or by its dtype."""
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return "int"
+    if pd.api.types.is_float_dtype(dtype):
+        return "float"
+    return str(dtype)
+
+
+def hash_alignment(left_dtypes, right_dtypes):
+    """
+    Aligns the hashes of two frames with the same columns, given their dtypes.
+
+    Returns:
+    - (as_float, comparable): the columns to pass as `as_float` to `hash_rows` on
+      both sides (integer on one side, float on the other) and whether all the other
+      columns hash alike on both sides.
+    """
+    as_float = []
+    comparable = len(left_dtypes) == len(right_dtypes)
+    for col, left, right in zip(left_dtypes.index, left_dtypes, right_dtypes):
+        kinds = {_hash_kind(left), _hash_kind(right)}
+        if kinds == {"int", "float"}:
+            as_float.append(col)
+        elif len(kinds) > 1:
+            comparable = False
+    return as_float, comparable
+
+
+def _dtypes(df, columns=None):
+    return df.dtypes if columns is None else df[columns].dtypes
+
+
 def merge_stats(df_left, df_right, on=[]):
     """Provide statistics to assess the completeness of the merge.
 
@@ -102,11 +175,26 @@ def merge_stats(df_left, df_right, on=[]):
     'intersection/left': percentage of matched based on total in left index
     'intersection/right': percentage of matched based on total in right index
 
+    The keys are compared through `hash_rows` of the `on` columns (all columns when
+    `on` is empty), or through indexes of the key values when the key columns would
+    hash with different dtypes on the two sides.
+
     """
-    left_index = df_left.set_index(on).index.unique()
-    right_index = df_right.set_index(on).index.unique()
-    union = left_index.union(right_index)
-    intersection = left_index.intersection(right_index)
+    keys = on or None
+    as_float, comparable = hash_alignment(
+        _dtypes(df_left, keys), _dtypes(df_right, keys)
+    )
+    if comparable:
+        # Unique keys as 64-bit row hashes instead of (multi-)indexes of the keys
+        left_index = np.unique(hash_rows(df_left, keys, as_float))
+        right_index = np.unique(hash_rows(df_right, keys, as_float))
+        intersection = np.intersect1d(left_index, right_index, assume_unique=True)
+        union = np.union1d(left_index, right_index)
+    else:
+        left_index = df_left.set_index(on).index.unique()
+        right_index = df_right.set_index(on).index.unique()
+        union = left_index.union(right_index)
+        intersection = left_index.intersection(right_index)
     stats = [
         "union",
         "intersection",
@@ -137,6 +225,11 @@ def dataframe_set_difference(dff, df, library="pandas", show="rows_and_numbers")
     """
     Gives the rows that appear in dff but not in df
 
+    With library="pandas" the rows are compared through `hash_rows` (or merged when
+    the columns would hash with different dtypes in dff and df) and the row numbers
+    are the index labels of dff. See `frame_diff.py` for keyed comparisons and
+    frames larger than memory.
+
     Example
     -------
     ```
@@ -144,21 +237,19 @@ def dataframe_set_difference(dff, df, library="pandas", show="rows_and_numbers")
     ```
     """
     if library == "pandas":
-        # Reset index to ensure the row numbers are captured as a column
-        # This is important for tracking the original row numbers after operations
-        dff_reset = dff.reset_index().rename(columns={"index": "original_row_number"})
-        df_reset = df.reset_index(drop=True)
-
-        # Perform an outer merge with an indicator to identify rows present only in dff
-        merged = dff_reset.merge(
-            df_reset, how="left", indicator=True, on=dff.columns.tolist()
-        )
-
-        # Filter to rows only in dff (left_only)
-        only_in_dff = merged[merged["_merge"] == "left_only"]
-
-        # Extract the original row numbers of these rows
-        row_numbers = only_in_dff["original_row_number"].tolist()
+        columns = dff.columns.tolist()
+        as_float, comparable = hash_alignment(dff.dtypes, _dtypes(df, columns))
+        if comparable:
+            # Anti-join on row hashes instead of merging on all the columns
+            missing = ~np.isin(
+                hash_rows(dff, as_float=as_float), hash_rows(df, columns, as_float)
+            )
+        else:
+            merged = dff.reset_index(drop=True).merge(
+                df[columns].drop_duplicates(), how="left", indicator=True
+            )
+            missing = (merged["_merge"] == "left_only").to_numpy()
+        row_numbers = dff.index[missing].tolist()
         ret = row_numbers
 
     elif library == "polars":
@@ -185,7 +276,7 @@ def dataframe_set_difference(dff, df, library="pandas", show="rows_and_numbers")
     else:
         raise ValueError("Unknown library")
     if show == "rows_and_numbers":
-        rows = dff[row_numbers]
+        rows = dff.loc[row_numbers] if library == "pandas" else dff[row_numbers]
         ret = row_numbers, rows
 
     return ret
@@ -237,6 +328,107 @@ def move_columns_to_front(df, cols=[]):
         move_column_inplace(df, col, pos=0)
 
 
+def _group_codes(data, by_col):
+    """Integer group codes of `data` grouped by `by_col`, and the sorted group index.
+
+    Rows with a missing group key, which `ngroup` marks with NaN, get code -1.
+    """
+    grouped = data.groupby(by_col, sort=True)
+    codes = grouped.ngroup().fillna(-1).to_numpy(dtype=np.intp)
+    return codes, grouped.size().index
+
+
+def groupby_weighted_moments(
+    data_cols=None, weight_col=None, by_col=None, data=None, ddof=1
+):
+    """
+    Grouped weighted count, weight sum, mean, variance and standard deviation of
+    several data columns at once.
+
+    The groups are factorized once and every statistic is a `np.bincount` reduction
+    over the group codes, so no Python function runs per group and `data` is not
+    modified. Rows where the data value or the weight is missing are skipped.
+
+    The variance follows `groupby_weighted_std`: sum(w * (x - mean) ** 2) divided by
+    ((n - ddof) / n) * sum(w), where n counts the observations of the group.
+
+    Parameters
+    ----------
+    data_cols : str or list
+        column(s) to summarize
+    weight_col : str
+        column holding the weights
+    by_col : str, list or None
+        grouping column(s); None treats `data` as a single group
+    data : pandas.DataFrame
+    ddof : int, Default 1
+        delta degrees of freedom of the variance
+
+    Returns
+    -------
+    pandas.DataFrame
+        indexed by group, with (data column, statistic) columns for the statistics
+        count, weight_sum, mean, var and std.
+
+    Examples
+    --------
+
+    ```
+    >>> df = pd.DataFrame({
+    ...     'trade_direction': ['RECEIVED', 'RECEIVED', 'DELIVERED', 'DELIVERED'],
+    ...     'rate': [2.0, 3.0, 2.0, 3.0],
+    ...     'start_leg_amount': [100, 300, 100, 100]},
+    ... )
+    >>> moments = groupby_weighted_moments(
+    ...     data=df, data_cols='rate', weight_col='start_leg_amount', by_col='trade_direction')
+    >>> moments['rate'][['count', 'weight_sum', 'mean', 'std']].reset_index()
+      trade_direction  count  weight_sum  mean       std
+    0       DELIVERED      2       200.0  2.50  0.707107
+    1        RECEIVED      2       400.0  2.75  0.612372
+
+    ```
+    """
+    if isinstance(data_cols, str):
+        data_cols = [data_cols]
+    if by_col is None:
+        codes = np.zeros(len(data), dtype=np.intp)
+        index = pd.RangeIndex(1)
+    else:
+        codes, index = _group_codes(data, by_col)
+    # Rows with a missing group key (code -1) go to an extra bin that is dropped
+    n_groups = len(index)
+    codes = np.where(codes < 0, n_groups, codes)
+
+    weights = data[weight_col].to_numpy(dtype=np.float64)
+    columns = {}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for col in data_cols:
+            values = data[col].to_numpy(dtype=np.float64)
+            valid = ~(np.isnan(values) | np.isnan(weights))
+            w = np.where(valid, weights, 0.0)
+            x = np.where(valid, values, 0.0)
+
+            count = np.bincount(codes, valid, minlength=n_groups + 1)[:n_groups]
+            weight_sum = np.bincount(codes, w, minlength=n_groups + 1)[:n_groups]
+            mean = np.bincount(codes, w * x, minlength=n_groups + 1)[:n_groups]
+            mean = mean / weight_sum
+            # Second pass on the deviations from the group mean, for stability
+            deviation = x - np.append(mean, np.nan)[codes]
+            squares = np.where(valid, w * deviation**2, 0.0)
+            numer = np.bincount(codes, squares, minlength=n_groups + 1)[:n_groups]
+            denom = (count - ddof) / count * weight_sum
+            var = np.where(count > ddof, numer / denom, np.nan)
+
+            columns[(col, "count")] = count.astype(np.int64)
+            columns[(col, "weight_sum")] = weight_sum
+            columns[(col, "mean")] = mean
+            columns[(col, "var")] = var
+            columns[(col, "std")] = np.sqrt(var)
+    result = pd.DataFrame(columns, index=index)
+    result.columns = pd.MultiIndex.from_tuples(result.columns)
+    return result
+
+
 def weighted_average(data_col=None, weight_col=None, data=None):
     """Simple calculation of weighted average.
 
@@ -252,15 +444,8 @@ def weighted_average(data_col=None, weight_col=None, data=None):
 
     ```
     """
-
-    def weights_function(row):
-        return data.loc[row.index, weight_col]
-
-    def wm(row):
-        return np.average(row, weights=weights_function(row))
-
-    result = wm(data[data_col])
-    return result
+    moments = groupby_weighted_moments(data_col, weight_col, data=data)
+    return float(moments[(data_col, "mean")].iloc[0])
 
 
 def groupby_weighted_average(
@@ -274,8 +459,7 @@ def groupby_weighted_average(
     """
     Faster method for calculating grouped weighted average.
 
-    From:
-    https://stackoverflow.com/a/44683506
+    Uses `groupby_weighted_moments` and does not modify `data`.
 
     Examples
     --------
@@ -295,18 +479,14 @@ def groupby_weighted_average(
     ```
 
     """
-    data["_data_times_weight"] = data[data_col] * data[weight_col]
-    data["_weight_where_notnull"] = data[weight_col] * pd.notnull(data[data_col])
-    g = data.groupby(by_col)
-    result = g["_data_times_weight"].sum() / g["_weight_where_notnull"].sum()
-    del data["_data_times_weight"], data["_weight_where_notnull"]
+    moments = groupby_weighted_moments(data_col, weight_col, by_col, data)
+    result = moments[(data_col, "mean")].rename(None)
 
     if transform:
-        result.name = f"__{data_col}"
-        result = data.merge(result.reset_index(), how="left", on=by_col)[
-            f"__{data_col}"
-        ]
-        result.name = new_column_name
+        # Code -1 (missing group key) picks the appended NaN
+        codes, _ = _group_codes(data, by_col)
+        values = np.append(result.to_numpy(), np.nan)[codes]
+        result = pd.Series(values, index=data.index, name=new_column_name)
 
     return result
 
@@ -317,8 +497,7 @@ def groupby_weighted_std(
     """
     Method for calculating grouped weighted standard devation.
 
-    From:
-    https://stackoverflow.com/a/72915123
+    Uses `groupby_weighted_moments`, see there for the definition.
 
     Examples
     --------
@@ -352,19 +531,8 @@ def groupby_weighted_std(
     ```
 
     """
-
-    def weighted_sd(input_df):
-        weights = input_df[weight_col]
-        vals = input_df[data_col]
-
-        weighted_avg = np.average(vals, weights=weights)
-
-        numer = np.sum(weights * (vals - weighted_avg) ** 2)
-        denom = ((vals.count() - ddof) / vals.count()) * np.sum(weights)
-
-        return np.sqrt(numer / denom)
-
-    return data.groupby(by_col).apply(weighted_sd)
+    moments = groupby_weighted_moments(data_col, weight_col, by_col, data, ddof=ddof)
+    return moments[(data_col, "std")].rename(None)
 
 
 def weighted_quantile(
@@ -396,11 +564,8 @@ def weighted_quantile(
 
     FROM: https://stackoverflow.com/a/29677616
 
-    NOTE: that a groupby weighted quantile can look like this:
-    ```
-    median_SD_spread = data.groupby('date').apply(
-        lambda x: weighted_quantile(x['rate_SD_spread'], 0.5, sample_weight=x['Volume']))
-    ```
+    NOTE: for quantiles by group use `groupby_weighted_quantile`, which sorts all
+    groups at once instead of calling this function in `groupby().apply`.
     """
     values = np.array(values)
     quantiles = np.array(quantiles)
@@ -426,20 +591,159 @@ def weighted_quantile(
     return np.interp(quantiles, weighted_quantiles, values)
 
 
+def groupby_weighted_quantile(
+    data_col=None,
+    quantiles=0.5,
+    weight_col=None,
+    by_col=None,
+    data=None,
+    old_style=False,
+):
+    """Grouped version of `weighted_quantile`, computing many quantiles for all groups
+    at once.
+
+    The rows are sorted once by (group, value). Cumulative weights
+    within each group come from one cumulative sum minus the group offsets, and each
+    quantile is interpolated between the two bracketing observations of its group,
+    as `np.interp` does in `weighted_quantile`. Rows with a missing value or weight
+    are skipped.
+
+    Parameters
+    ----------
+    data_col : str
+        column with the values
+    quantiles : float or array-like
+        quantile(s) in [0, 1]
+    weight_col : str or None
+        column with the weights; None weights all rows equally
+    by_col : str or list
+        grouping column(s)
+    data : pandas.DataFrame
+    old_style : bool, Default False
+        if True, will correct output to be consistent with numpy.percentile.
+
+    Returns
+    -------
+    pandas.DataFrame
+        indexed by group, with one column per quantile.
+
+    Examples
+    --------
+
+    ```
+    >>> df = pd.DataFrame({
+    ...     'date': ['2020-01-02'] * 4 + ['2020-01-03'] * 2,
+    ...     'spread': [1.0, 2.0, 3.0, 4.0, 3.0, 5.0],
+    ...     'volume': [1, 1, 1, 1, 2, 2]},
+    ... )
+    >>> groupby_weighted_quantile(
+    ...     'spread', [0.25, 0.5, 0.75], 'volume', 'date', df).reset_index()
+             date  0.25  0.5  0.75
+    0  2020-01-02   1.5  2.5   3.5
+    1  2020-01-03   3.0  4.0   5.0
+    >>> weighted_quantile([1.0, 2.0, 3.0, 4.0], [0.25, 0.5, 0.75])
+    array([1.5, 2.5, 3.5])
+
+    ```
+    """
+    scalar = np.ndim(quantiles) == 0
+    quantiles = np.atleast_1d(np.asarray(quantiles, dtype=np.float64))
+    assert np.all(quantiles >= 0) and np.all(
+        quantiles <= 1
+    ), "quantiles should be in [0, 1]"
+
+    values = data[data_col].to_numpy(dtype=np.float64)
+    if weight_col is None:
+        weights = np.ones(len(data))
+    else:
+        weights = data[weight_col].to_numpy(dtype=np.float64)
+    valid = ~(np.isnan(values) | np.isnan(weights))
+    codes, index = _group_codes(data[valid], by_col)
+    keep = codes >= 0
+    codes, values, weights = codes[keep], values[valid][keep], weights[valid][keep]
+
+    # Same order as np.lexsort((values, codes)), but the stable sort of the integer
+    # codes is a radix sort and this is about twice as fast
+    order = np.argsort(values)
+    order = order[np.argsort(codes[order], kind="stable")]
+    codes, values, weights = codes[order], values[order], weights[order]
+    n_groups = len(index)
+    counts = np.bincount(codes, minlength=n_groups)
+    first = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    last = first + counts - 1
+    totals = np.bincount(codes, weights, minlength=n_groups)
+
+    # Cumulative weight within each group, at the middle of each observation
+    cumulative = np.cumsum(weights)
+    offsets = cumulative[first] - weights[first]
+    positions = cumulative - offsets[codes] - 0.5 * weights
+    if old_style:
+        positions = positions - positions[first][codes]
+        positions = positions / positions[last][codes]
+    else:
+        positions = positions / totals[codes]
+
+    result = np.empty((n_groups, len(quantiles)))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for j, q in enumerate(quantiles):
+            # Observations of each group at or below the quantile, i.e. the bracket
+            below = np.bincount(codes, positions <= q, minlength=n_groups).astype(int)
+            lo = np.clip(first + below - 1, first, last)
+            hi = np.clip(first + below, first, last)
+            slope = (values[hi] - values[lo]) / (positions[hi] - positions[lo])
+            interpolated = values[lo] + (q - positions[lo]) * slope
+            result[:, j] = np.where(hi == lo, values[lo], interpolated)
+    result = pd.DataFrame(result, index=index, columns=quantiles)
+    return result.iloc[:, 0].rename(None) if scalar else result
+
+
 _alphabet = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ*@#"
 
 
-@np.vectorize
+# Value of each character of _alphabet by byte; -1 marks invalid characters and the
+# null padding of fixed-width byte strings is worth 0
+_alphabet_values = np.full(256, -1, dtype=np.int64)
+_alphabet_values[np.frombuffer(_alphabet.encode(), dtype=np.uint8)] = np.arange(
+    len(_alphabet)
+)
+_alphabet_values[0] = 0
+
+
 def calc_check_digit(number):
     """Calculate the check digits for the 8-digit cusip.
-    This function is taken from
+    This function is adapted from
     https://github.com/arthurdejong/python-stdnum/blob/master/stdnum/cusip.py
+
+    Works on a single string or on an array/Series of strings at once: the strings
+    are viewed as a fixed-width byte matrix, the characters are mapped to their values
+    through a lookup table, every second one is doubled and the digits of the products
+    are summed with NumPy.
+
+    Examples
+    --------
+    ```
+    >>> calc_check_digit('03783310')
+    '0'
+    >>> calc_check_digit(pd.Series(['03783310', '59491810', '46625H10']))
+    array(['0', '4', '0'], dtype='<U1')
+
+    ```
     """
-    # convert to numeric first, then sum individual digits
-    number = "".join(
-        str((1, 2)[i % 2] * _alphabet.index(n)) for i, n in enumerate(number)
-    )
-    return str((10 - sum(int(n) for n in number)) % 10)
+    scalar = isinstance(number, str)
+    try:
+        codes = np.asarray([number] if scalar else number, dtype=np.bytes_)
+    except UnicodeEncodeError as e:
+        raise ValueError("CUSIPs may only contain ASCII characters") from e
+    width = codes.dtype.itemsize
+    chars = codes.view(np.uint8).reshape(len(codes), width)
+    values = _alphabet_values[chars]
+    if (values < 0).any():
+        raise ValueError(f"CUSIPs may only contain the characters {_alphabet}")
+    # convert to numeric first, then sum individual digits (products are below 100)
+    products = values * np.tile([1, 2], (width + 1) // 2)[:width]
+    digit_sum = (products // 10 + products % 10).sum(axis=1)
+    check = np.array(list("0123456789"))[(10 - digit_sum) % 10]
+    return str(check[0]) if scalar else check
 
 
 def convert_cusips_from_8_to_9_digit(cusip_8dig_series):
@@ -489,6 +793,21 @@ def _with_lagged_column_no_resample(
     return lag_sub_df
 
 
+def _period_ordinals(dates, freq):
+    """
+    Position of the resample bin of each date among all bins from the first to the
+    last date, and the bin labels, as `df.resample(freq)` would bin them.
+    """
+    dates = pd.DatetimeIndex(dates)
+    grouper = pd.Grouper(freq=freq)
+    bins = pd.Series(0, index=dates.dropna()).resample(freq).size().index
+    if grouper.closed == "right":
+        ordinals = bins.searchsorted(dates, side="left")
+    else:
+        ordinals = bins.searchsorted(dates, side="right") - 1
+    return np.where(dates.isna(), -1, ordinals), bins
+
+
 def with_lagged_columns(
     df=None,
     column_to_lag=None,
@@ -502,6 +821,9 @@ def with_lagged_columns(
     """
     Add lagged columns to a dataframe, respecting frequency of the data.
 
+    `column_to_lag` and `id_column` can be a column name or a list of them, and
+    `lags` an int or a list of ints.
+
     Examples
     --------
 
@@ -536,14 +858,14 @@ def with_lagged_columns(
     >>> df_lag
       id       date  value  L1_value
     0  A 1990-01-01      1       NaN
-    1  A 1990-02-01      2      1.00
-    2  A 1990-03-01      3      2.00
+    1  A 1990-02-01      2       1.0
+    2  A 1990-03-01      3       2.0
     3  B 1989-12-01     12       NaN
-    4  B 1990-01-01      1     12.00
-    5  B 1990-02-01      2      1.00
-    6  B 1990-03-01      3      2.00
-    7  B 1990-04-01      4      3.00
-    8  B 1990-06-01      6      4.00
+    4  B 1990-01-01      1      12.0
+    5  B 1990-02-01      2       1.0
+    6  B 1990-03-01      3       2.0
+    7  B 1990-04-01      4       3.0
+    8  B 1990-06-01      6       4.0
 
     The issue with leaving out the resample is that the lagged value
     for 1990-06-01 is 4.0, but it should be NaN. This is because the
@@ -554,20 +876,34 @@ def with_lagged_columns(
     >>> df_lag = with_lagged_columns(df=df, column_to_lag='value', id_column='id', lags=1, freq="MS", resample=True)
     >>> df_lag
        id       date  value  L1_value
-    2   A 1990-01-01   1.00       NaN
-    4   A 1990-02-01   2.00      1.00
-    6   A 1990-03-01   3.00      2.00
-    8   A 1990-04-01    NaN      3.00
-    1   B 1989-12-01  12.00       NaN
-    3   B 1990-01-01   1.00     12.00
-    5   B 1990-02-01   2.00      1.00
-    7   B 1990-03-01   3.00      2.00
-    9   B 1990-04-01   4.00      3.00
-    11  B 1990-05-01    NaN      4.00
-    13  B 1990-06-01   6.00       NaN
+    0   A 1990-01-01    1.0       NaN
+    1   A 1990-02-01    2.0       1.0
+    2   A 1990-03-01    3.0       2.0
+    3   A 1990-04-01    NaN       3.0
+    4   B 1989-12-01   12.0       NaN
+    5   B 1990-01-01    1.0      12.0
+    6   B 1990-02-01    2.0       1.0
+    7   B 1990-03-01    3.0       2.0
+    8   B 1990-04-01    4.0       3.0
+    9   B 1990-05-01    NaN       4.0
+    10  B 1990-06-01    6.0       NaN
+
+    Several columns and lags can be built at once:
+
+    >>> df['value_sq'] = df['value'] ** 2
+    >>> df_lag = with_lagged_columns(df=df, column_to_lag=['value', 'value_sq'],
+    ...     id_column='id', lags=[1, 2], freq="MS")
+    >>> list(df_lag.columns)
+    ['id', 'date', 'value', 'value_sq', 'L1_value', 'L1_value_sq', 'L2_value', 'L2_value_sq']
 
     ```
 
+    With resample=True, each row gets the ordinal of its `freq` period (the bin
+    `df.resample(freq)` puts it in) and the lagged values are found with a sorted
+    outer merge on (id, period - lag). Unlike pivoting the panel wide, the memory
+    used grows with the number of rows, not with ids x periods. Rows are added for
+    periods that only have a lagged value, as in the example above.
+
     Some valid frequencies are
     ```
     # "B": Business Day
@@ -596,24 +932,48 @@ def with_lagged_columns(
     as seen here: https://business-science.github.io/pytimetk/guides/03_pandas_frequency.html
 
     """
-    if resample:
-        df_wide = df.pivot(index=date_col, columns=id_column, values=column_to_lag)
-        new_col = f"{prefix}{lags}_{column_to_lag}"
-        df_resampled = df_wide.resample(freq).last()
-        df_lagged = df_resampled.shift(lags)
-        df_lagged = df_lagged.stack(dropna=False).reset_index(name=new_col)
-        df_lagged = df.merge(df_lagged, on=[date_col, id_column], how="right")
-        df_lagged = df_lagged.dropna(subset=[column_to_lag, new_col], how="all")
-        df_lagged = df_lagged.sort_values(by=[id_column, date_col])
-    else:
-        df_lagged = _with_lagged_column_no_resample(
-            df=df,
-            columns_to_lag=[column_to_lag],
-            id_columns=[id_column],
-            lags=lags,
-            date_col=date_col,
-            prefix=prefix,
+    columns_to_lag = [column_to_lag] if isinstance(column_to_lag, str) else column_to_lag
+    id_columns = [id_column] if isinstance(id_column, str) else id_column
+    lag_list = [lags] if np.ndim(lags) == 0 else list(lags)
+    if not resample:
+        df_lagged = df
+        for lag in lag_list:
+            df_lagged = _with_lagged_column_no_resample(
+                df=df_lagged,
+                columns_to_lag=columns_to_lag,
+                id_columns=id_columns,
+                lags=lag,
+                prefix=prefix,
+            )
+        return df_lagged
+    if freq is None:
+        raise ValueError("freq is required when resample=True")
+
+    ordinals, bins = _period_ordinals(df[date_col], freq)
+    keys = [*id_columns, "_period"]
+    base = df.assign(_period=ordinals)
+    base = base[base["_period"] >= 0]
+    # The last observation of each id in each period, as resample(freq).last()
+    source = base.sort_values(date_col, kind="stable").drop_duplicates(
+        keys, keep="last"
+    )[[*keys, *columns_to_lag]]
+
+    df_lagged = base
+    new_cols = []
+    for lag in lag_list:
+        lagged = source.assign(_period=source["_period"] + lag)
+        lagged = lagged[lagged["_period"] < len(bins)]
+        renamed = {col: f"{prefix}{lag}_{col}" for col in columns_to_lag}
+        new_cols += renamed.values()
+        df_lagged = df_lagged.merge(
+            lagged.rename(columns=renamed), on=keys, how="outer", sort=True
         )
+    # Periods only reached through a lag get the bin label as date
+    missing_date = df_lagged[date_col].isna()
+    df_lagged.loc[missing_date, date_col] = bins[df_lagged.loc[missing_date, "_period"]]
+    df_lagged = df_lagged.dropna(subset=[*columns_to_lag, *new_cols], how="all")
+    df_lagged = df_lagged.sort_values(by=[*id_columns, date_col], kind="stable")
+    df_lagged = df_lagged.drop(columns="_period").reset_index(drop=True)
 
     return df_lagged
 
@@ -627,6 +987,11 @@ def leave_one_out_sums(df, groupby=[], summed_col=""):
     This is helpful for constructing the shift-share instruments
     in Borusyak, Hull, Jaravel (2022).
 
+    Several columns can be passed as a list to get a DataFrame. The sum uses the
+    built-in `transform("sum")` instead of a Python function per group. As with
+    `x.sum() - x`, missing values are left out of the group sums and rows whose own
+    value is missing get NaN.
+
     Examples
     --------
 
@@ -653,8 +1018,143 @@ def leave_one_out_sums(df, groupby=[], summed_col=""):
     ```
 
     """
-    s = df.groupby(groupby)[summed_col].transform(lambda x: x.sum() - x)
-    return s
+    total = df.groupby(groupby)[summed_col].transform("sum")
+    return total - df[summed_col]
+
+
+def leave_one_out_counts(df, groupby=[], counted_col=""):
+    """
+    Number of other non-missing observations of the group of each row.
+
+    Examples
+    --------
+
+    ```
+    >>> df = pd.DataFrame({
+    ...     'B' : ['one', 'one', 'one', 'two', 'two'],
+    ...     'C' : [1, np.nan, 5, 2, 5],
+    ...                })
+    >>> leave_one_out_counts(df, groupby=['B'], counted_col='C').tolist()
+    [1, 2, 1, 1, 1]
+
+    ```
+
+    """
+    count = df.groupby(groupby)[counted_col].transform("count")
+    return count - df[counted_col].notna().astype(int)
+
+
+def leave_one_out_means(df, groupby=[], averaged_col=""):
+    """
+    Mean of the other observations of the group of each row, i.e. the leave-one-out
+    sum divided by the leave-one-out count.
+
+    Missing values are skipped; a row whose own value is missing gets the mean of all
+    the other observations of its group. Rows without other observations get NaN.
+
+    Examples
+    --------
+
+    ```
+    >>> df = pd.DataFrame({
+    ...     'B' : ['one', 'one', 'one', 'two', 'two', 'three'],
+    ...     'C' : [1, np.nan, 5, 2, 5, 4],
+    ...     'D' : [2.0, 5., 8., 1., 2., 9.],
+    ...                })
+    >>> leave_one_out_means(df, groupby='B', averaged_col=['C', 'D'])
+         C    D
+    0  5.0  6.5
+    1  3.0  5.0
+    2  1.0  3.5
+    3  5.0  2.0
+    4  2.0  1.0
+    5  NaN  NaN
+
+    ```
+
+    """
+    grouped = df.groupby(groupby)[averaged_col]
+    values = df[averaged_col]
+    sums = grouped.transform("sum") - values.fillna(0)
+    counts = grouped.transform("count") - values.notna().astype(int)
+    return sums / counts.where(counts > 0)
+
+
+def _month_numbers(dates):
+    """
+    Months since 1970-01 of each date, a mask of the missing dates and the time zone of
+    the dates. Time-zone aware dates are taken in their wall time, not in UTC.
+    """
+    dates = pd.DatetimeIndex(dates)
+    tz = dates.tz
+    if tz is not None:
+        dates = dates.tz_localize(None)
+    dates = dates.to_numpy(dtype="datetime64[ns]")
+    return dates.astype("datetime64[M]").astype(np.int64), np.isnat(dates), tz
+
+
+def _first_days(months, missing, tz, days_offset=0):
+    """First day of each month number, shifted by `days_offset` days, in `tz`."""
+    days = months.astype("datetime64[M]").astype("datetime64[D]") + days_offset
+    days = np.where(missing, np.datetime64("NaT"), days).astype("datetime64[ns]")
+    return pd.DatetimeIndex(days).tz_localize(tz)
+
+
+def get_most_recent_quarter_ends(dates):
+    """
+    Array version of `get_most_recent_quarter_end`: the last day of the previous
+    quarter of each date, from integer month arithmetic (1970-01 starts a quarter).
+
+    ```
+    >>> get_most_recent_quarter_ends(pd.to_datetime(['2019-10-21', '2020-03-31', None]))
+    DatetimeIndex(['2019-09-30', '2019-12-31', 'NaT'], dtype='datetime64[ns]', freq=None)
+
+    ```
+    """
+    months, missing, tz = _month_numbers(dates)
+    return _first_days(months - months % 3, missing, tz, -1)
+
+
+def get_next_quarter_starts(dates):
+    """
+    Array version of `get_next_quarter_start`.
+
+    ```
+    >>> get_next_quarter_starts(pd.to_datetime(['2019-10-21', '2020-03-31']))
+    DatetimeIndex(['2020-01-01', '2020-04-01'], dtype='datetime64[ns]', freq=None)
+
+    ```
+    """
+    months, missing, tz = _month_numbers(dates)
+    return _first_days(months - months % 3 + 3, missing, tz)
+
+
+def get_ends_of_current_month(dates):
+    """
+    Array version of `get_end_of_current_month`.
+
+    ```
+    >>> get_ends_of_current_month(pd.to_datetime(['2019-10-21 00:00', '2024-02-10 12:00']))
+    DatetimeIndex(['2019-10-31', '2024-02-29'], dtype='datetime64[ns]', freq=None)
+
+    ```
+    """
+    months, missing, tz = _month_numbers(dates)
+    return _first_days(months + 1, missing, tz, -1)
+
+
+def get_ends_of_current_quarter(dates):
+    """
+    Array version of `get_end_of_current_quarter`.
+
+    ```
+    >>> get_ends_of_current_quarter(pd.to_datetime(['2019-10-21 00:00', '2023-03-31 12:00']))
+    DatetimeIndex(['2019-12-31', '2023-03-31'], dtype='datetime64[ns]', freq=None)
+
+    ```
+    """
+    months, missing, tz = _month_numbers(dates)
+    return _first_days(months - months % 3 + 3, missing, tz, -1)
 
 
 def get_most_recent_quarter_end(d):
@@ -668,9 +1168,7 @@ def get_most_recent_quarter_end(d):
 
     ```
     """
-    quarter_month = (d.month - 1) // 3 * 3 + 1
-    quarter_end = datetime.datetime(d.year, quarter_month, 1) - relativedelta(days=1)
-    return quarter_end
+    return get_most_recent_quarter_ends([d])[0].tz_localize(None).to_pydatetime()
 
 
 def get_next_quarter_start(d):
@@ -684,11 +1182,7 @@ def get_next_quarter_start(d):
 
     ```
     """
-    quarter_month = (d.month - 1) // 3 * 3 + 4
-    years_to_add = quarter_month // 12
-    quarter_month_mod = quarter_month % 12
-    quarter_start = datetime.datetime(d.year + years_to_add, quarter_month_mod, 1)
-    return quarter_start
+    return get_next_quarter_starts([d])[0].tz_localize(None).to_pydatetime()
 
 
 def get_end_of_current_month(d):
@@ -706,17 +1200,8 @@ def get_end_of_current_month(d):
     Timestamp('2023-03-31 00:00:00')
 
     ```
-
-    From https://stackoverflow.com/a/13565185
     """
-    # Reset tiem part of datetime to zero: https://stackoverflow.com/a/26883852
-    d = pd.DatetimeIndex([d]).normalize()[0]
-
-    # The day 28 exists in every month. 4 days later, it's always next month
-    next_month = d.replace(day=28) + datetime.timedelta(days=4)
-    # subtracting the number of the current day brings us back one month
-    end_of_current_month = next_month - datetime.timedelta(days=next_month.day)
-    return end_of_current_month
+    return get_ends_of_current_month([d])[0]
 
 
 def get_end_of_current_quarter(d):
@@ -737,9 +1222,7 @@ def get_end_of_current_quarter(d):
 
     ```
     """
-    quarter_start = get_next_quarter_start(d)
-    quarter_end = quarter_start - datetime.timedelta(days=1)
-    return quarter_end
+    return get_ends_of_current_quarter([d])[0].tz_localize(None).to_pydatetime()
 
 
 def add_vertical_lines_to_plot(
@@ -751,8 +1234,21 @@ def add_vertical_lines_to_plot(
     alpha=0.1,
     extend_to_nearest_quarter=True,
 ):
-    # start_date = '2019-09-10'
-    # end_date = '2022-09-01'
+    """
+    Draw a vertical line at every quarter end between start_date and end_date.
+
+    All the lines are drawn with one `ax.vlines` call (a single LineCollection)
+    spanning the height of the axes, so long histories stay quick to render and small
+    to save.
+
+    ```
+    fig, ax = plt.subplots()
+    series.plot(ax=ax)
+    add_vertical_lines_to_plot('2019-09-10', '2022-09-01', ax=ax)
+    ```
+    """
+    if ax is None:
+        ax = plt.gca()
     if extend_to_nearest_quarter:
         start_date = get_most_recent_quarter_end(start_date)
         end_date = get_next_quarter_start(end_date)
@@ -760,14 +1256,20 @@ def add_vertical_lines_to_plot(
         dates = pd.date_range(
             pd.to_datetime(start_date),
             pd.to_datetime(end_date) + pd.offsets.QuarterBegin(1),
-            freq="Q",
+            freq="QE",
         )
         mask = (dates >= start_date) & (dates <= end_date)
         dates = dates[mask]
         months = mdates.MonthLocator((1, 4, 7, 10))
         if adjust_ticks:
-            for d in dates:
-                plt.axvline(d, color="k", alpha=alpha)
+            ax.vlines(
+                dates,
+                0,
+                1,
+                transform=ax.get_xaxis_transform(),
+                colors="k",
+                alpha=alpha,
+            )
             ax.xaxis.set_major_locator(months)
         ax.xaxis.set_tick_params(rotation=90)
     else:
@@ -847,9 +1349,11 @@ def plot_weighted_median_with_distribution_bars(
         plt.clf()
         _, ax = plt.subplots()
 
-    median_series = data.groupby(date_col).apply(
-        lambda x: weighted_quantile(x[variable_name], 0.5, sample_weight=x[weight_col])
+    quantiles = [0.5, *percentiles] if percentile_bars else [0.5]
+    weighted_quantiles = groupby_weighted_quantile(
+        variable_name, quantiles, weight_col, date_col, data
     )
+    median_series = weighted_quantiles.iloc[:, 0]
     if rolling:
         wavrs = median_series.rolling(
             rolling_window, min_periods=rolling_min_periods
@@ -859,16 +1363,8 @@ def plot_weighted_median_with_distribution_bars(
     (wavrs * rescale_factor).plot(ax=ax, label=label)
 
     if percentile_bars:
-        lower = data.groupby(date_col).apply(
-            lambda x: weighted_quantile(
-                x[variable_name], percentiles[0], sample_weight=x[weight_col]
-            )
-        )
-        upper = data.groupby(date_col).apply(
-            lambda x: weighted_quantile(
-                x[variable_name], percentiles[1], sample_weight=x[weight_col]
-            )
-        )
+        lower = weighted_quantiles.iloc[:, 1]
+        upper = weighted_quantiles.iloc[:, 2]
         if rolling:
             lower = lower.rolling(
                 rolling_window, min_periods=rolling_min_periods
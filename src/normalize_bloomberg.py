@@ -0,0 +1,138 @@
+"""
+Normalisation of the raw Bloomberg pull, shared by the calendar spread scripts and the
+proxy analysis.
+
+The raw parquet file has (ticker, field) MultiIndex columns, object columns holding
+Bloomberg's ".NA." token and an index of dates. `normalize_raw` applies the declared
+schema RAW_FIELDS in one pass:
+
+- flattens the columns to "ticker field" strings, e.g. "ES1 Index PX_LAST",
+- masks the NA_TOKENS in every text column at once,
+- coerces the numeric fields in bulk (only the columns not already stored as numbers),
+- fills the fields with a fill value (missing daily dividends are 0, as in Stata),
+- parses the index once.
+
+`load_normalized` runs it once per raw file and version of the schema: the result is
+cached as parquet in DATA_DIR/normalized, keyed by a hash of the file's content and
+the normalisation options, so later loads skip it, also after a fresh checkout. Caches
+of other versions of the raw file are removed.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from excel_cache import content_digest
+from instrumentation import instrumented
+from settings import config
+
+DATA_DIR = config("DATA_DIR")
+NORMALIZED_DIR = DATA_DIR / "normalized"
+
+# Declared raw fields: dtype and the value filled in for missing observations
+RAW_FIELDS = {
+    "PX_LAST": {"dtype": "float64"},
+    "IDX_EST_DVD_YLD": {"dtype": "float64"},
+    "INDX_GROSS_DAILY_DIV": {"dtype": "float64", "fill": 0.0},
+    "PX_VOLUME": {"dtype": "float64"},
+    "OPEN_INT": {"dtype": "float64"},
+    "CURRENT_CONTRACT_MONTH_YR": {"dtype": "object"},
+}
+NA_TOKENS = [".NA."]
+
+
+def field_name(column):
+    """Bloomberg field of a flattened column, e.g. "ES1 Index PX_LAST" -> "PX_LAST"."""
+    return column.rsplit(" ", 1)[-1]
+
+
+@instrumented("normalize")
+def normalize_raw(
+    df, fields=RAW_FIELDS, na_tokens=NA_TOKENS, dates="datetime", fill=True
+):
+    """
+    Applies the raw data schema, see the module docstring.
+
+    Parameters:
+    - df (DataFrame): Raw Bloomberg pull, with MultiIndex or flattened columns
+    - fields (dict): Field -> {"dtype": ..., "fill": ...}. Other fields are kept as is.
+    - na_tokens (list): Strings that mean a missing value
+    - dates (str): "datetime" for a DatetimeIndex, "date" for `datetime.date` labels
+    - fill (bool): Whether to apply the fill values
+
+    Returns:
+    - Normalised copy of `df`.
+    """
+    df = df.copy()
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = [" ".join(col).strip() for col in df.columns]
+    field_of = {column: field_name(column) for column in df.columns}
+
+    text = df.select_dtypes(object).columns
+    if len(text):
+        df[text] = df[text].mask(df[text].isin(na_tokens))
+
+    by_dtype, by_fill = {}, {}
+    for column, field in field_of.items():
+        spec = fields.get(field)
+        if spec is None:
+            continue
+        by_dtype.setdefault(spec["dtype"], []).append(column)
+        if fill and "fill" in spec:
+            by_fill.setdefault(spec["fill"], []).append(column)
+    for dtype, columns in by_dtype.items():
+        if dtype == "object":
+            continue
+        stored_as_text = df[columns].select_dtypes(object).columns
+        if len(stored_as_text):
+            df[stored_as_text] = df[stored_as_text].apply(
+                pd.to_numeric, errors="coerce"
+            )
+        df[columns] = df[columns].astype(dtype)
+    for value, columns in by_fill.items():
+        df[columns] = df[columns].fillna(value)
+
+    index = pd.to_datetime(df.index)
+    df.index = index.date if dates == "date" else index
+    return df
+
+
+def ticker_fields(df, ticker):
+    """
+    Fields of one ticker of the normalised data as columns, like `raw[ticker]` on the
+    MultiIndex columns, e.g. `ticker_fields(df, "SPX Index")["PX_LAST"]`.
+    """
+    prefix = f"{ticker} "
+    columns = [col for col in df.columns if col.startswith(prefix)]
+    return df[columns].rename(columns=lambda col: col[len(prefix) :])
+
+
+def _cache_path(path, dates, fill):
+    key = json.dumps([RAW_FIELDS, NA_TOKENS, dates, fill])
+    options_digest = hashlib.sha1(key.encode()).hexdigest()[:8]
+    file_name = f"{path.stem}.{content_digest(path)}.{options_digest}.parquet"
+    return NORMALIZED_DIR / file_name
+
+
+def load_normalized(path, dates="datetime", fill=True):
+    """
+    Normalised raw Bloomberg data of the parquet file `path`, normalised once and then
+    read from the cache in DATA_DIR/normalized. See `normalize_raw` for the options.
+    """
+    path = Path(path)
+    cache_path = _cache_path(path, dates, fill)
+    if cache_path.exists():
+        return pd.read_parquet(cache_path)
+    df = normalize_raw(pd.read_parquet(path), dates=dates, fill=fill)
+    NORMALIZED_DIR.mkdir(parents=True, exist_ok=True)
+    # Caches of other versions of the raw file
+    current = f"{path.stem}.{content_digest(path)}."
+    for old in NORMALIZED_DIR.glob(f"{path.stem}.*.parquet"):
+        if not old.name.startswith(current):
+            old.unlink()
+    tmp_path = cache_path.with_suffix(".tmp")
+    df.to_parquet(tmp_path)
+    tmp_path.replace(cache_path)
+    return df
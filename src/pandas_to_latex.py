@@ -1,12 +1,27 @@
+"""
+Builds the LaTeX report (`graph_document.tex`) from the outputs of the pipeline.
+
+The static parts of the document (introduction, methodology, conclusion) are kept as
+templates below. The results section is assembled from `REPORT_SECTIONS`, including only
+the figures and tables that the pipeline has actually produced. The `.tex` file is only
+rewritten when its content hash changes, so `doit` can skip `pdflatex` when neither the
+document nor any of the included files changed.
+"""
+
+import hashlib
 import os
 from pathlib import Path
 
 from settings import config
 
+BASE_DIR = Path(config("BASE_DIR"))
 DATA_DIR = Path(config("DATA_DIR"))
+MANUAL_DATA_DIR = Path(config("MANUAL_DATA_DIR"))
 OUTPUT_DIR = Path(config("OUTPUT_DIR"))
 
-latex_code = r"""
+TEX_FILE = OUTPUT_DIR / "graph_document.tex"
+
+latex_preamble = r"""
 \documentclass{article}
 
 % Language setting
@@ -97,109 +112,9 @@ The project follows a structured pipeline to ensure reproducibility:
 \end{enumerate}
 \clearpage
 \section{Results and Findings}
-\subsection{Equity Index Spread Figures --- Original Paper}
-\begin{figure}[!ht]
-      \centering
-      \includegraphics[width=\textwidth,height=0.38\textheight,keepaspectratio]{../data_manual/plot_research_paper.png}
-      \caption{Equity Index Spread --- Appendix from the Original Paper}
-      \label{fig:full_update}
-  \end{figure}
-\subsection{Equity Index Spread Figures --- Full Data}
-\begin{figure}[!ht]
-    \centering
-    \includegraphics[width=\textwidth,height=0.38\textheight,keepaspectratio]{../_output/equity_index_spread_plot_full_update.pdf}
-    \caption{Equity Index Spread --- Full Update (Data until 2023-12-28)}
-    \label{fig:full_update}
-\end{figure}
-
-\vspace{1em}
-
-\begin{figure}[!ht]
-    \centering
-    \includegraphics[width=\textwidth,height=0.38\textheight,keepaspectratio]{../_output/equity_index_spread_plot_full_replication.pdf}
-    \caption{Equity Index Spread --- Full Replication (Data until 2021-02-28)}
-    \label{fig:full_replication}
-\end{figure}
-
-\clearpage
-\subsection{Equity Index Spread Figures --- Proxy Data}
-\begin{figure}[!ht]
-    \centering
-    \includegraphics[width=\textwidth,height=0.38\textheight,keepaspectratio]{../_output/equity_index_spread_plot_proxy_update.pdf}
-    \caption{Equity Index Spread --- Proxy Update (Data until 2024-08-31)}
-    \label{fig:proxy_update}
-\end{figure}
-
-\vspace{1em}
-
-\begin{figure}[!ht]
-    \centering
-    \includegraphics[width=\textwidth,height=0.38\textheight,keepaspectratio]{../_output/equity_index_spread_plot_proxy_replication.pdf}
-    \caption{Equity Index Spread --- Proxy Replication (Data until 2021-02-28)}
-    \label{fig:proxy_replication}
-\end{figure}
-
-\clearpage
-%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
-% Yearly Comparison Figure
-%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
-\subsection{Yearly Comparison of Time Series Data}
-\begin{figure}[!ht]
-    \centering
-    \includegraphics[width=\textwidth,height=0.6\textheight,keepaspectratio]{../_output/yearly_comparison.pdf}
-    \caption{Yearly Comparison of Time Series Data. In general, the difference between the implied forward rate before and after maturity, as well as the difference among the forward rates embedded in different maturities, increases.}
-    \label{fig:yearly}
-\end{figure}
-\clearpage
-%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
-% Full Data Tables (Vertical Arrangement; Two Tables in One Figure)
-%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
-\subsection{Summary Statistics Tables --- Full Data} 
-\begin{figure}[!ht]
-  \centering
-
-  % 첫 번째 테이블
-  \begin{minipage}{\textwidth}
-    \centering
-    \resizebox{0.85\textwidth}{!}{\includegraphics{../_output/table_full_update.pdf}}
-    \caption{Summary Statistics Table --- Full Update (Data until 2023-12-28)}
-    \label{tab:full_up to date}
-  \end{minipage}
-
-  % 두 번째 테이블
-  \begin{minipage}{\textwidth}
-    \centering
-    \resizebox{0.85\textwidth}{!}{\includegraphics{../_output/table_full_replication.pdf}}
-    \caption{Summary Statistics Table --- Full Replication (Data until 2021-02-28)}
-    \label{tab:full_replication}
-  \end{minipage}
-\end{figure}
-\clearpage
-%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
-% Proxy Data Tables (Vertical Arrangement; Two Tables in One Figure)
-%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
-\subsection{Summary Statistics Tables --- Proxy Data}
-\begin{figure}[!ht]
-  \centering
-
-  % 첫 번째 테이블
-  \begin{minipage}{\textwidth}
-    \centering
-    \resizebox{0.85\textwidth}{!}{\includegraphics{../_output/table_proxy_update.pdf}}
-    \caption{Summary Statistics Table --- Proxy Update (Data until 2024-08-31)}
-    \label{tab:proxy_update}
-  \end{minipage}
-  
-  % 두 번째 테이블
-  \begin{minipage}{\textwidth}
-    \centering
-    \resizebox{0.85\textwidth}{!}{\includegraphics{../_output/table_proxy_replication.pdf}}
-    \caption{Summary Statistics Table --- Proxy Replication (Data until 2021-02-28)}
-    \label{tab:proxy_replication}
-  \end{minipage}
-
-\end{figure}
+"""
 
+latex_closing = r"""
 \section{Challenges and Limitations}
 \begin{itemize}
     \item \textbf{Data Access and Cleaning}: Bloomberg data is proprietary, requiring alternative \textbf{proxy estimates using OptionMetrics}.
@@ -223,14 +138,210 @@ This project successfully replicated \textbf{Equity Spot-Futures Arbitrage Sprea
 Emil Siriwardane, Adi Sunderam, and Jonathan Wallen, \textit{Segmented Arbitrage}, Harvard Business School Working Paper, 2023.
 \end{thebibliography}
 \end{document}
+"""
 
+# Each results subsection lists the figures/tables it includes as
+# (kind, path, caption, label). Items whose file does not exist are skipped.
+REPORT_SECTIONS = [
+    (
+        "Equity Index Spread Figures --- Original Paper",
+        [
+            (
+                "figure",
+                MANUAL_DATA_DIR / "plot_research_paper.png",
+                "Equity Index Spread --- Appendix from the Original Paper",
+                "fig:original_paper",
+            ),
+        ],
+    ),
+    (
+        "Equity Index Spread Figures --- Full Data",
+        [
+            (
+                "figure",
+                OUTPUT_DIR / "equity_index_spread_plot_full_update.pdf",
+                "Equity Index Spread --- Full Update (Data until 2023-12-28)",
+                "fig:full_update",
+            ),
+            (
+                "figure",
+                OUTPUT_DIR / "equity_index_spread_plot_full_replication.pdf",
+                "Equity Index Spread --- Full Replication (Data until 2021-02-28)",
+                "fig:full_replication",
+            ),
+        ],
+    ),
+    (
+        "Equity Index Spread Figures --- Proxy Data",
+        [
+            (
+                "figure",
+                OUTPUT_DIR / "equity_index_spread_plot_proxy_update.pdf",
+                "Equity Index Spread --- Proxy Update (Data until 2024-08-31)",
+                "fig:proxy_update",
+            ),
+            (
+                "figure",
+                OUTPUT_DIR / "equity_index_spread_plot_proxy_replication.pdf",
+                "Equity Index Spread --- Proxy Replication (Data until 2021-02-28)",
+                "fig:proxy_replication",
+            ),
+        ],
+    ),
+    (
+        "Yearly Comparison of Time Series Data",
+        [
+            (
+                "figure",
+                OUTPUT_DIR / "yearly_comparison.pdf",
+                "Yearly Comparison of Time Series Data. In general, the difference between the implied forward rate before and after maturity, as well as the difference among the forward rates embedded in different maturities, increases.",
+                "fig:yearly",
+            ),
+        ],
+    ),
+    (
+        "Summary Statistics Tables --- Full Data",
+        [
+            (
+                "table",
+                OUTPUT_DIR / "table_full_update.tex",
+                "Summary Statistics Table --- Full Update (Data until 2023-12-28)",
+                "tab:full_update",
+            ),
+            (
+                "table",
+                OUTPUT_DIR / "table_full_replication.tex",
+                "Summary Statistics Table --- Full Replication (Data until 2021-02-28)",
+                "tab:full_replication",
+            ),
+        ],
+    ),
+    (
+        "Summary Statistics Tables --- Proxy Data",
+        [
+            (
+                "table",
+                OUTPUT_DIR / "table_proxy_update.tex",
+                "Summary Statistics Table --- Proxy Update (Data until 2024-08-31)",
+                "tab:proxy_update",
+            ),
+            (
+                "table",
+                OUTPUT_DIR / "table_proxy_replication.tex",
+                "Summary Statistics Table --- Proxy Replication (Data until 2021-02-28)",
+                "tab:proxy_replication",
+            ),
+        ],
+    ),
+    (
+        "Summary Statistics Tables --- Rate Variants",
+        [
+            (
+                "table",
+                OUTPUT_DIR / "table_rate_variants_update.tex",
+                "Summary Statistics Table --- 3M OIS and Interpolated OIS Spreads (Data until 2023-12-28)",
+                "tab:rate_variants_update",
+            ),
+            (
+                "table",
+                OUTPUT_DIR / "table_rate_variants_replication.tex",
+                "Summary Statistics Table --- 3M OIS and Interpolated OIS Spreads (Data until 2021-02-28)",
+                "tab:rate_variants_replication",
+            ),
+        ],
+    ),
+]
+
+FIGURE_TEMPLATE = r"""\begin{figure}[!ht]
+    \centering
+    \includegraphics[width=\textwidth,height=0.38\textheight,keepaspectratio]{%(path)s}
+    \caption{%(caption)s}
+    \label{%(label)s}
+\end{figure}
+"""
 
+TABLE_TEMPLATE = r"""\begin{table}[!ht]
+    \centering
+    \input{%(path)s}
+    \caption{%(caption)s}
+    \label{%(label)s}
+\end{table}
 """
 
-# Check if the output directory exists
-if not OUTPUT_DIR.exists():
-    os.makedirs(OUTPUT_DIR)
 
-# Write the LaTeX code to a file in the output directory
-with open(OUTPUT_DIR / "graph_document.tex", "w", encoding="utf-8") as f:
-    f.write(latex_code)
+def latex_path(path):
+    """Path of an included file as written in the report, relative to the project root."""
+    return "../" + Path(os.path.relpath(path, BASE_DIR)).as_posix()
+
+
+def report_dependencies(sections=REPORT_SECTIONS):
+    """
+    Files that the report can include, i.e. all the outputs of `sections`, to be used
+    as `doit` file dependencies so the report is built after the tasks that produce
+    them. Only `build_results_section` skips the ones missing on disk.
+    """
+    return [path for _, items in sections for _, path, _, _ in items]
+
+
+def build_results_section(sections=REPORT_SECTIONS):
+    """
+    Assembles the results subsections from the outputs that exist on disk.
+
+    Returns:
+    - (latex, missing) where `missing` lists the outputs that were skipped.
+    """
+    blocks = []
+    missing = []
+    for title, items in sections:
+        item_blocks = []
+        for kind, path, caption, label in items:
+            if not Path(path).exists():
+                missing.append(Path(path))
+                continue
+            template = FIGURE_TEMPLATE if kind == "figure" else TABLE_TEMPLATE
+            item_blocks.append(
+                template
+                % {"path": latex_path(path), "caption": caption, "label": label}
+            )
+        if item_blocks:
+            blocks.append(
+                f"\\subsection{{{title}}}\n" + "\n\\vspace{1em}\n\n".join(item_blocks)
+            )
+    return "\\clearpage\n".join(blocks), missing
+
+
+def build_report(sections=REPORT_SECTIONS):
+    """Returns the full LaTeX document and the list of outputs that were skipped."""
+    results, missing = build_results_section(sections)
+    return latex_preamble + results + latex_closing, missing
+
+
+def write_if_changed(path, content):
+    """
+    Writes `content` to `path` only if its SHA-256 hash differs from the current file.
+    Leaving the file untouched keeps its timestamp and lets `doit` skip `pdflatex`.
+
+    Returns:
+    - True if the file was (re)written.
+    """
+    path = Path(path)
+    new_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    if path.exists():
+        old_hash = hashlib.sha256(path.read_bytes()).hexdigest()
+        if old_hash == new_hash:
+            return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content.encode("utf-8"))
+    return True
+
+
+if __name__ == "__main__":
+    latex_code, missing = build_report()
+    for path in missing:
+        print(f"Skipping missing report output: {path}")
+
+    # Write the LaTeX code to a file in the output directory
+    if write_if_changed(TEX_FILE, latex_code):
+        print(f"Wrote {TEX_FILE}")
+    else:
+        print(f"{TEX_FILE} is up to date")
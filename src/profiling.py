@@ -0,0 +1,156 @@
+"""
+Opt-in profiling of pipeline stages.
+
+Stages recorded by `instrumentation` (`stage`, `instrumented`, `begin_stage`) can be
+profiled without editing the scripts. List them in PIPELINE_PROFILE, comma separated,
+or use "all":
+
+    PIPELINE_PROFILE=get_clean_df,outliers python equity_spot_futures_arb_analysis.py
+
+or run a script through this module:
+
+    python profiling.py --stages time_to_maturity,outliers compute_calendar_spread_OIS3M.py
+
+Each profiled run of a stage writes to OUTPUT_DIR/profiles/:
+
+- `<stage>_<pid>_<n>.prof`: cProfile statistics (open with `python -m pstats`,
+  snakeviz or tuna),
+- `<stage>_<pid>_<n>.collapsed`: stacks sampled every PIPELINE_PROFILE_INTERVAL
+  seconds in the collapsed format of flamegraph.pl / speedscope.
+
+The directory also gets a `.gitignore`, so the dumps of local runs are never
+committed, wherever OUTPUT_DIR points.
+
+When PIPELINE_PROFILE is empty (the default) a stage only pays for one set lookup.
+Nested profiled stages are covered by the outermost one.
+"""
+
+import argparse
+import cProfile
+import os
+import runpy
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from settings import config
+
+OUTPUT_DIR = config("OUTPUT_DIR")
+PROFILE_DIR = OUTPUT_DIR / "profiles"
+PROFILE_INTERVAL = config("PIPELINE_PROFILE_INTERVAL")
+
+PROFILED_STAGES = frozenset(
+    name.strip() for name in config("PIPELINE_PROFILE").split(",") if name.strip()
+)
+_RUNS = Counter()
+_ACTIVE = []
+
+
+def enable(stages, interval=None):
+    """Profiles `stages` (iterable of stage names, or "all") from now on."""
+    global PROFILED_STAGES, PROFILE_INTERVAL
+    if isinstance(stages, str):
+        stages = stages.split(",")
+    PROFILED_STAGES = frozenset(name.strip() for name in stages if name.strip())
+    if interval is not None:
+        PROFILE_INTERVAL = interval
+
+
+class StackSampler:
+    """Samples the call stack of one thread from a background thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                name = Path(code.co_filename).name
+                frames.append(f"{code.co_name} ({name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+    def collapsed(self):
+        """Sampled stacks as "root;...;leaf count" lines."""
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+
+def start_profile(name):
+    """
+    Starts profiling stage `name` if it is listed in PIPELINE_PROFILE and no enclosing
+    stage is being profiled. Returns a handle for `stop_profile`, or None.
+    """
+    if not PROFILED_STAGES or _ACTIVE:
+        return None
+    if name not in PROFILED_STAGES and "all" not in PROFILED_STAGES:
+        return None
+    sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL)
+    profiler = cProfile.Profile()
+    handle = {"stage": name, "profiler": profiler, "sampler": sampler}
+    _ACTIVE.append(handle)
+    sampler.start()
+    profiler.enable()
+    return handle
+
+
+def stop_profile(handle):
+    """
+    Stops the profile started with `start_profile` and writes its files.
+
+    Returns:
+    - list of the written paths (empty when `handle` is None).
+    """
+    if handle is None:
+        return []
+    handle["profiler"].disable()
+    handle["sampler"].stop()
+    _ACTIVE.remove(handle)
+
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    ignore_file = PROFILE_DIR / ".gitignore"
+    if not ignore_file.exists():
+        ignore_file.write_text("*\n")
+    _RUNS[handle["stage"]] += 1
+    stem = PROFILE_DIR / f"{handle['stage']}_{os.getpid()}_{_RUNS[handle['stage']]}"
+    prof_path = stem.with_suffix(".prof")
+    collapsed_path = stem.with_suffix(".collapsed")
+    handle["profiler"].dump_stats(prof_path)
+    collapsed_path.write_text(handle["sampler"].collapsed())
+    return [prof_path, collapsed_path]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run a pipeline script with some of its stages profiled."
+    )
+    parser.add_argument("--stages", default="all", help="Comma separated stages")
+    parser.add_argument("--interval", type=float, default=None, help="Seconds")
+    parser.add_argument("script", help="Script to run, e.g. calendar_spread.py")
+    args, script_args = parser.parse_known_args()
+
+    # This file runs as __main__: configure the module the stages actually import
+    import profiling
+
+    profiling.enable(args.stages, args.interval)
+    sys.argv = [args.script, *script_args]
+    start = time.perf_counter()
+    runpy.run_path(args.script, run_name="__main__")
+    print(f"Profiled {args.script} in {time.perf_counter() - start:.1f}s")
+    print(f"Profiles written to {profiling.PROFILE_DIR}")
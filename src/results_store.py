@@ -0,0 +1,268 @@
+"""
+Local SQLite warehouse of the spread outputs.
+
+Every pipeline run registers its output frame in OUTPUT_DIR/results.sqlite next to
+the parquet file it writes: `calendar_spread_df.parquet` as the "full" method and
+`total_df.parquet` as the "proxy" method. Each numeric column is stored as a series:
+
+    runs(run_id, method, source, created, n_rows)
+    series(series_id, run_id, index_name, variable)
+    observations(series_id, date, value)   -- date in seconds since 1970
+
+Columns named `<INDEX>_<variable>` are split on the index, with `INDU` stored as
+`DJI`. The spread columns (`arb_spread`, `Spread`) are stored as `spread`, a column
+named after its index (the proxy implied forward rates) as `value`, and columns of no
+index (`OIS_3M`) under the index "ALL". Missing values and non-numeric columns
+(contract names) are not stored.
+
+Runs are indexed on (method, run_id), series on (run_id, index_name, variable) and
+observations are clustered on (series_id, date), so a slice such as the SPX
+full-method spread from 2015 to 2018 only reads its own rows:
+
+    query_spread("SPX", "full", "2015-01-01", "2018-12-31")
+
+Queries read the latest run of each method unless given a `run_id`. Only the last
+RESULTS_KEEP_RUNS runs of each method are kept; SQLite reuses the pages of the dropped
+runs, so the file stops growing.
+"""
+
+import re
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from settings import config
+
+OUTPUT_DIR = config("OUTPUT_DIR")
+RESULTS_DB = OUTPUT_DIR / "results.sqlite"
+RESULTS_KEEP_RUNS = 10
+
+INDEXES = ["SPX", "NDX", "DJI", "INDU"]
+INDEX_ALIASES = {"INDU": "DJI"}
+VARIABLE_ALIASES = {"arb_spread": "spread", "Spread": "spread"}
+_CREATED_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    method TEXT NOT NULL,
+    source TEXT,
+    created TEXT NOT NULL,
+    n_rows INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS series (
+    series_id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    index_name TEXT NOT NULL,
+    variable TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS observations (
+    series_id INTEGER NOT NULL REFERENCES series (series_id),
+    date INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (series_id, date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS runs_method ON runs (method, run_id);
+CREATE INDEX IF NOT EXISTS series_name ON series (run_id, index_name, variable);
+"""
+
+
+def connect(db_path=None):
+    """Opens the warehouse, creating its tables if needed."""
+    db_path = RESULTS_DB if db_path is None else db_path
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(db_path)
+    con.executescript(_SCHEMA)
+    return con
+
+
+def split_column(column):
+    """
+    Index and variable names of an output column.
+
+    >>> split_column("SPX_arb_spread"), split_column("INDU"), split_column("OIS_3M")
+    (('SPX', 'spread'), ('DJI', 'value'), ('ALL', 'OIS_3M'))
+    """
+    match = re.fullmatch(rf"({'|'.join(INDEXES)})(?:_(.+))?", column)
+    if match is None:
+        return "ALL", column
+    index_name, variable = match.groups()
+    variable = variable or "value"
+    return (
+        INDEX_ALIASES.get(index_name, index_name),
+        VARIABLE_ALIASES.get(variable, variable),
+    )
+
+
+def _epoch_seconds(dates):
+    return pd.DatetimeIndex(pd.to_datetime(dates)).as_unit("s").asi8
+
+
+def _end_condition(end):
+    """
+    Upper date bound of a query. A date string covers its whole period, so "2018" and
+    "2018-12-31" both end before 2019-01-01, intraday rows included; a timestamp is
+    an inclusive bound.
+    """
+    if isinstance(end, str):
+        following = pd.Period(end) + 1
+        return "o.date < ?", int(_epoch_seconds([following.start_time])[0])
+    return "o.date <= ?", int(_epoch_seconds([end])[0])
+
+
+def _drop_old_runs(con, method, keep):
+    old = [
+        run_id
+        for (run_id,) in con.execute(
+            "SELECT run_id FROM runs WHERE method = ? ORDER BY run_id DESC LIMIT -1 "
+            "OFFSET ?",
+            (method, keep),
+        )
+    ]
+    for run_id in old:
+        con.execute(
+            "DELETE FROM observations WHERE series_id IN "
+            "(SELECT series_id FROM series WHERE run_id = ?)",
+            (run_id,),
+        )
+        con.execute("DELETE FROM series WHERE run_id = ?", (run_id,))
+        con.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+
+
+def register_run(df, method, source=None, db_path=None, keep=RESULTS_KEEP_RUNS):
+    """
+    Stores an output frame as a new run of `method`.
+
+    Parameters:
+    - df (DataFrame): Output indexed by date, e.g. the calendar spread `merged_df`
+    - method (str): Method name, "full" (calendar spreads) or "proxy"
+    - source (str or Path): File the frame was written to, for reference
+    - db_path (Path): Warehouse file. Defaults to RESULTS_DB.
+    - keep (int): Runs of `method` to keep, including this one
+
+    Returns:
+    - run_id of the new run.
+    """
+    dates = _epoch_seconds(df.index)
+    con = connect(db_path)
+    try:
+        with con:
+            run_id = con.execute(
+                "INSERT INTO runs (method, source, created, n_rows) VALUES (?, ?, ?, ?)",
+                (
+                    method,
+                    None if source is None else str(source),
+                    datetime.now().strftime(_CREATED_FORMAT),
+                    len(df),
+                ),
+            ).lastrowid
+            for column in df.columns:
+                if not pd.api.types.is_numeric_dtype(df[column]):
+                    continue
+                series_id = con.execute(
+                    "INSERT INTO series (run_id, index_name, variable) VALUES (?, ?, ?)",
+                    (run_id, *split_column(column)),
+                ).lastrowid
+                values = df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+                present = ~np.isnan(values)
+                con.executemany(
+                    f"INSERT INTO observations VALUES ({series_id}, ?, ?)",
+                    zip(dates[present].tolist(), values[present].tolist()),
+                )
+            _drop_old_runs(con, method, keep)
+    finally:
+        con.close()
+    return run_id
+
+
+def runs(db_path=None):
+    """Registered runs, newest first."""
+    con = connect(db_path)
+    try:
+        return pd.read_sql_query(
+            "SELECT * FROM runs ORDER BY run_id DESC", con, parse_dates=["created"]
+        )
+    finally:
+        con.close()
+
+
+def query(
+    index=None,
+    method=None,
+    variable=None,
+    start=None,
+    end=None,
+    run_id=None,
+    db_path=None,
+):
+    """
+    Reads a slice of the registered outputs.
+
+    Parameters:
+    - index (str or list): Index names, e.g. "SPX" (`INDU` is stored as `DJI`)
+    - method (str or list): Method names, e.g. "full"
+    - variable (str or list): Variable names, e.g. "spread"
+    - start, end: Inclusive date bounds. A string `end` covers its whole period, like
+      pandas partial-string slicing: "2018" reads all of 2018 and "2018-12-31" all of
+      that day.
+    - run_id (int): Run to read. Defaults to the latest run of each method.
+    - db_path (Path): Warehouse file. Defaults to RESULTS_DB.
+
+    Returns:
+    - DataFrame with columns method, run_id, index_name, variable, date and value,
+      sorted by method, index, variable and date.
+    """
+    conditions, params = [], []
+    if run_id is not None:
+        conditions.append("s.run_id = ?")
+        params.append(run_id)
+    else:
+        latest = "SELECT MAX(run_id) FROM runs"
+        if method is not None:
+            methods = [method] if isinstance(method, str) else list(method)
+            latest += f" WHERE method IN ({', '.join('?' * len(methods))})"
+            params.extend(methods)
+        conditions.append(f"s.run_id IN ({latest} GROUP BY method)")
+    for column, selected in [("s.index_name", index), ("s.variable", variable)]:
+        if selected is None:
+            continue
+        selected = [selected] if isinstance(selected, str) else list(selected)
+        conditions.append(f"{column} IN ({', '.join('?' * len(selected))})")
+        params.extend(selected)
+    if start is not None:
+        conditions.append("o.date >= ?")
+        params.append(int(_epoch_seconds([start])[0]))
+    if end is not None:
+        condition, bound = _end_condition(end)
+        conditions.append(condition)
+        params.append(bound)
+
+    sql = (
+        "SELECT r.method, s.run_id, s.index_name, s.variable, o.date, o.value "
+        "FROM series s JOIN runs r ON r.run_id = s.run_id "
+        "JOIN observations o ON o.series_id = s.series_id "
+        f"WHERE {' AND '.join(conditions)} "
+        "ORDER BY r.method, s.index_name, s.variable, o.date"
+    )
+    con = connect(db_path)
+    try:
+        df = pd.read_sql_query(sql, con, params=params)
+    finally:
+        con.close()
+    df["date"] = pd.to_datetime(df["date"], unit="s")
+    return df
+
+
+def query_spread(index, method, start=None, end=None, run_id=None, db_path=None):
+    """
+    Spread of one index and method, e.g. `query_spread("SPX", "full", "2015", "2018")`.
+
+    Returns:
+    - Series of the spread (bps) indexed by date.
+    """
+    df = query(index, method, "spread", start, end, run_id, db_path)
+    series = df.set_index("date")["value"].rename(f"{index}_{method}_spread")
+    series.index.name = "Date"
+    return series
@@ -74,6 +74,16 @@ d["START_DATE"] = _config("START_DATE", default="1913-01-01", cast=to_datetime)
 d["END_DATE"] = _config("END_DATE", default="2024-01-01", cast=to_datetime)
 d["PIPELINE_DEV_MODE"] = _config("PIPELINE_DEV_MODE", default=True, cast=bool)
 d["PIPELINE_THEME"] = _config("PIPELINE_THEME", default="pipeline")
+d["SPREAD_BACKEND"] = _config("SPREAD_BACKEND", default="pandas")
+d["PIPELINE_INSTRUMENT"] = _config("PIPELINE_INSTRUMENT", default=True, cast=bool)
+d["PIPELINE_TRACEMALLOC"] = _config("PIPELINE_TRACEMALLOC", default=False, cast=bool)
+d["PIPELINE_PROFILE"] = _config("PIPELINE_PROFILE", default="")
+d["PIPELINE_PROFILE_INTERVAL"] = _config(
+    "PIPELINE_PROFILE_INTERVAL", default=0.005, cast=float
+)
+d["PIPELINE_STAGE_BUDGETS"] = _config("PIPELINE_STAGE_BUDGETS", default="")
+d["PLOT_MAX_POINTS"] = _config("PLOT_MAX_POINTS", default=4000, cast=int)
+d["PLOT_DOWNSAMPLING"] = _config("PLOT_DOWNSAMPLING", default="lttb")
 
 ## Paths
 d["DATA_DIR"] = if_relative_make_abs(_config('DATA_DIR', default=Path('_data'), cast=Path))
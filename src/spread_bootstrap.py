@@ -0,0 +1,206 @@
+"""
+Stationary block-bootstrap confidence intervals for the arbitrage spread series.
+
+The spreads are strongly autocorrelated, so resampling single observations understates
+the uncertainty of their mean. The stationary bootstrap (Politis & Romano, 1994)
+resamples blocks of consecutive observations with geometrically distributed lengths
+(mean `mean_block`), wrapping around the end of the sample.
+
+The resampling indices of a batch of replicates are generated in one vectorized step,
+and the batches of every (window, series) pair are spread over a process pool of at
+most BOOTSTRAP_MAX_WORKERS processes. Each batch gets its own child of
+`np.random.SeedSequence(seed)`, assigned in a fixed order, so the intervals only
+depend on `seed` and not on the number of workers.
+
+Run as a script to bootstrap the calendar spreads (`calendar_spread_df.parquet`) and
+the proxy spreads (`total_df.parquet`), read through their memory-mapped Arrow copies
+(see `arrow_cache.py`), and write `bootstrap_ci.csv` to OUTPUT_DIR.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import arrow_cache
+from settings import config
+
+OUTPUT_DIR = config("OUTPUT_DIR")
+
+BOOTSTRAP_REPLICATES = 2000
+BOOTSTRAP_BATCH_SIZE = 250
+BOOTSTRAP_QUANTILES = (0.25, 0.75)
+BOOTSTRAP_MAX_WORKERS = 4
+
+
+def stationary_bootstrap_indices(rng, n_obs, n_boot, mean_block):
+    """
+    Draws `n_boot` stationary-bootstrap resamples of positions 0..n_obs-1.
+
+    A new block starts at each position with probability 1 / mean_block at a uniformly
+    drawn start; otherwise the previous position is continued (wrapping around).
+
+    Returns:
+    - int array of shape (n_boot, n_obs).
+
+    >>> rng = np.random.default_rng(0)
+    >>> idx = stationary_bootstrap_indices(rng, n_obs=10, n_boot=3, mean_block=4)
+    >>> idx.shape
+    (3, 10)
+    >>> bool(((idx >= 0) & (idx < 10)).all())
+    True
+    """
+    positions = np.arange(n_obs)
+    new_block = rng.random((n_boot, n_obs)) < 1 / mean_block
+    new_block[:, 0] = True
+    starts = rng.integers(0, n_obs, size=(n_boot, n_obs))
+    # Position at which the block covering each observation started
+    block_start = np.maximum.accumulate(np.where(new_block, positions, 0), axis=1)
+    first = np.take_along_axis(starts, block_start, axis=1)
+    return (first + positions - block_start) % n_obs
+
+
+def _bootstrap_batch(values, n_boot, mean_block, quantiles, seed_seq):
+    """Statistics (mean, median, quantiles) of one batch of replicates."""
+    rng = np.random.default_rng(seed_seq)
+    idx = stationary_bootstrap_indices(rng, len(values), n_boot, mean_block)
+    samples = values[idx]
+    return np.column_stack(
+        [
+            samples.mean(axis=1),
+            np.quantile(samples, [0.5, *quantiles], axis=1).T,
+        ]
+    )
+
+
+def _statistic_names(quantiles):
+    return ["mean", "50%"] + [f"{q:.0%}" for q in quantiles]
+
+
+def bootstrap_confidence_intervals(
+    df,
+    columns,
+    windows=None,
+    n_boot=BOOTSTRAP_REPLICATES,
+    mean_block=None,
+    quantiles=BOOTSTRAP_QUANTILES,
+    alpha=0.05,
+    seed=0,
+    n_jobs=None,
+    batch_size=BOOTSTRAP_BATCH_SIZE,
+):
+    """
+    Bootstraps the mean, median and `quantiles` of each spread column.
+
+    Parameters:
+    - df (DataFrame): Spreads indexed by date
+    - columns (list): Columns to bootstrap, e.g. ["SPX_arb_spread", "NDX_arb_spread"]
+    - windows (dict): Window name -> (start, end) label slice, as in summary_tables.
+      Defaults to the full sample.
+    - n_boot (int): Number of replicates per series
+    - mean_block (float): Mean block length. Defaults to n_obs ** (1/3).
+    - quantiles (tuple): Quantiles bootstrapped in addition to the mean and median
+    - alpha (float): Two-sided significance level of the percentile intervals
+    - seed (int): Seed of the SeedSequence from which every batch seed is spawned
+    - n_jobs (int): Worker processes. Defaults to the number of CPUs, at most
+      BOOTSTRAP_MAX_WORKERS; 1 runs serially.
+    - batch_size (int): Replicates per task
+
+    Returns:
+    - Tidy DataFrame with columns window, series, statistic, estimate, ci_lower,
+      ci_upper, n_obs, mean_block and n_boot.
+    """
+    if windows is None:
+        windows = {"full": (None, None)}
+    if n_jobs is None:
+        n_jobs = min(BOOTSTRAP_MAX_WORKERS, os.cpu_count() or 1)
+    batches = [batch_size] * (n_boot // batch_size)
+    if n_boot % batch_size:
+        batches.append(n_boot % batch_size)
+
+    tasks = []
+    for window, (start, end) in windows.items():
+        for col in columns:
+            values = df.loc[start:end, col].dropna().to_numpy(dtype=np.float64)
+            block = mean_block or max(1.0, len(values) ** (1 / 3))
+            tasks.append((window, col, values, block))
+
+    # Seeds are assigned by task position, so an empty window does not shift the others
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks) * len(batches))
+    jobs = [
+        (values, size, block, quantiles, seeds[i * len(batches) + j])
+        for i, (_, _, values, block) in enumerate(tasks)
+        if len(values)
+        for j, size in enumerate(batches)
+    ]
+    # Spawned workers (Windows, macOS) look up the batch function by module name,
+    # which fails for `__main__`, so a module run as a script computes in-process
+    if n_jobs > 1 and jobs and _bootstrap_batch.__module__ != "__main__":
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(_bootstrap_batch, *zip(*jobs)))
+    else:
+        results = [_bootstrap_batch(*job) for job in jobs]
+
+    names = _statistic_names(quantiles)
+    results = iter(results)
+    rows = []
+    for window, col, values, block in tasks:
+        if len(values):
+            replicates = np.vstack([next(results) for _ in batches])
+            estimates = [values.mean(), *np.quantile(values, [0.5, *quantiles])]
+            lower, upper = np.quantile(replicates, [alpha / 2, 1 - alpha / 2], axis=0)
+        else:
+            # No observations in the window: NaN statistics with n_obs 0
+            estimates = lower = upper = [np.nan] * len(names)
+        for k, name in enumerate(names):
+            rows.append(
+                {
+                    "window": window,
+                    "series": col,
+                    "statistic": name,
+                    "estimate": estimates[k],
+                    "ci_lower": lower[k],
+                    "ci_upper": upper[k],
+                    "n_obs": len(values),
+                    "mean_block": block,
+                    "n_boot": n_boot,
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    # The imported module, unlike `__main__`, can be pickled into the worker processes
+    from spread_bootstrap import bootstrap_confidence_intervals
+
+    repl_end = datetime(2021, 2, 28).date()
+    inputs = {
+        "calendar_spread_df.parquet": (
+            ["SPX_arb_spread", "NDX_arb_spread", "DJI_arb_spread"],
+            {"full_update": (None, None), "full_replication": (None, repl_end)},
+        ),
+        "total_df.parquet": (
+            ["SPX_Spread", "NDX_Spread", "INDU_Spread"],
+            {
+                "proxy_update": (None, None),
+                "proxy_replication": (config("START_DATE").date(), repl_end),
+            },
+        ),
+    }
+    tables = []
+    for file_name, (columns, windows) in inputs.items():
+        path = OUTPUT_DIR / file_name
+        if not path.exists():
+            print(f"Skipping {file_name}: not found in {OUTPUT_DIR}")
+            continue
+        df = arrow_cache.load_frame(path, columns=columns)
+        df.index = pd.to_datetime(df.index)
+        tables.append(bootstrap_confidence_intervals(df, columns, windows))
+    if tables:
+        pd.concat(tables, ignore_index=True).to_csv(
+            OUTPUT_DIR / "bootstrap_ci.csv", index=False
+        )
+    else:
+        print("No spread outputs to bootstrap, bootstrap_ci.csv not written")
@@ -0,0 +1,149 @@
+"""
+Declared output schema for the calendar-spread results (`calendar_spread_df.parquet`).
+
+The in-memory `merged_df` carries float64 columns for every intermediate step plus
+object-dtype contract strings. On output we keep only the columns listed in the schema,
+store prices, dividends, rates and spreads as float32, days to maturity as int16 and the
+contract strings as an ordered categorical (small integer codes) shared by all contract
+columns. `validate_compact_frame` checks that the compaction keeps the spreads within
+`SPREAD_TOLERANCE_BPS` of the float64 results.
+"""
+
+import numpy as np
+import pandas as pd
+
+SPREAD_INDICES = ("SPX", "NDX", "DJI")
+
+# Storage dtype of every per-index column kept in the output. "{idx}" is replaced by
+# each index name. Columns that are not listed (e.g. `*_exp_tau1_comp`,
+# `*_implied_forward_raw`, `*_OIS_bps`, `*_daily_div`) are transient and dropped.
+INDEX_COLUMN_SCHEMA = {
+    "{idx}_Spot": "float32",
+    "{idx}_Div": "float32",
+    "{idx}_F1": "float32",
+    "{idx}_F2": "float32",
+    "{idx}_Contract": "contract",
+    "{idx}_Contract2": "contract",
+    "{idx}_TTM1": "int16",
+    "{idx}_TTM2": "int16",
+    "{idx}_exp_tau1": "float32",
+    "{idx}_exp_tau2": "float32",
+    "{idx}_annualized_forward_bps": "float32",
+    "{idx}_arb_spread": "float32",
+}
+
+# Columns shared by all indices
+SHARED_COLUMN_SCHEMA = {"OIS_3M": "float32"}
+
+# Maximum absolute difference (in basis points) allowed between the float64 spreads
+# and the ones stored in the compact output
+SPREAD_TOLERANCE_BPS = 0.01
+
+_MONTHS = [
+    "JAN",
+    "FEB",
+    "MAR",
+    "APR",
+    "MAY",
+    "JUN",
+    "JUL",
+    "AUG",
+    "SEP",
+    "OCT",
+    "NOV",
+    "DEC",
+]
+
+
+def calendar_spread_schema(
+    indices=SPREAD_INDICES, shared_schema=SHARED_COLUMN_SCHEMA
+) -> dict:
+    """Expands the per-index schema into a column -> dtype mapping."""
+    schema = dict(shared_schema)
+    for idx in indices:
+        for pattern, dtype in INDEX_COLUMN_SCHEMA.items():
+            schema[pattern.format(idx=idx)] = dtype
+    return schema
+
+
+def _contract_sort_key(contract_str):
+    """Sort contract strings such as "MAR 10" or "DEC2023" chronologically."""
+    contract_str = str(contract_str).strip().upper()
+    month = contract_str[:3]
+    year = contract_str[3:].replace(" ", "")
+    if month not in _MONTHS or not year.isdigit():
+        return (9999, 99, contract_str)
+    year = int(year) if len(year) == 4 else int("20" + year)
+    return (year, _MONTHS.index(month) + 1, contract_str)
+
+
+def contract_dtype(df: pd.DataFrame, columns: list) -> pd.CategoricalDtype:
+    """
+    Builds one ordered categorical dtype for all contract columns, so that the codes
+    are comparable across the near and deferred contract of every index.
+    """
+    values = pd.unique(pd.concat([df[col] for col in columns]).dropna())
+    return pd.CategoricalDtype(sorted(values, key=_contract_sort_key), ordered=True)
+
+
+def to_compact_schema(df: pd.DataFrame, schema: dict = None) -> pd.DataFrame:
+    """
+    Returns a new DataFrame with only the schema columns, cast to their storage dtype.
+
+    Raises:
+    - KeyError if a schema column is missing from `df`.
+    """
+    if schema is None:
+        schema = calendar_spread_schema()
+    missing = [col for col in schema if col not in df.columns]
+    if missing:
+        raise KeyError(f"Columns missing for the output schema: {missing}")
+
+    contract_cols = [col for col, dtype in schema.items() if dtype == "contract"]
+    dtypes = {col: dtype for col, dtype in schema.items() if dtype != "contract"}
+    if contract_cols:
+        contracts = contract_dtype(df, contract_cols)
+        dtypes.update({col: contracts for col in contract_cols})
+
+    return df[list(schema)].astype(dtypes)
+
+
+def validate_compact_frame(
+    original: pd.DataFrame,
+    compact: pd.DataFrame,
+    columns: list = None,
+    tolerance_bps: float = SPREAD_TOLERANCE_BPS,
+) -> float:
+    """
+    Checks that the compact frame reproduces the float64 spreads to within
+    `tolerance_bps` and that no observation was gained or lost.
+
+    Returns:
+    - The largest absolute error (in bps) across the checked columns.
+
+    Raises:
+    - ValueError if the error exceeds the tolerance or missing values do not line up.
+    """
+    if columns is None:
+        columns = [
+            col
+            for col in compact.columns
+            if col.endswith("_arb_spread") or col.endswith("_annualized_forward_bps")
+        ]
+    if not original.index.equals(compact.index):
+        raise ValueError("Compact frame index does not match the original index")
+
+    max_error = 0.0
+    for col in columns:
+        expected = original[col].to_numpy(dtype=np.float64)
+        stored = compact[col].to_numpy(dtype=np.float64)
+        if not np.array_equal(np.isnan(expected), np.isnan(stored)):
+            raise ValueError(f"Missing values in {col} changed in the compact frame")
+        error = np.nanmax(np.abs(expected - stored), initial=0.0)
+        if error >= tolerance_bps:
+            raise ValueError(
+                f"{col} differs by {error:.6f} bps from the float64 result "
+                f"(tolerance {tolerance_bps} bps)"
+            )
+        max_error = max(max_error, error)
+    return max_error
@@ -0,0 +1,167 @@
+"""
+Parameter sweep over the outlier rule and the rate curve of the calendar spread.
+
+The outlier rule (centered rolling window, MAD threshold) and the rate used for
+compounding and as the benchmark are fixed in the calendar-spread scripts. `run_spread_sweep`
+evaluates every combination of
+
+- `rates`: "OIS_3M" (flat 3M OIS for both legs, as in `compute_calendar_spread_OIS3M.py`)
+  or "OIS_INTERP" (OIS curve interpolated at each leg's maturity, as in
+  `compute_calendar_spread_OIS_INTERP.py`),
+- `windows`: rolling windows, either offsets such as "45D" or a number of rows,
+- `thresholds`: MAD multiples at or above which an observation is an outlier,
+
+while loading the data, computing TTM and dividends only once. The spreads are computed
+once per rate, the rolling median and MAD once per (rate, window), and all thresholds
+are applied at once by broadcasting the deviation ratio against the threshold grid.
+
+The result is a tidy table with one row per (rate, window, threshold, index) holding
+the summary statistics of the cleaned spread, computed like section 8 of the scripts
+on the dates where the spread of every index survives the filter.
+"""
+
+import numpy as np
+import pandas as pd
+
+from calendar_spread import (
+    INDEX_TICKERS,
+    OIS_TENORS,
+    RATE_VARIANTS,
+    leg_rates,
+    load_bloomberg_data,
+    prepare_base_inputs,
+)
+from normalize_bloomberg import normalize_raw
+from spread_kernels import KERNEL_OUTPUTS, forward_spread
+
+SWEEP_STATISTICS = [
+    "count",
+    "outliers",
+    "mean",
+    "std",
+    "min",
+    "25%",
+    "50%",
+    "75%",
+    "max",
+]
+
+
+def prepare_sweep_inputs(source, indices=INDEX_TICKERS) -> pd.DataFrame:
+    """
+    Runs the stages shared by every configuration: load, rename, TTM and perfect
+    foresight dividends, keeping all OIS tenors.
+    """
+    if isinstance(source, pd.DataFrame):
+        df = normalize_raw(source)
+    else:
+        df = load_bloomberg_data(source)
+    return prepare_base_inputs(df, indices, ois_columns=tuple(OIS_TENORS))
+
+
+def rate_spreads(base_df, rate, indices=INDEX_TICKERS) -> pd.DataFrame:
+    """
+    Computes the unfiltered arbitrage spread (bps) of every index for one rate variant.
+
+    With "OIS_INTERP" the nearby dividends are compounded at the OIS rate interpolated at
+    TTM1, the deferred dividends at the rate interpolated at TTM2, and the benchmark is
+    the TTM1 rate.
+    """
+    if rate not in RATE_VARIANTS:
+        raise ValueError(f"Unknown rate variant: {rate}")
+    buffer = np.empty((len(KERNEL_OUTPUTS), len(base_df)), dtype=np.float64)
+    spreads = {}
+    for idx in indices:
+        rate1, rate2 = leg_rates(base_df, idx, rate)
+        out = forward_spread(
+            base_df[f"{idx}_F1"],
+            base_df[f"{idx}_F2"],
+            base_df[f"{idx}_exp_tau1"],
+            base_df[f"{idx}_exp_tau2"],
+            base_df[f"{idx}_TTM1"],
+            base_df[f"{idx}_TTM2"],
+            rate1,
+            rate2,
+            out=buffer,
+        )
+        spreads[idx] = out[KERNEL_OUTPUTS.index("arb_spread")].copy()
+    return pd.DataFrame(spreads, index=base_df.index)
+
+
+def outlier_ratio(spread: pd.Series, window) -> np.ndarray:
+    """
+    Deviation from the centered rolling median in units of the centered rolling mean
+    absolute deviation. An observation is an outlier when the ratio is >= threshold.
+    """
+    rolling_median = spread.rolling(window=window, center=True, min_periods=1).median()
+    abs_dev = (spread - rolling_median).abs()
+    rolling_mad = abs_dev.rolling(window=window, center=True, min_periods=1).mean()
+    return (abs_dev / rolling_mad).to_numpy()
+
+
+def _summarise(filtered: np.ndarray, outliers: np.ndarray) -> np.ndarray:
+    """Column-wise statistics of a (n_obs, n_thresholds) array with NaN for dropped rows."""
+    count = np.sum(~np.isnan(filtered), axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nanmean(filtered, axis=0)
+        std = np.nanstd(filtered, axis=0, ddof=1)
+        quantiles = np.nanpercentile(filtered, [0, 25, 50, 75, 100], axis=0)
+    return np.vstack([count, outliers, mean, std, quantiles]).T
+
+
+def run_spread_sweep(
+    source=None,
+    windows=("45D",),
+    thresholds=(5,),
+    rates=("OIS_3M",),
+    indices=INDEX_TICKERS,
+    base_df=None,
+) -> pd.DataFrame:
+    """
+    Evaluates every (rate, window, threshold) configuration of the calendar spread.
+
+    Parameters:
+    - source (Path or DataFrame): Raw Bloomberg data, used when `base_df` is not given
+    - windows (list): Rolling windows, e.g. ["30D", "45D", "60D"] or [45]
+    - thresholds (list): MAD thresholds, e.g. [3, 5, 10]
+    - rates (list): Rate variants, see RATE_VARIANTS
+    - indices (dict): Index name -> Bloomberg tickers
+    - base_df (DataFrame): Output of `prepare_sweep_inputs`, to share it between sweeps
+
+    Returns:
+    - DataFrame with columns rate, window, threshold, index and SWEEP_STATISTICS.
+    """
+    if base_df is None:
+        base_df = prepare_sweep_inputs(source, indices)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+
+    results = []
+    for rate in rates:
+        spreads = rate_spreads(base_df, rate, indices)
+        valid = spreads.notna().to_numpy()
+        for window in windows:
+            # (n_obs, n_thresholds) outlier masks, one per index
+            masks = {}
+            for i, idx in enumerate(indices):
+                ratio = outlier_ratio(spreads[idx], window)
+                masks[idx] = ratio[:, None] >= thresholds[None, :]
+            # Section 8: keep dates where the spread of every index survives the filter
+            keep = np.logical_and.reduce(
+                [valid[:, i, None] & ~masks[idx] for i, idx in enumerate(indices)]
+            )
+            for i, idx in enumerate(indices):
+                values = spreads[idx].to_numpy()[:, None]
+                filtered = np.where(keep, values, np.nan)
+                outliers = np.sum(masks[idx] & valid[:, i, None], axis=0)
+                stats = pd.DataFrame(
+                    _summarise(filtered, outliers), columns=SWEEP_STATISTICS
+                )
+                stats.insert(0, "index", idx)
+                stats.insert(0, "threshold", thresholds)
+                stats.insert(0, "window", window)
+                stats.insert(0, "rate", rate)
+                results.append(stats)
+
+    table = pd.concat(results, ignore_index=True)
+    table[["count", "outliers"]] = table[["count", "outliers"]].astype(int)
+    return table
@@ -0,0 +1,138 @@
+"""
+Summary statistics tables for the arbitrage spread series.
+
+The `describe()` statistics for every reporting window (e.g. the full sample and the
+replication window ending at `repl_end`) are computed in one grouped pass and written
+straight to LaTeX, Markdown and CSV, so the tables can be `\\input` into the report
+and diffed between runs without rendering any figures.
+"""
+
+from pathlib import Path
+
+import pandas as pd
+
+SUMMARY_FORMATS = ("tex", "md", "csv")
+
+
+def describe_windows(df: pd.DataFrame, columns: list, windows: dict) -> dict:
+    """
+    Computes the `describe()` statistics of `columns` for several date windows at once.
+
+    Parameters:
+    - df (DataFrame): Data indexed by date
+    - columns (list): Columns to summarise
+    - windows (dict): Window name -> (start, end) label slice. Use None for an open end.
+
+    Returns:
+    - dict of window name -> DataFrame laid out like `df[columns].describe()`. A window
+      without observations (e.g. outside the data range) gets a count of 0 and NaN
+      statistics.
+    """
+    stacked = pd.concat(
+        {name: df.loc[start:end, columns] for name, (start, end) in windows.items()},
+        names=["window"],
+    )
+    desc = stacked.groupby(level="window", sort=False).describe()
+
+    tables = {}
+    present = desc.index
+    for name in windows:
+        if name not in present:
+            tables[name] = df[columns].iloc[:0].astype(float).describe()
+            continue
+        table = desc.loc[name].unstack(level=0)
+        tables[name] = table.reindex(columns=columns)
+    return tables
+
+
+def _latex_escape(text) -> str:
+    return (
+        str(text)
+        .replace("\\", r"\textbackslash{}")
+        .replace("_", r"\_")
+        .replace("%", r"\%")
+        .replace("&", r"\&")
+    )
+
+
+def to_latex_tabular(table: pd.DataFrame, float_format: str = "{:.2f}") -> str:
+    """Renders a summary table as a plain LaTeX `tabular` (no extra packages required)."""
+    lines = [
+        r"\begin{tabular}{l" + "r" * len(table.columns) + "}",
+        r"\hline",
+        " & ".join([""] + [_latex_escape(c) for c in table.columns]) + r" \\",
+        r"\hline",
+    ]
+    for label, row in table.iterrows():
+        cells = [_latex_escape(label)] + [float_format.format(v) for v in row]
+        lines.append(" & ".join(cells) + r" \\")
+    lines += [r"\hline", r"\end{tabular}", ""]
+    return "\n".join(lines)
+
+
+def to_markdown_table(table: pd.DataFrame, float_format: str = "{:.2f}") -> str:
+    """Renders a summary table as a GitHub-flavoured Markdown table."""
+    lines = [
+        "| " + " | ".join([""] + [str(c) for c in table.columns]) + " |",
+        "|" + "---|" + "--:|" * len(table.columns),
+    ]
+    for label, row in table.iterrows():
+        cells = [str(label)] + [float_format.format(v) for v in row]
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines) + "\n"
+
+
+def write_summary_table(
+    table: pd.DataFrame, path_stem, formats=SUMMARY_FORMATS, float_format="{:.2f}"
+) -> list:
+    """
+    Writes a summary table next to `path_stem` in each of the requested formats,
+    e.g. `_output/table_full_update.tex`, `.md` and `.csv`.
+
+    Returns:
+    - list of the written paths.
+    """
+    path_stem = Path(path_stem)
+    path_stem.parent.mkdir(parents=True, exist_ok=True)
+    written = []
+    for fmt in formats:
+        path = path_stem.with_suffix(f".{fmt}")
+        if fmt == "tex":
+            path.write_text(to_latex_tabular(table, float_format), encoding="utf-8")
+        elif fmt == "md":
+            path.write_text(to_markdown_table(table, float_format), encoding="utf-8")
+        elif fmt == "csv":
+            table.to_csv(path)
+        else:
+            raise ValueError(f"Unknown summary table format: {fmt}")
+        written.append(path)
+    return written
+
+
+def write_summary_tables(
+    df: pd.DataFrame,
+    columns: list,
+    windows: dict,
+    output_dir,
+    prefix: str = "table",
+    formats=SUMMARY_FORMATS,
+) -> dict:
+    """
+    Computes the summary statistics for all `windows` in one pass and writes each one to
+    `output_dir / f"{prefix}_{window}.{fmt}"`.
+
+    Example
+    -------
+    ```
+    write_summary_tables(
+        merged_df,
+        ["SPX_arb_spread", "NDX_arb_spread", "DJI_arb_spread"],
+        {"full_update": (None, None), "full_replication": (None, repl_end)},
+        OUTPUT_DIR,
+    )
+    ```
+    """
+    tables = describe_windows(df, columns, windows)
+    for name, table in tables.items():
+        write_summary_table(table, Path(output_dir) / f"{prefix}_{name}", formats)
+    return tables
@@ -0,0 +1,244 @@
+"""
+Synthetic Bloomberg-like market data for scale testing the spread pipeline.
+
+`generate_bloomberg_data` emits a DataFrame with the same (ticker, field) MultiIndex
+layout as `bloomberg_historical_data.parquet` (see `pull_bloomberg_xbbg.py`):
+
+- spot indices with PX_LAST, IDX_EST_DVD_YLD and INDX_GROSS_DAILY_DIV,
+- generic futures ("ES1 Index" ... "ES4 Index") with PX_LAST, PX_VOLUME, OPEN_INT and
+  CURRENT_CONTRACT_MONTH_YR, rolling quarterly the day after the third-Friday expiry,
+- the USSO* CMPN Curncy OIS curve (PX_LAST in percent).
+
+The first three indices are SPX/ES, NDX/NQ and INDU/DM; further ones get synthetic
+tickers (see `synthetic_index_tickers`). The history length and bar frequency are
+configurable ("B" for daily closes as in the real pull, or intraday frequencies such as
+"30min" over the 09:30-16:00 session).
+
+Futures are priced off the simulated spot, OIS and dividends with the cost-of-carry
+relation used by the calendar-spread scripts plus a mean-reverting arbitrage spread
+(`spread_bps`) and rounded to 0.25 ticks. Rare transitory price jumps exercise the
+outlier filter.
+"""
+
+import numpy as np
+import pandas as pd
+
+from settings import config
+
+DATA_DIR = config("DATA_DIR")
+
+SPOT_FIELDS = ["PX_LAST", "IDX_EST_DVD_YLD", "INDX_GROSS_DAILY_DIV"]
+FUTURES_FIELDS = ["PX_LAST", "PX_VOLUME", "OPEN_INT", "CURRENT_CONTRACT_MONTH_YR"]
+
+# (name, spot ticker, futures root, starting level, dividend yield) of the real indices
+BASE_INDICES = [
+    ("SPX", "SPX Index", "ES", 1115.0, 0.019),
+    ("NDX", "NDX Index", "NQ", 1860.0, 0.009),
+    ("DJI", "INDU Index", "DM", 10580.0, 0.025),
+]
+
+# OIS tickers of the Bloomberg pull and their tenor in days
+OIS_TENOR_DAYS = {
+    "USSO1Z CMPN Curncy": 7,
+    "USSOA CMPN Curncy": 30,
+    "USSOB CMPN Curncy": 60,
+    "USSOC CMPN Curncy": 90,
+    "USSOF CMPN Curncy": 180,
+    "USSO1 CMPN Curncy": 360,
+    "USSO2 CMPN Curncy": 720,
+    "USSO3 CMPN Curncy": 1080,
+    "USSO4 CMPN Curncy": 1440,
+    "USSO5 CMPN Curncy": 1800,
+    "USSO7 CMPN Curncy": 2520,
+    "USSO10 CMPN Curncy": 3600,
+    "USSO15 CMPN Curncy": 5400,
+    "USSO20 CMPN Curncy": 7200,
+    "USSO30 CMPN Curncy": 10800,
+}
+
+MONTH_CODES = ["MAR", "JUN", "SEP", "DEC"]
+TRADING_DAYS = 252
+SESSION = ("09:30", "16:00")
+
+
+def _index_specs(n_indices):
+    """(name, spot ticker, futures root, starting level, dividend yield) per index."""
+    specs = list(BASE_INDICES[:n_indices])
+    for k in range(len(specs), n_indices):
+        root = chr(ord("A") + k // 26) + chr(ord("A") + k % 26)
+        specs.append((f"SYN{k}", f"SYN{k} Index", root, 1000.0 * (1 + k % 5), 0.015))
+    return specs
+
+
+def synthetic_index_tickers(n_indices=3):
+    """
+    Index name -> tickers mapping of the synthetic data, in the layout of
+    `calendar_spread.INDEX_TICKERS`.
+
+    >>> synthetic_index_tickers(4)["SYN3"]
+    {'spot': 'SYN3 Index', 'near': 'AD1 Index', 'deferred': 'AD2 Index'}
+    """
+    return {
+        name: {"spot": spot, "near": f"{root}1 Index", "deferred": f"{root}2 Index"}
+        for name, spot, root, _, _ in _index_specs(n_indices)
+    }
+
+
+def _bar_times(start, end, freq):
+    """Weekday bar timestamps; intraday frequencies are restricted to the session."""
+    times = pd.date_range(start, end, freq=freq)
+    times = times[times.dayofweek < 5]
+    if (times.normalize() != times).any():
+        times = times[
+            (times.time >= pd.Timestamp(SESSION[0]).time())
+            & (times.time <= pd.Timestamp(SESSION[1]).time())
+        ]
+    return times
+
+
+def quarterly_expiries(start_year, end_year):
+    """Third Friday of every March, June, September and December."""
+    months = pd.date_range(f"{start_year}-03-01", f"{end_year}-12-01", freq="QS-MAR")
+    # First Friday on or after the 1st, plus two weeks
+    first_friday = months + pd.to_timedelta((4 - months.dayofweek) % 7, unit="D")
+    return first_friday + pd.Timedelta(days=14)
+
+
+def _ou_path(rng, n, start, mean, speed, vol, dt):
+    """
+    Discretised Ornstein-Uhlenbeck path x[i] = mean + (1 - speed * dt) * (x[i-1] - mean)
+    + shock, computed with an exponentially weighted mean instead of a Python loop.
+    The path starts at x[0] = start.
+    """
+    alpha = speed * dt
+    shocks = rng.standard_normal(n) * vol * np.sqrt(dt)
+    # The mean is taken over shocks / alpha, so this makes the first deviation start - mean
+    shocks[0] = (start - mean) * alpha
+    deviation = pd.Series(shocks / alpha).ewm(alpha=alpha, adjust=False).mean()
+    return mean + deviation.to_numpy()
+
+
+def generate_bloomberg_data(
+    n_indices=3,
+    start="2010-01-01",
+    end="2023-12-31",
+    freq="B",
+    n_generics=4,
+    spread_bps=40.0,
+    missing_rate=0.01,
+    jump_rate=0.002,
+    seed=0,
+):
+    """
+    Generates a synthetic raw Bloomberg pull.
+
+    Parameters:
+    - n_indices (int): Number of spot indices (each with its own futures strip)
+    - start, end: History covered
+    - freq (str): Bar frequency, e.g. "B" (daily, like the real pull) or "30min"
+    - n_generics (int): Generic futures per index (ES1 ... ESn)
+    - spread_bps (float): Mean of the simulated arbitrage spread, in bps
+    - missing_rate (float): Share of bars where the futures fields are missing
+    - jump_rate (float): Share of futures prices hit by a transitory jump
+    - seed (int): Seed of the random generator
+
+    Returns:
+    - DataFrame with (ticker, field) MultiIndex columns. Daily data is indexed by
+      `datetime.date` like the real pull; intraday data by timestamps.
+    """
+    rng = np.random.default_rng(seed)
+    times = _bar_times(start, end, freq)
+    n = len(times)
+    days = times.normalize()
+    new_day = np.r_[True, days[1:] != days[:-1]]
+    bars_per_day = n / max(new_day.sum(), 1)
+    dt = 1 / (TRADING_DAYS * bars_per_day)
+    year_frac = (times - times[0]).total_seconds().to_numpy() / (365 * 86400)
+
+    # --- OIS curve: mean-reverting short rate plus a slowly moving term slope ---
+    short = np.maximum(_ou_path(rng, n, 0.002, 0.02, 0.3, 0.01, dt), 0.0005)
+    slope = _ou_path(rng, n, 0.005, 0.005, 0.5, 0.01, dt)
+    ois = {}
+    for ticker, tenor in OIS_TENOR_DAYS.items():
+        rate = short + slope * (1 - np.exp(-tenor / 720))
+        ois[(ticker, "PX_LAST")] = np.round(np.maximum(rate, 0) * 100, 5)
+    ois_3m = ois[("USSOC CMPN Curncy", "PX_LAST")] / 100
+
+    # --- Futures calendar shared by all indices ---
+    expiries = quarterly_expiries(times[0].year, times[-1].year + n_generics // 4 + 1)
+    front = np.searchsorted(expiries.to_numpy(), days.to_numpy(), side="left")
+    # Two-digit years like the real pull ("MAR 10"), four digits before 2000
+    two_digit = times[0].year >= 2000 and expiries[-1].year < 2100
+    labels = np.array(
+        [
+            f"{MONTH_CODES[(e.month - 3) // 3]} "
+            + (f"{e.year % 100:02d}" if two_digit else str(e.year))
+            for e in expiries
+        ]
+    )
+    # Bar position of the last bar on or before each expiry (for realised dividends)
+    expiry_bar = np.searchsorted(days.to_numpy(), expiries.to_numpy(), side="right") - 1
+    missing = rng.random(n) < missing_rate
+
+    common = rng.standard_normal(n)
+    spot_data, futures_data = {}, {}
+    for _, spot_ticker, root, level, div_yield in _index_specs(n_indices):
+        # --- Spot and dividends ---
+        returns = (0.07 - 0.5 * 0.18**2) * dt + 0.18 * np.sqrt(dt) * (
+            0.8 * common + 0.6 * rng.standard_normal(n)
+        )
+        spot = level * np.exp(np.cumsum(returns))
+        pays = new_day & (rng.random(n) > 0.12)
+        dividend = np.where(
+            pays, spot * div_yield / TRADING_DAYS / 0.88 * rng.gamma(2, 0.5, n), 0.0
+        )
+        cum_div = np.cumsum(dividend)
+        window = int(TRADING_DAYS * bars_per_day)
+        trailing = cum_div - np.r_[np.zeros(window), cum_div[:-window]][:n]
+        trailing_yield = trailing / spot * 100 / np.minimum(1, year_frac + dt)
+        spot_data[(spot_ticker, "PX_LAST")] = np.round(spot, 2)
+        spot_data[(spot_ticker, "IDX_EST_DVD_YLD")] = np.round(trailing_yield, 4)
+        spot_data[(spot_ticker, "INDX_GROSS_DAILY_DIV")] = np.round(dividend, 6)
+
+        # --- Futures: cost of carry at OIS_3M plus the arbitrage spread ---
+        spread = _ou_path(rng, n, spread_bps, spread_bps, 2.0, 60.0, dt) / 10000
+        for generic in range(1, n_generics + 1):
+            contract = front + generic - 1
+            ttm = (expiries[contract] - times).total_seconds().to_numpy() / 86400
+            last_bar = expiry_bar[contract]
+            realised = cum_div[np.minimum(last_bar, n - 1)] - cum_div
+            beyond = np.maximum(0.0, ttm - (times[-1] - times).days.to_numpy())
+            dividends = realised + spot * div_yield * beyond / 365
+            price = spot * (1 + (ois_3m + spread) * ttm / 360) - dividends * (
+                1 + ois_3m * ttm / 720
+            )
+            jumps = rng.random(n) < jump_rate
+            price *= 1 + jumps * rng.choice([-1, 1], n) * 0.01
+            scale = 10.0 ** (1 - generic)
+            volume = np.round(1.5e6 * scale * rng.lognormal(0, 0.3, n))
+            open_int = np.round(2.5e6 * scale * rng.lognormal(0, 0.1, n))
+
+            ticker = f"{root}{generic} Index"
+            futures_data[(ticker, "PX_LAST")] = np.where(
+                missing, np.nan, np.round(price * 4) / 4
+            )
+            futures_data[(ticker, "PX_VOLUME")] = np.where(missing, np.nan, volume)
+            futures_data[(ticker, "OPEN_INT")] = np.where(missing, np.nan, open_int)
+            futures_data[(ticker, "CURRENT_CONTRACT_MONTH_YR")] = np.where(
+                missing, None, labels[contract]
+            )
+
+    index = pd.Index(times.date) if (times == days).all() else times
+    df = pd.DataFrame({**spot_data, **futures_data, **ois}, index=index)
+    df.columns = pd.MultiIndex.from_tuples(df.columns)
+    return df
+
+
+if __name__ == "__main__":
+    # Ten times the history of the real pull (daily) and one year of 30 minute bars
+    generate_bloomberg_data(start="1884-01-01", end="2023-12-31").to_parquet(
+        DATA_DIR / "synthetic_bloomberg_daily.parquet"
+    )
+    generate_bloomberg_data(
+        start="2023-01-01", end="2023-12-31", freq="30min"
+    ).to_parquet(DATA_DIR / "synthetic_bloomberg_30min.parquet")
@@ -0,0 +1,374 @@
+"""
+Performance regression benchmarks for the hot paths of the spread pipeline.
+
+The benchmarks use pytest-benchmark and fixed synthetic inputs (see
+`synthetic_bloomberg.py`) at several sizes, so they need neither WRDS nor earlier
+pipeline outputs. They are marked `benchmark` and deselected by the default `pytest`
+run (see `pyproject.toml`).
+
+Record a baseline (stored under `.benchmarks/`):
+
+    pytest src/test_benchmarks.py -m benchmark --benchmark-autosave
+
+Compare against the latest baseline. The run fails when a benchmark regresses beyond
+the `benchmark_compare_fail` tolerance in pyproject.toml (mean time 15% slower, see
+`conftest.py`), or a tolerance given with `--benchmark-compare-fail`:
+
+    pytest src/test_benchmarks.py -m benchmark --benchmark-compare
+
+The stage instrumentation and profiling are turned off for the benchmarks (see
+`conftest.py`), so an `@instrumented` function is timed without their overhead.
+
+Only the benchmarked modules are imported. `pull_optionm_api_data` reads
+WRDS_USERNAME on import, so it is imported by its one benchmark and the expiration
+dates of the inputs are computed here.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pytest
+from decouple import UndefinedValueError
+
+import calendar_spread
+import clean_bloomberg as clean_bbg
+import downsampling
+import misc_tools
+import normalize_bloomberg
+import spread_sweep
+import synthetic_bloomberg
+
+pytestmark = pytest.mark.benchmark
+
+# Years of daily history of the synthetic Bloomberg pull (the real pull has 14)
+HISTORY_YEARS = [1, 4, 14]
+# Rows of the synthetic inputs of the array/groupby benchmarks
+ROWS = [1_000, 10_000, 100_000]
+
+
+@lru_cache(maxsize=None)
+def bloomberg_data(years):
+    return synthetic_bloomberg.generate_bloomberg_data(
+        start=f"{2024 - years}-01-01", end="2023-12-31", seed=0
+    )
+
+
+@lru_cache(maxsize=None)
+def prepared_data(years):
+    df = normalize_bloomberg.normalize_raw(bloomberg_data(years))
+    merged_df = calendar_spread.prepare_merged_df(
+        df, ois_columns=tuple(calendar_spread.OIS_TENORS)
+    )
+    merged_df = calendar_spread.add_time_to_maturity(merged_df)
+    return calendar_spread.add_expected_dividends(merged_df)
+
+
+def third_fridays(start, end, months):
+    """
+    Third Friday of each of `months` from `start` to `end`, i.e.
+    `pull_optionm_api_data.get_expiration_dates` without its holiday adjustment.
+    """
+    fridays = pd.date_range(start, end, freq="WOM-3FRI")
+    return fridays[fridays.month.isin(months)].tolist()
+
+
+@lru_cache(maxsize=None)
+def expiration_ranges(years):
+    expiration_dates = third_fridays(
+        f"{2023 - years}-01-01", "2024-12-31", [3, 6, 9, 12]
+    )
+    return [
+        (start.date(), end.date())
+        for start, end in zip(expiration_dates, expiration_dates[1:])
+    ]
+
+
+@lru_cache(maxsize=None)
+def weighted_frame(rows):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {
+            "group": rng.integers(0, rows // 100, rows),
+            "rate": rng.normal(2, 0.5, rows),
+            "amount": rng.uniform(0, 1000, rows),
+        }
+    )
+
+
+@lru_cache(maxsize=None)
+def cusips_8_digit(rows):
+    rng = np.random.default_rng(0)
+    characters = np.array(list(misc_tools._alphabet[:36]))
+    return pd.Series(["".join(c) for c in rng.choice(characters, (rows, 8))])
+
+
+@lru_cache(maxsize=None)
+def sparse_panel(rows):
+    """Monthly panel where each id is observed in about 5% of the months."""
+    rng = np.random.default_rng(0)
+    months = pd.date_range("2000-01-01", periods=240, freq="MS")
+    ids = rng.integers(0, rows // 12, rows)
+    dates = months[rng.integers(0, len(months), rows)]
+    df = pd.DataFrame({"id": ids, "date": dates, "value": rng.normal(size=rows)})
+    return df.drop_duplicates(["id", "date"]).reset_index(drop=True)
+
+
+@lru_cache(maxsize=None)
+def implied_dividend_frame(years):
+    """OptionMetrics-like implied dividend yields: one row per date and expiration."""
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range(f"{2024 - years}-01-01", "2023-12-31")
+    expirations = third_fridays(
+        f"{2024 - years}-01-01", "2025-12-31", list(range(1, 13))
+    )
+    rows = []
+    for date in dates:
+        upcoming = [e for e in expirations if e >= date][:8]
+        for expiration in upcoming:
+            rows.append((date.date(), expiration.date(), rng.uniform(1, 3)))
+    return pd.DataFrame(rows, columns=["date", "expiration", "rate"])
+
+
+# =============================================================================
+# Bloomberg cleaning
+# =============================================================================
+@pytest.mark.parametrize("years", [1, 4])
+def test_bench_get_clean_df(benchmark, years):
+    df_raw = bloomberg_data(years)
+    date_ranges = expiration_ranges(years)
+    spx = ["ES1 Index", "ES2 Index", "ES3 Index"]
+    pairs = list(zip(spx, spx[1:]))
+    result = benchmark.pedantic(
+        clean_bbg.get_clean_df, args=(df_raw, date_ranges, pairs), rounds=3
+    )
+    assert len(result) > 0
+
+
+@pytest.mark.parametrize("years", HISTORY_YEARS)
+def test_bench_adjacent_dates_and_roll_over(benchmark, years):
+    dates = bloomberg_data(years).index
+    date_ranges = expiration_ranges(years)
+
+    def run():
+        return [
+            clean_bbg.roll_over(
+                d, clean_bbg.get_adjacent_dates(d, date_ranges), date_ranges, 0
+            )
+            for d in dates
+        ]
+
+    assert len(benchmark(run)) == len(dates)
+
+
+# =============================================================================
+# Calendar-spread stages
+# =============================================================================
+@pytest.mark.parametrize("years", HISTORY_YEARS)
+def test_bench_contract_to_maturity(benchmark, years):
+    contracts = bloomberg_data(years)[("ES1 Index", "CURRENT_CONTRACT_MONTH_YR")]
+    contracts = contracts.dropna().tolist()
+    result = benchmark(
+        lambda: [calendar_spread.contract_to_maturity(c) for c in contracts]
+    )
+    assert len(result) == len(contracts)
+
+
+@pytest.mark.parametrize("years", HISTORY_YEARS)
+def test_bench_add_time_to_maturity(benchmark, years):
+    df = normalize_bloomberg.normalize_raw(bloomberg_data(years))
+    merged_df = calendar_spread.prepare_merged_df(df)
+    result = benchmark(calendar_spread.add_time_to_maturity, merged_df)
+    assert "SPX_TTM2" in result.columns
+
+
+@pytest.mark.parametrize("years", HISTORY_YEARS)
+def test_bench_compute_expected_dividend(benchmark, years):
+    merged_df = prepared_data(years)
+    result = benchmark(
+        calendar_spread.compute_expected_dividend,
+        merged_df,
+        div_col="SPX_Div",
+        contract_col="SPX_Contract",
+    )
+    assert len(result[0]) == len(merged_df)
+
+
+@pytest.mark.parametrize("years", HISTORY_YEARS)
+def test_bench_interpolate_ois(benchmark, years):
+    merged_df = prepared_data(years)
+    result = benchmark(
+        calendar_spread.interpolate_ois_rates, merged_df["SPX_TTM2"], merged_df
+    )
+    assert len(result) == len(merged_df)
+
+
+@pytest.mark.parametrize("years", HISTORY_YEARS)
+def test_bench_forward_spreads(benchmark, years):
+    merged_df = prepared_data(years)
+    result = benchmark(calendar_spread.add_forward_spreads, merged_df)
+    assert "DJI_arb_spread" in result.columns
+
+
+@pytest.mark.parametrize("years", HISTORY_YEARS)
+def test_bench_remove_spread_outliers(benchmark, years):
+    spreads = calendar_spread.add_forward_spreads(prepared_data(years))
+    result = benchmark(calendar_spread.remove_spread_outliers, spreads)
+    assert len(result) == len(spreads)
+
+
+@pytest.mark.parametrize("window", ["45D", 45])
+@pytest.mark.parametrize("years", HISTORY_YEARS)
+def test_bench_outlier_ratio(benchmark, years, window):
+    """Rolling median/MAD filter with offset (calendar spread) and row windows (proxy)."""
+    spread = calendar_spread.add_forward_spreads(prepared_data(years))["SPX_arb_spread"]
+    result = benchmark(spread_sweep.outlier_ratio, spread, window)
+    assert len(result) == len(spread)
+
+
+@pytest.mark.parametrize("years", HISTORY_YEARS)
+def test_bench_filter_index_implied_dividend_yield(benchmark, years):
+    try:
+        import pull_optionm_api_data as pull_optionm
+    except (ImportError, UndefinedValueError) as error:
+        pytest.skip(f"pull_optionm_api_data needs wrds and WRDS_USERNAME: {error}")
+    df = implied_dividend_frame(years)
+    result = benchmark(
+        pull_optionm.filter_index_implied_dividend_yield,
+        df,
+        start_date=f"{2024 - years}-01-01",
+        end_date="2023-12-31",
+    )
+    assert len(result) > 0
+
+
+# =============================================================================
+# misc_tools weighted statistics
+# =============================================================================
+@pytest.mark.parametrize("rows", ROWS)
+def test_bench_groupby_weighted_average(benchmark, rows):
+    df = weighted_frame(rows)
+    result = benchmark(
+        misc_tools.groupby_weighted_average,
+        data_col="rate",
+        weight_col="amount",
+        by_col="group",
+        data=df,
+    )
+    assert len(result) == df["group"].nunique()
+
+
+@pytest.mark.parametrize("rows", ROWS)
+def test_bench_groupby_weighted_std(benchmark, rows):
+    df = weighted_frame(rows)
+    result = benchmark(
+        misc_tools.groupby_weighted_std,
+        data_col="rate",
+        weight_col="amount",
+        by_col="group",
+        data=df,
+    )
+    assert len(result) == df["group"].nunique()
+
+
+@pytest.mark.parametrize("rows", ROWS)
+def test_bench_groupby_weighted_moments(benchmark, rows):
+    df = weighted_frame(rows)
+    result = benchmark(
+        misc_tools.groupby_weighted_moments,
+        data_cols=["rate", "amount"],
+        weight_col="amount",
+        by_col="group",
+        data=df,
+    )
+    assert len(result) == df["group"].nunique()
+
+
+@pytest.mark.parametrize("rows", ROWS)
+def test_bench_weighted_quantile(benchmark, rows):
+    df = weighted_frame(rows)
+    result = benchmark(
+        misc_tools.weighted_quantile,
+        df["rate"],
+        [0.25, 0.5, 0.75],
+        sample_weight=df["amount"],
+    )
+    assert len(result) == 3
+
+
+@pytest.mark.parametrize("rows", ROWS)
+def test_bench_groupby_weighted_quantile(benchmark, rows):
+    df = weighted_frame(rows)
+    result = benchmark(
+        misc_tools.groupby_weighted_quantile,
+        "rate",
+        [0.25, 0.5, 0.75],
+        "amount",
+        "group",
+        df,
+    )
+    assert len(result) == df["group"].nunique()
+
+
+@pytest.mark.parametrize("rows", ROWS)
+def test_bench_convert_cusips_from_8_to_9_digit(benchmark, rows):
+    cusips = cusips_8_digit(rows)
+    result = benchmark(misc_tools.convert_cusips_from_8_to_9_digit, cusips)
+    assert result.str.len().eq(9).all()
+
+
+@pytest.mark.parametrize("rows", ROWS)
+def test_bench_leave_one_out_means(benchmark, rows):
+    df = weighted_frame(rows)
+    result = benchmark(
+        misc_tools.leave_one_out_means,
+        df,
+        groupby="group",
+        averaged_col=["rate", "amount"],
+    )
+    assert result.shape == (rows, 2)
+
+
+@pytest.mark.parametrize("rows", ROWS)
+def test_bench_with_lagged_columns(benchmark, rows):
+    df = sparse_panel(rows)
+    result = benchmark(
+        misc_tools.with_lagged_columns,
+        df=df,
+        column_to_lag="value",
+        id_column="id",
+        lags=[1, 12],
+        freq="MS",
+    )
+    assert "L12_value" in result.columns
+
+
+@pytest.mark.parametrize("rows", ROWS)
+def test_bench_quarter_and_month_ends(benchmark, rows):
+    dates = pd.date_range("1990-01-01", periods=rows, freq="7h")
+
+    def run():
+        return (
+            misc_tools.get_most_recent_quarter_ends(dates),
+            misc_tools.get_ends_of_current_month(dates),
+        )
+
+    quarter_ends, month_ends = benchmark(run)
+    assert len(quarter_ends) == len(month_ends) == rows
+
+
+@pytest.mark.parametrize("rows", [10_000, 100_000, 1_000_000])
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_bench_downsample(benchmark, rows, method):
+    index = pd.date_range("2000-01-01", periods=rows, freq="min")
+    rng = np.random.default_rng(0)
+    series = pd.Series(rng.normal(size=rows).cumsum(), index=index)
+    reduced = benchmark(downsampling.downsample, series, 2_000, method)
+    assert len(reduced) <= 2_000
+
+
+@pytest.mark.parametrize("years", HISTORY_YEARS)
+def test_bench_normalize_raw(benchmark, years):
+    df = bloomberg_data(years)
+    result = benchmark(normalize_bloomberg.normalize_raw, df)
+    assert isinstance(result.index, pd.DatetimeIndex)
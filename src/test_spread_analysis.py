@@ -1,12 +1,32 @@
 import glob
 import os
+import time
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
+import pytest
 from dateutil.relativedelta import relativedelta
 
+import arrow_cache
+import calendar_spread
 import clean_bloomberg as clean_bbg
+import downsampling
+import excel_cache
+import frame_diff
+import instrumentation
+import misc_tools
+import normalize_bloomberg
+import pandas_to_latex
+import profiling
 import pull_optionm_api_data as pull_optionm
+import results_store
+import spread_kernels
+import spread_bootstrap
+import spread_schema
+import spread_sweep
+import summary_tables
+import synthetic_bloomberg
 from settings import config
 
 DATA_DIR = config("DATA_DIR")
@@ -118,14 +138,25 @@ def test_filter_index_implied_dividend_yield():
     )
 
 
+def latest_spreads(method):
+    """
+    Spreads of the latest `method` run in the results store, one column per index.
+    Skips the test when the pipeline has not registered such a run yet."""
+    df = results_store.query(method=method, variable="spread")
+    if df.empty:
+        pytest.skip(
+            f"No {method!r} run in {results_store.RESULTS_DB}; run the pipeline first"
+        )
+    return df.pivot(index="date", columns="index_name", values="value")
+
+
 def test_SF_spread_correlation():
-    expected = pd.read_excel(MANUAL_DATA_DIR / "spread.xlsx")
-    check = pd.read_parquet(OUTPUT_DIR / "total_df.parquet")
+    expected = excel_cache.read_excel_cached(MANUAL_DATA_DIR / "spread.xlsx")
+    check = latest_spreads("proxy")
     expected.set_index("date", inplace=True)
-    expected.index = [expected.index[i].date() for i in range(len(expected.index))]
-    ndx = pd.concat([expected["Eq_SF_NDAQ"], check["NDX_Spread"]], axis=1, join="inner")
-    spx = pd.concat([expected["Eq_SF_SPX"], check["SPX_Spread"]], axis=1, join="inner")
-    djx = pd.concat([expected["Eq_SF_Dow"], check["INDU_Spread"]], axis=1, join="inner")
+    ndx = pd.concat([expected["Eq_SF_NDAQ"], check["NDX"]], axis=1, join="inner")
+    spx = pd.concat([expected["Eq_SF_SPX"], check["SPX"]], axis=1, join="inner")
+    djx = pd.concat([expected["Eq_SF_Dow"], check["DJI"]], axis=1, join="inner")
 
     assert ndx.corr().iloc[0, 1] > 0
     assert spx.corr().iloc[0, 1] > 0
@@ -146,6 +177,25 @@ def test_latex_report():
     )
 
 
+def test_latex_report_incremental(tmp_path):
+    """
+    The report is only rewritten when its content changes, and missing outputs are skipped."""
+    tex_file = tmp_path / "graph_document.tex"
+    latex_code, _ = pandas_to_latex.build_report()
+    assert pandas_to_latex.write_if_changed(tex_file, latex_code)
+    mtime = tex_file.stat().st_mtime_ns
+    assert not pandas_to_latex.write_if_changed(tex_file, latex_code)
+    assert tex_file.stat().st_mtime_ns == mtime
+
+    sections = [
+        ("Figures", [("figure", tmp_path / "missing.pdf", "Missing", "fig:missing")])
+    ]
+    results, missing = pandas_to_latex.build_results_section(sections)
+    assert results == ""
+    assert missing == [tmp_path / "missing.pdf"]
+    assert pandas_to_latex.report_dependencies(sections) == [tmp_path / "missing.pdf"]
+
+
 def test_spread_correlation(threshold=0.8):
     """
     Compare the computed arbitrage spreads in 'merged_df' with expected values from 'spread.xlsx'.
@@ -153,17 +203,14 @@ def test_spread_correlation(threshold=0.8):
     """
 
     # Load expected spread values from Excel
-    expected = pd.read_excel(MANUAL_DATA_DIR / "spread.xlsx")
+    expected = excel_cache.read_excel_cached(MANUAL_DATA_DIR / "spread.xlsx")
 
-    # Load computed spreads from merged_df saved in a parquet file
-    check = pd.read_parquet(f"{OUTPUT_DIR}/calendar_spread_df.parquet")
+    # Query the computed spreads of the latest calendar spread run from the warehouse
+    check = latest_spreads("full")
 
     # Convert 'date' column in expected data to datetime
     expected["date"] = pd.to_datetime(expected["date"])
 
-    # Ensure the index in merged_df (check) is in datetime format
-    check.index = pd.to_datetime(check.index)
-
     # Filter merged_df to match only dates available in spread.xlsx
     check = check[check.index.isin(expected["date"])]
 
@@ -171,15 +218,9 @@ def test_spread_correlation(threshold=0.8):
     expected.set_index("date", inplace=True)
 
     # Merge expected vs. computed spreads for correlation check
-    ndx = pd.concat(
-        [expected["Eq_SF_NDAQ"], check["NDX_arb_spread"]], axis=1, join="inner"
-    )
-    spx = pd.concat(
-        [expected["Eq_SF_SPX"], check["SPX_arb_spread"]], axis=1, join="inner"
-    )
-    djx = pd.concat(
-        [expected["Eq_SF_Dow"], check["DJI_arb_spread"]], axis=1, join="inner"
-    )
+    ndx = pd.concat([expected["Eq_SF_NDAQ"], check["NDX"]], axis=1, join="inner")
+    spx = pd.concat([expected["Eq_SF_SPX"], check["SPX"]], axis=1, join="inner")
+    djx = pd.concat([expected["Eq_SF_Dow"], check["DJI"]], axis=1, join="inner")
 
     # Compute correlation for each index
     ndx_corr = ndx.corr().iloc[0, 1]
@@ -196,3 +237,717 @@ def test_spread_correlation(threshold=0.8):
     assert ndx_corr > threshold, f"NDX spread correlation too low: {ndx_corr:.2f}"
     assert spx_corr > threshold, f"SPX spread correlation too low: {spx_corr:.2f}"
     assert djx_corr > threshold, f"DJX spread correlation too low: {djx_corr:.2f}"
+
+
+def test_summary_tables(tmp_path):
+    """
+    Check that the one-pass window statistics match `describe()` on each window
+    and that every requested format is written."""
+    index = pd.date_range("2020-01-01", periods=100, freq="D")
+    df = pd.DataFrame(
+        {"SPX_arb_spread": range(100), "NDX_arb_spread": range(100, 200)}, index=index
+    )
+    columns = ["SPX_arb_spread", "NDX_arb_spread"]
+    repl_end = datetime(2020, 2, 15).date()
+    tables = summary_tables.write_summary_tables(
+        df,
+        columns,
+        {"full_update": (None, None), "full_replication": (None, repl_end)},
+        tmp_path,
+    )
+
+    pd.testing.assert_frame_equal(tables["full_update"], df[columns].describe())
+    pd.testing.assert_frame_equal(
+        tables["full_replication"], df.loc[:repl_end, columns].describe()
+    )
+    for name in ["full_update", "full_replication"]:
+        for fmt in summary_tables.SUMMARY_FORMATS:
+            assert (tmp_path / f"table_{name}.{fmt}").exists()
+    assert r"SPX\_arb\_spread" in (tmp_path / "table_full_update.tex").read_text()
+
+    # A window outside the data range gives a count of 0 and NaN statistics
+    empty = summary_tables.describe_windows(
+        df, columns, {"full_update": (None, None), "future": ("2030-01-01", None)}
+    )["future"]
+    assert list(empty.columns) == columns
+    assert (empty.loc["count"] == 0).all() and empty.drop("count").isna().all().all()
+
+
+def test_compact_spread_schema():
+    """
+    The compact output keeps the schema columns only, uses the compact dtypes and
+    keeps the spreads within the tolerance; a spread error above it is rejected."""
+    index = pd.date_range("2020-01-01", periods=4, freq="D")
+    schema = spread_schema.calendar_spread_schema(indices=["SPX"])
+    df = pd.DataFrame({col: np.linspace(1, 100, 4) for col in schema}, index=index)
+    df["SPX_Contract"] = ["DEC 19", "DEC 19", "MAR 20", "MAR 20"]
+    df["SPX_Contract2"] = ["MAR 20", "MAR 20", "JUN 20", "JUN 20"]
+    df["SPX_arb_spread"] = [12.3456789, -4.5678901, 150.123456, 33.3333333]
+    df["SPX_exp_tau1_comp"] = 1.0
+
+    compact = spread_schema.to_compact_schema(df, schema)
+    assert "SPX_exp_tau1_comp" not in compact.columns
+    assert compact["SPX_arb_spread"].dtype == np.float32
+    assert compact["SPX_TTM1"].dtype == np.int16
+    assert list(compact["SPX_Contract"].cat.categories) == [
+        "DEC 19",
+        "MAR 20",
+        "JUN 20",
+    ]
+    assert spread_schema.validate_compact_frame(df, compact) < 0.01
+
+    compact["SPX_arb_spread"] += np.float32(0.02)
+    with pytest.raises(ValueError):
+        spread_schema.validate_compact_frame(df, compact)
+
+
+def test_calendar_spread_backends():
+    """The polars lazy backend reproduces the pandas calendar spreads."""
+    file_path = MANUAL_DATA_DIR / "bloomberg_historical_data.parquet"
+    pandas_df = calendar_spread.compute_calendar_spread(file_path, backend="pandas")
+    polars_df = calendar_spread.compute_calendar_spread(file_path, backend="polars")
+
+    assert list(polars_df.columns) == list(pandas_df.columns)
+    assert polars_df.index.equals(pandas_df.index)
+    numeric = pandas_df.select_dtypes("number").columns
+    np.testing.assert_allclose(
+        polars_df[numeric].to_numpy(dtype=float),
+        pandas_df[numeric].to_numpy(dtype=float),
+        rtol=1e-9,
+        atol=1e-9,
+    )
+    contracts = [col for col in pandas_df.columns if "_Contract" in col]
+    assert (polars_df[contracts] == pandas_df[contracts]).all().all()
+
+
+def test_forward_spread_kernel():
+    """The in-place NumPy kernel matches the element-wise loop used by Numba."""
+    rng = np.random.default_rng(0)
+    n = 50
+    ttm1 = rng.integers(1, 90, n).astype(float)
+    args = [
+        rng.uniform(3000, 4000, n),
+        rng.uniform(3000, 4000, n),
+        rng.uniform(0, 20, n),
+        rng.uniform(20, 40, n),
+        ttm1,
+        ttm1 + 91,
+        rng.uniform(0, 0.05, n),
+        rng.uniform(0, 0.05, n),
+    ]
+    expected = spread_kernels._forward_spread_loop(*args, np.empty((5, n)))
+    result = spread_kernels.forward_spread(*args, use_numba=False)
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_spread_sweep_matches_pipeline():
+    """The default sweep configuration reproduces the calendar-spread statistics."""
+    file_path = MANUAL_DATA_DIR / "bloomberg_historical_data.parquet"
+    expected = calendar_spread.compute_calendar_spread(file_path, backend="pandas")
+    table = spread_sweep.run_spread_sweep(
+        file_path, windows=["45D"], thresholds=[3, 5], rates=spread_sweep.RATE_VARIANTS
+    )
+    assert len(table) == 2 * 2 * 3
+
+    default = table[(table["rate"] == "OIS_3M") & (table["threshold"] == 5)]
+    for _, row in default.iterrows():
+        desc = expected[f"{row['index']}_arb_spread"].describe()
+        assert row["count"] == desc["count"]
+        np.testing.assert_allclose(
+            row[["mean", "std", "min", "50%", "max"]].to_numpy(dtype=float),
+            desc[["mean", "std", "min", "50%", "max"]].to_numpy(dtype=float),
+        )
+
+
+def test_rate_variants_share_inputs():
+    """Rate variants run the shared stages once and the OIS_3M one matches the pipeline."""
+    file_path = MANUAL_DATA_DIR / "bloomberg_historical_data.parquet"
+    expected = calendar_spread.compute_calendar_spread(file_path, backend="pandas")
+    instrumentation.start_stage_report()
+    variants = calendar_spread.compute_rate_variants(file_path)
+    stages = [record["stage"] for record in instrumentation.stage_records()]
+    instrumentation.reset_stages()
+    assert stages.count("time_to_maturity") == 1
+    assert stages.count("forwards") == len(calendar_spread.RATE_VARIANTS)
+
+    pd.testing.assert_frame_equal(variants["OIS_3M"][expected.columns], expected)
+    interp = variants["OIS_INTERP"]
+    np.testing.assert_allclose(
+        interp["SPX_OIS_bps"], interp["SPX_OIS1"] * 10000, rtol=0, atol=1e-9
+    )
+    assert not interp["SPX_OIS1"].equals(interp["OIS_3M"])
+
+
+def test_block_bootstrap_reproducible(monkeypatch):
+    """Bootstrap intervals depend only on the seed and bracket the point estimates."""
+    rng = np.random.default_rng(1)
+    index = pd.date_range("2015-01-01", periods=500, freq="B")
+    df = pd.DataFrame({"SPX_arb_spread": 40 + rng.normal(0, 5, 500).cumsum() / 10})
+    df.index = index
+
+    kwargs = dict(n_boot=300, batch_size=100, seed=7)
+    serial = spread_bootstrap.bootstrap_confidence_intervals(
+        df, ["SPX_arb_spread"], n_jobs=1, **kwargs
+    )
+    parallel = spread_bootstrap.bootstrap_confidence_intervals(
+        df, ["SPX_arb_spread"], n_jobs=2, **kwargs
+    )
+    pd.testing.assert_frame_equal(serial, parallel)
+
+    # Run as a script, the batches are computed in-process instead of in a pool
+    monkeypatch.setattr(spread_bootstrap._bootstrap_batch, "__module__", "__main__")
+    monkeypatch.setattr(spread_bootstrap, "ProcessPoolExecutor", None)
+    as_script = spread_bootstrap.bootstrap_confidence_intervals(
+        df, ["SPX_arb_spread"], n_jobs=2, **kwargs
+    )
+    pd.testing.assert_frame_equal(serial, as_script)
+    monkeypatch.undo()
+
+    assert list(serial["statistic"]) == ["mean", "50%", "25%", "75%"]
+    assert (serial["ci_lower"] <= serial["estimate"]).all()
+    assert (serial["estimate"] <= serial["ci_upper"]).all()
+
+    # An empty window gives NaN rows and leaves the other window's intervals unchanged
+    windows = {"full": (None, None), "empty": ("2030-01-01", None)}
+    with_empty = spread_bootstrap.bootstrap_confidence_intervals(
+        df, ["SPX_arb_spread"], windows=windows, n_jobs=1, **kwargs
+    )
+    empty = with_empty[with_empty["window"] == "empty"]
+    assert (empty["n_obs"] == 0).all() and empty["estimate"].isna().all()
+    pd.testing.assert_frame_equal(
+        with_empty[with_empty["window"] == "full"], serial, check_like=True
+    )
+
+
+def test_synthetic_bloomberg_layout():
+    """Synthetic data has the raw pull layout and runs through the spread pipeline."""
+    df_raw = pd.read_parquet(MANUAL_DATA_DIR / "bloomberg_historical_data.parquet")
+    synthetic = synthetic_bloomberg.generate_bloomberg_data(
+        start="2018-01-01", end="2019-12-31"
+    )
+    assert list(synthetic.columns) == list(df_raw.columns)
+    assert synthetic[("ES1 Index", "CURRENT_CONTRACT_MONTH_YR")].iloc[0] == "MAR 18"
+
+    wide = synthetic_bloomberg.generate_bloomberg_data(
+        n_indices=5, start="2018-01-01", end="2019-12-31"
+    )
+    spreads = calendar_spread.compute_calendar_spread(
+        wide, indices=synthetic_bloomberg.synthetic_index_tickers(5), backend="polars"
+    )
+    assert len(spreads) > 400
+    assert spreads.filter(like="_arb_spread").shape[1] == 5
+
+
+def test_synthetic_rate_path():
+    """Mean-reverting paths start at `start` and the short rate is not stuck at its floor."""
+    rng = np.random.default_rng(0)
+    path = synthetic_bloomberg._ou_path(rng, 1000, 0.002, 0.02, 0.3, 0.01, 1 / 252)
+    assert path[0] == pytest.approx(0.002)
+
+    # The 1W rate is the short rate (starting at 0.2%) plus a small share of the slope
+    synthetic = synthetic_bloomberg.generate_bloomberg_data(
+        start="2010-01-01", end="2023-12-31"
+    )
+    ois_1w = synthetic[("USSO1Z CMPN Curncy", "PX_LAST")]
+    assert ois_1w.iloc[0] == pytest.approx(0.2 + 0.5 * (1 - np.exp(-7 / 720)), abs=1e-5)
+    assert ois_1w.std() > 0.1
+
+
+def test_stage_instrumentation(tmp_path, monkeypatch):
+    """Stages are recorded with their nesting and exported as JSON and Chrome trace."""
+    instrumentation.reset_stages()
+    with instrumentation.stage("unreported"):
+        pass
+    assert instrumentation.stage_records() == []
+
+    instrumentation.start_stage_report()
+    with instrumentation.stage("outer"):
+        with instrumentation.stage("inner") as info:
+            info["rows"] = 3
+    records = instrumentation.stage_records()
+    assert [r["stage"] for r in records] == ["inner", "outer"]
+    assert records[0]["parent"] == "outer" and records[0]["rows"] == 3
+    assert all(r["wall_s"] >= 0 and r["rss_mb"] > 0 for r in records)
+
+    json_path, trace_path = instrumentation.write_stage_report(tmp_path / "report")
+    assert json_path.exists()
+    trace = pd.read_json(trace_path, typ="series")["traceEvents"]
+    assert [event["ph"] for event in trace] == ["X", "X"]
+    # Writing the report ends it
+    assert instrumentation.stage_records() == []
+    with instrumentation.stage("after_report"):
+        pass
+    assert instrumentation.stage_records() == []
+
+    instrumentation.check_stage_budgets({"outer": 60}, records)
+    with pytest.raises(RuntimeError, match="inner"):
+        instrumentation.check_stage_budgets({"inner": -1}, records)
+    # The scripts check the budgets of PIPELINE_STAGE_BUDGETS
+    monkeypatch.setattr(instrumentation, "STAGE_BUDGETS", {"outer": -1})
+    with pytest.raises(RuntimeError, match="outer"):
+        instrumentation.check_stage_budgets(records=records)
+
+
+def test_stage_profiling(tmp_path, monkeypatch):
+    """Only the stages listed in PIPELINE_PROFILE write cProfile and collapsed stacks."""
+    monkeypatch.setattr(profiling, "PROFILE_DIR", tmp_path)
+    monkeypatch.setattr(profiling, "PROFILED_STAGES", frozenset())
+    profiling.enable("profiled", interval=0.001)
+
+    with instrumentation.stage("skipped"):
+        sum(range(1000))
+    with instrumentation.stage("profiled"):
+        time.sleep(0.05)
+    files = sorted(path.suffix for path in tmp_path.iterdir() if path.suffix)
+    assert files == [".collapsed", ".prof"]
+    assert (tmp_path / ".gitignore").read_text() == "*\n"
+    collapsed = next(tmp_path.glob("*.collapsed")).read_text()
+    assert "test_stage_profiling" in collapsed
+    instrumentation.reset_stages()
+
+
+def test_calc_check_digit():
+    """CUSIP check digits of listed securities, one at a time and as an array."""
+    cusips = [
+        "037833100",  # Apple
+        "594918104",  # Microsoft
+        "46625H100",  # JPMorgan Chase
+        "38259P508",  # Google
+        "30231G102",  # Exxon Mobil
+        "084670702",  # Berkshire Hathaway B
+        "023135106",  # Amazon
+        "88160R101",  # Tesla
+        "17275R102",  # Cisco
+    ]
+    bases = pd.Series([cusip[:8] for cusip in cusips])
+    assert [misc_tools.calc_check_digit(base) for base in bases] == [
+        cusip[8] for cusip in cusips
+    ]
+    assert misc_tools.calc_check_digit(bases).tolist() == [cusip[8] for cusip in cusips]
+    assert misc_tools.convert_cusips_from_8_to_9_digit(bases).tolist() == cusips
+    with pytest.raises(ValueError):
+        misc_tools.calc_check_digit("0378331a")
+
+
+def test_leave_one_out_transforms():
+    """Leave-one-out sums, counts and means match a loop over the groups."""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "group": rng.integers(0, 40, 400),
+            "sector": rng.choice(["a", "b"], 400),
+            "weight": rng.normal(size=400),
+        }
+    )
+    df.loc[::9, "weight"] = np.nan
+    single = pd.DataFrame({"group": [99], "sector": ["a"], "weight": [1.0]})
+    df = pd.concat([df, single], ignore_index=True)
+    groups = ["group", "sector"]
+
+    means = misc_tools.leave_one_out_means(df, groupby=groups, averaged_col="weight")
+    counts = misc_tools.leave_one_out_counts(df, groupby=groups, counted_col="weight")
+    sums = misc_tools.leave_one_out_sums(df, groupby=groups, summed_col="weight")
+    for _, sub in df.groupby(groups):
+        values = sub["weight"].to_numpy()
+        for position, label in enumerate(sub.index):
+            others = np.delete(values, position)
+            others = others[~np.isnan(others)]
+            expected = others.mean() if len(others) else np.nan
+            np.testing.assert_allclose(means.loc[label], expected, rtol=1e-12)
+            assert counts.loc[label] == len(others)
+    pd.testing.assert_series_equal(
+        sums,
+        df.groupby(groups)["weight"].transform(lambda x: x.sum() - x),
+        check_names=False,
+    )
+
+
+def pivot_lagged_column(df, column, id_column, lag, freq):
+    """The resample path of `with_lagged_columns` as it was built by pivoting."""
+    new_col = f"L{lag}_{column}"
+    wide = df.pivot(index="date", columns=id_column, values=column)
+    lagged = wide.resample(freq).last().shift(lag)
+    lagged = lagged.stack(future_stack=True).reset_index(name=new_col)
+    lagged = df.merge(lagged, on=["date", id_column], how="right")
+    lagged = lagged.dropna(subset=[column, new_col], how="all")
+    return lagged.sort_values(by=[id_column, "date"]).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("freq", ["MS", "ME", "W"])
+def test_with_lagged_columns_resample(freq):
+    """The sorted-merge lag builder matches the pivot/stack result, gaps included."""
+    bins = pd.date_range("2019-12-01", periods=8, freq=freq)
+    df = pd.DataFrame(
+        {
+            "id": ["A"] * 3 + ["B"] * 5,
+            "date": bins[[1, 2, 3, 0, 1, 2, 3, 5]],
+            "value": [1.0, 2.0, 3.0, 12.0, 1.0, 2.0, 3.0, 6.0],
+        }
+    )
+    for lag in [1, 2]:
+        lagged = misc_tools.with_lagged_columns(
+            df=df, column_to_lag="value", id_column="id", lags=lag, freq=freq
+        )
+        expected = pivot_lagged_column(df, "value", "id", lag, freq)
+        pd.testing.assert_frame_equal(lagged, expected, check_dtype=False)
+    # B has no observation in bins[4], so its lag of bins[5] is missing
+    lagged = misc_tools.with_lagged_columns(
+        df=df, column_to_lag="value", id_column="id", lags=1, freq=freq
+    ).set_index(["id", "date"])
+    assert np.isnan(lagged.loc[("B", bins[5]), "L1_value"])
+    assert lagged.loc[("B", bins[4]), "L1_value"] == 3.0
+
+
+def test_groupby_weighted_moments():
+    """The bincount engine matches per-group numpy results and leaves data untouched."""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "group": rng.integers(0, 20, 2000),
+            "rate": rng.normal(2, 0.5, 2000),
+            "amount": rng.uniform(0, 1000, 2000),
+        }
+    )
+    df.loc[::50, "rate"] = np.nan
+    original = df.copy()
+
+    moments = misc_tools.groupby_weighted_moments(
+        ["rate", "amount"], "amount", "group", df, ddof=1
+    )
+    pd.testing.assert_frame_equal(df, original)
+    for group, sub in df.dropna().groupby("group"):
+        mean = np.average(sub["rate"], weights=sub["amount"])
+        n = len(sub)
+        var = np.sum(sub["amount"] * (sub["rate"] - mean) ** 2) / (
+            (n - 1) / n * sub["amount"].sum()
+        )
+        assert moments.loc[group, ("rate", "count")] == n
+        assert np.isclose(moments.loc[group, ("rate", "mean")], mean)
+        assert np.isclose(moments.loc[group, ("rate", "var")], var)
+
+    average = misc_tools.groupby_weighted_average("rate", "amount", "group", df)
+    pd.testing.assert_series_equal(average, moments[("rate", "mean")].rename(None))
+    assert list(df.columns) == ["group", "rate", "amount"]
+
+    # Rows with a missing group key are dropped, as in a pandas groupby
+    df["group"] = df["group"].astype(float)
+    df.loc[::7, "group"] = np.nan
+    moments = misc_tools.groupby_weighted_moments("rate", "amount", "group", df)
+    expected = df.dropna().groupby("group").size()
+    assert moments[("rate", "count")].tolist() == expected.tolist()
+    transformed = misc_tools.groupby_weighted_average(
+        "rate", "amount", "group", df, transform=True
+    )
+    assert transformed[df["group"].isna()].isna().all()
+    assert transformed[df["group"].notna()].notna().all()
+
+
+def test_groupby_weighted_quantile():
+    """Grouped quantiles match weighted_quantile applied to each group."""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "date": rng.integers(0, 30, 3000),
+            "spread": rng.normal(2, 0.5, 3000),
+            "volume": rng.uniform(0, 1000, 3000),
+        }
+    )
+    quantiles = [0, 0.25, 0.5, 0.75, 1]
+    for old_style in [False, True]:
+        grouped = misc_tools.groupby_weighted_quantile(
+            "spread", quantiles, "volume", "date", df, old_style=old_style
+        )
+        for date, sub in df.groupby("date"):
+            expected = misc_tools.weighted_quantile(
+                sub["spread"], quantiles, sub["volume"], old_style=old_style
+            )
+            np.testing.assert_allclose(grouped.loc[date], expected, rtol=1e-9)
+
+    # Rows with a missing group key are dropped
+    df["date"] = df["date"].astype(float)
+    df.loc[::7, "date"] = np.nan
+    grouped = misc_tools.groupby_weighted_quantile("spread", 0.5, "volume", "date", df)
+    assert grouped.index.tolist() == sorted(df["date"].dropna().unique())
+    for date, sub in df.groupby("date"):
+        expected = misc_tools.weighted_quantile(sub["spread"], 0.5, sub["volume"])
+        assert np.isclose(grouped.loc[date], expected)
+
+
+def test_frame_diff(tmp_path):
+    """In-memory and chunked parquet diffs find the same removed, added and changed rows."""
+    old = pd.DataFrame(
+        {"spread": np.arange(100.0), "contract": ["MAR 10"] * 100},
+        index=pd.date_range("2010-01-01", periods=100, name="Date"),
+    )
+    new = old.drop(old.index[:3])
+    new.loc[new.index[10], "spread"] = -1.0
+    new.loc[pd.Timestamp("2011-01-01")] = [1.0, "JUN 10"]
+
+    diff = frame_diff.diff_frames(old, new)
+    assert diff["stats"][["removed", "added", "changed"]].tolist() == [3, 1, 1]
+    assert diff["changed"][("spread", "new")].tolist() == [-1.0]
+
+    old.to_parquet(tmp_path / "old.parquet")
+    new.to_parquet(tmp_path / "new.parquet")
+    chunked = frame_diff.diff_parquet(
+        tmp_path / "old.parquet", tmp_path / "new.parquet", batch_size=7
+    )
+    pd.testing.assert_series_equal(chunked["stats"], diff["stats"])
+    pd.testing.assert_frame_equal(chunked["changed"], diff["changed"])
+
+    # A RangeIndex key continues across the record batches
+    old_rows = pd.DataFrame({"value": np.arange(10.0)}, index=pd.RangeIndex(5, 25, 2))
+    new_rows = old_rows.copy()
+    new_rows.iloc[7, 0] = -1.0
+    old_rows.to_parquet(tmp_path / "old_range.parquet")
+    new_rows.to_parquet(tmp_path / "new_range.parquet")
+    chunked = frame_diff.diff_parquet(
+        tmp_path / "old_range.parquet", tmp_path / "new_range.parquet", batch_size=3
+    )
+    assert chunked["stats"][["removed", "added", "changed"]].tolist() == [0, 0, 1]
+    assert chunked["changed"].index.tolist() == [19]
+
+    # A column stored as floats in the new version still matches its integers
+    new_rows = old_rows.assign(count=np.arange(10.0))
+    old_rows = old_rows.assign(count=np.arange(10))
+    diff = frame_diff.diff_frames(old_rows, new_rows)
+    assert diff["stats"][["removed", "added", "changed"]].tolist() == [0, 0, 0]
+    new_rows.to_parquet(tmp_path / "new_range.parquet")
+    old_rows.to_parquet(tmp_path / "old_range.parquet")
+    chunked = frame_diff.diff_parquet(
+        tmp_path / "old_range.parquet", tmp_path / "new_range.parquet", batch_size=3
+    )
+    pd.testing.assert_series_equal(chunked["stats"], diff["stats"])
+
+    stats = misc_tools.merge_stats(old.reset_index(), new.reset_index(), on=["Date"])
+    assert stats[["intersection", "left", "right"]].tolist() == [97, 100, 98]
+
+    # Integer keys match float keys, as in a merge
+    left = pd.DataFrame({"id": [1, 2, 3], "flag": [True, False, True]})
+    right = pd.DataFrame({"id": [1.0, 2.0, np.nan], "flag": [1.0, 0.0, 1.0]})
+    stats = misc_tools.merge_stats(left, right, on=["id"])
+    assert stats[["intersection", "left", "right"]].tolist() == [2, 3, 3]
+    assert misc_tools.dataframe_set_difference(left, right, show="numbers") == [2]
+    # Distinct integer keys beyond 2**53 stay distinct
+    big = misc_tools.merge_stats(
+        pd.DataFrame({"k": [2**53]}), pd.DataFrame({"k": [2**53 + 1]}), on=["k"]
+    )
+    assert big["intersection"] == 0
+    assert misc_tools.dataframe_set_difference(
+        pd.DataFrame({"k": [2**53 + 1]}), pd.DataFrame({"k": [2**53]}), show="numbers"
+    ) == [0]
+    text = right.assign(id=["1", "2", None])
+    stats = misc_tools.merge_stats(left.astype({"id": str}), text, on=["id"])
+    assert stats["intersection"] == 2
+
+
+def test_date_helpers():
+    """The array and scalar date helpers match period arithmetic on each date."""
+    rng = np.random.default_rng(0)
+    dates = pd.DatetimeIndex(
+        pd.Timestamp("1965-01-01")
+        + pd.to_timedelta(rng.integers(0, 80 * 365 * 24, 500), unit="h")
+    ).append(pd.DatetimeIndex(["2020-02-29 23:59", "2020-03-31", "2020-04-01"]))
+    months = [date.to_period("M") for date in dates]
+    quarters = [date.to_period("Q") for date in dates]
+    helpers = [
+        (
+            misc_tools.get_most_recent_quarter_ends,
+            misc_tools.get_most_recent_quarter_end,
+            [q.start_time - pd.Timedelta(days=1) for q in quarters],
+        ),
+        (
+            misc_tools.get_next_quarter_starts,
+            misc_tools.get_next_quarter_start,
+            [(q + 1).start_time for q in quarters],
+        ),
+        (
+            misc_tools.get_ends_of_current_month,
+            misc_tools.get_end_of_current_month,
+            [m.end_time.normalize() for m in months],
+        ),
+        (
+            misc_tools.get_ends_of_current_quarter,
+            misc_tools.get_end_of_current_quarter,
+            [q.end_time.normalize() for q in quarters],
+        ),
+    ]
+    for array_helper, scalar_helper, expected in helpers:
+        assert array_helper(dates).equals(pd.DatetimeIndex(expected))
+        for date, value in zip(dates[:20], expected):
+            assert pd.Timestamp(scalar_helper(date)) == value
+
+    dates = pd.DatetimeIndex([None, "2021-06-15"])
+    missing = misc_tools.get_ends_of_current_month(dates)
+    assert missing[0] is pd.NaT and missing[1] == pd.Timestamp("2021-06-30")
+
+
+def test_date_helpers_time_zones():
+    """Time-zone aware dates are handled in their wall time and keep their zone."""
+    late = pd.Timestamp("2020-03-31 23:00", tz="US/Eastern")
+    assert misc_tools.get_most_recent_quarter_end(late) == datetime(2019, 12, 31)
+    assert misc_tools.get_next_quarter_start(late) == datetime(2020, 4, 1)
+    assert misc_tools.get_end_of_current_quarter(late) == datetime(2020, 3, 31)
+    assert misc_tools.get_end_of_current_month(late) == pd.Timestamp(
+        "2020-03-31", tz="US/Eastern"
+    )
+
+    dates = pd.DatetimeIndex([late, None])
+    ends = misc_tools.get_ends_of_current_month(dates)
+    assert str(ends.tz) == "US/Eastern"
+    assert ends[0] == pd.Timestamp("2020-03-31", tz="US/Eastern") and ends[1] is pd.NaT
+    # 2020-04-01 12:00 in Tokyo
+    starts = misc_tools.get_next_quarter_starts(dates.tz_convert("Asia/Tokyo"))
+    assert starts[0] == pd.Timestamp("2020-07-01", tz="Asia/Tokyo")
+
+
+def test_downsample():
+    """Downsampled series fit the budget and keep the endpoints and the extremes."""
+    index = pd.date_range("2010-01-01", periods=50_000, freq="min")
+    rng = np.random.default_rng(0)
+    series = pd.Series(rng.normal(size=len(index)).cumsum(), index=index)
+    series.iloc[12_345] = 1_000.0
+
+    for method in ["lttb", "minmax"]:
+        reduced = downsampling.downsample(series, max_points=1_000, method=method)
+        assert len(reduced) <= 1_000
+        assert reduced.index.is_monotonic_increasing
+        assert reduced.index[[0, -1]].equals(series.index[[0, -1]])
+        assert reduced.max() == 1_000.0
+        pd.testing.assert_series_equal(reduced, series.loc[reduced.index])
+    assert downsampling.downsample(series, max_points=0) is series
+
+
+def test_results_store(tmp_path):
+    """Registered outputs can be sliced by index, method and date, latest run first."""
+    db_path = tmp_path / "results.sqlite"
+    dates = pd.date_range("2014-01-01", "2019-12-31", freq="B", name="Date")
+    df = pd.DataFrame(
+        {
+            "OIS_3M": 0.01,
+            "SPX_arb_spread": np.arange(len(dates), dtype=np.float32),
+            "INDU_Spread": np.nan,
+            "SPX_Contract": pd.Categorical(["MAR 14"] * len(dates)),
+        },
+        index=dates,
+    )
+    first = results_store.register_run(df, "full", db_path=db_path, keep=1)
+    df["SPX_arb_spread"] += 1
+    latest = results_store.register_run(df, "full", db_path=db_path, keep=1)
+    assert results_store.runs(db_path)["run_id"].tolist() == [latest]
+
+    spread = results_store.query_spread(
+        "SPX", "full", "2015-01-01", "2018-12-31", db_path=db_path
+    )
+    expected = df.loc["2015":"2018", "SPX_arb_spread"].astype(float)
+    np.testing.assert_array_equal(spread.to_numpy(), expected.to_numpy())
+    assert spread.index.equals(expected.index)
+    by_year = results_store.query_spread("SPX", "full", "2015", "2018", db_path=db_path)
+    pd.testing.assert_series_equal(by_year, spread)
+    to_timestamp = results_store.query_spread(
+        "SPX", "full", end=pd.Timestamp("2018-12-31"), db_path=db_path
+    )
+    assert to_timestamp.index[-1] == pd.Timestamp("2018-12-31")
+
+    stored = results_store.query(db_path=db_path)
+    assert set(stored["index_name"]) == {"ALL", "SPX"}
+    assert results_store.query(run_id=first, db_path=db_path).empty
+
+
+def test_arrow_cache(tmp_path):
+    """The mapped Arrow copy matches the parquet file and is ignored once stale."""
+    parquet_path = tmp_path / "calendar_spread_df.parquet"
+    df = pd.DataFrame(
+        {"SPX_arb_spread": np.arange(3.0), "OIS_3M": np.ones(3)},
+        index=pd.DatetimeIndex(["2010-01-04", "2010-01-05", "2010-01-07"], name="Date"),
+    )
+    df.to_parquet(parquet_path)
+    assert arrow_cache.publish(df, parquet_path).exists()
+    pd.testing.assert_frame_equal(arrow_cache.load_frame(parquet_path), df)
+
+    df["SPX_arb_spread"] *= 2
+    df.to_parquet(parquet_path)
+    stale = arrow_cache.load_frame(parquet_path, columns=["SPX_arb_spread"])
+    pd.testing.assert_frame_equal(stale, df[["SPX_arb_spread"]])
+
+
+def test_excel_cache(tmp_path, monkeypatch):
+    """Sheets read back from their parquet sidecar equal the parsed sheets, cell types included."""
+    monkeypatch.setattr(excel_cache, "EXCEL_CACHE_DIR", tmp_path / "excel_cache")
+    path = tmp_path / "inputs.xlsx"
+    raw = pd.DataFrame(
+        {
+            "Start Date": ["Dates", datetime(2010, 1, 4), datetime(2010, 1, 5), None],
+            datetime(2010, 1, 1): ["PX_LAST", 1.5, 2, "#N/A"],
+            "rate": [0.1, 0.2, np.nan, 0.4],
+        }
+    )
+    raw.to_excel(path, sheet_name="SP", index=False)
+
+    parsed = excel_cache.read_excel_cached(path, "SP")
+    cached = excel_cache.read_excel_cached(path, "SP")
+    assert len(list((tmp_path / "excel_cache").glob("inputs.SP.*.parquet"))) == 1
+    pd.testing.assert_frame_equal(cached, parsed)
+    assert cached.columns.tolist() == parsed.columns.tolist()
+    for column in parsed.columns:
+        assert cached[column].map(type).equals(parsed[column].map(type))
+
+    # Sidecars are keyed on the content: a copy hits them, an edit replaces them
+    sidecar = next((tmp_path / "excel_cache").glob("inputs.SP.*.parquet"))
+    copy = tmp_path / "copy" / "inputs.xlsx"
+    copy.parent.mkdir()
+    copy.write_bytes(path.read_bytes())
+    assert excel_cache._cache_path(copy, "SP", {}) == sidecar
+    raw.iloc[:2].to_excel(path, sheet_name="SP", index=False)
+    edited = excel_cache.read_excel_cached(path, "SP")
+    assert len(edited) == 2
+    sidecars = list((tmp_path / "excel_cache").glob("inputs.SP.*.parquet"))
+    assert len(sidecars) == 1 and sidecars[0] != sidecar
+
+
+def test_normalize_bloomberg(tmp_path, monkeypatch):
+    """The normalised pull is cached and serves the proxy cleaning like the raw pull."""
+    monkeypatch.setattr(normalize_bloomberg, "NORMALIZED_DIR", tmp_path)
+    raw_path = MANUAL_DATA_DIR / "bloomberg_historical_data.parquet"
+    df_raw = pd.read_parquet(raw_path)
+    df = normalize_bloomberg.load_normalized(raw_path, dates="date", fill=False)
+    assert len(list(tmp_path.glob("*.parquet"))) == 1
+    pd.testing.assert_frame_equal(
+        normalize_bloomberg.load_normalized(raw_path, dates="date", fill=False), df
+    )
+    # Keyed on the content, so a copy of the raw file (e.g. a fresh clone) hits it
+    copy_path = tmp_path / "copy" / raw_path.name
+    copy_path.parent.mkdir()
+    copy_path.write_bytes(raw_path.read_bytes())
+    assert normalize_bloomberg._cache_path(copy_path, "date", False) == next(
+        tmp_path.glob("*.parquet")
+    )
+    pd.testing.assert_series_equal(
+        normalize_bloomberg.ticker_fields(df, "SPX Index")["PX_LAST"],
+        df_raw["SPX Index"]["PX_LAST"],
+        check_names=False,
+    )
+
+    date_ranges = [
+        (datetime(2009, 12, 18).date(), datetime(2010, 3, 19).date()),
+        (datetime(2010, 3, 19).date(), datetime(2010, 6, 18).date()),
+    ]
+    pairs = [("ES1 Index", "ES2 Index"), ("ES2 Index", "ES3 Index")]
+    rows = slice(datetime(2010, 1, 1).date(), datetime(2010, 3, 31).date())
+    pd.testing.assert_frame_equal(
+        clean_bbg.get_clean_df(df.loc[rows], date_ranges, pairs),
+        clean_bbg.get_clean_df(df_raw.loc[rows], date_ranges, pairs),
+    )
+
+    contracts = pd.DataFrame(
+        {("ES1 Index", "CURRENT_CONTRACT_MONTH_YR"): ["MAR 10", ".NA."]},
+        index=["2010-01-04", "2010-01-05"],
+    )
+    contracts[("SPX Index", "INDX_GROSS_DAILY_DIV")] = ["1.5", None]
+    normalized = normalize_bloomberg.normalize_raw(contracts)
+    assert normalized["ES1 Index CURRENT_CONTRACT_MONTH_YR"].isna().tolist() == [
+        False,
+        True,
+    ]
+    assert normalized["SPX Index INDX_GROSS_DAILY_DIV"].tolist() == [1.5, 0.0]
+    assert isinstance(normalized.index, pd.DatetimeIndex)